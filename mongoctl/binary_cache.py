@@ -0,0 +1,294 @@
+__author__ = 'abdul'
+
+import os
+import json
+import fcntl
+import time
+import hashlib
+import tempfile
+
+from utils import ensure_dir, COPY_BUFFER_SIZE
+from mongoctl_logging import log_exception, log_verbose, log_warning
+import config
+
+###############################################################################
+# CONSTS
+###############################################################################
+OBJECTS_DIR = "objects"
+
+TMP_DIR = "tmp"
+
+INDEX_FILE = "index.json"
+
+LOCK_FILE = ".lock"
+
+# temp files of writers that have not written for this long are left over
+# by dead processes
+STALE_TMP_SECS = 60 * 60
+
+###############################################################################
+def get_binary_cache():
+    """
+    Returns the configured BinaryCache or None if it is disabled
+    """
+    try:
+        max_size_mb = config.get_binary_cache_max_size_mb()
+        if max_size_mb <= 0:
+            return None
+        return BinaryCache(config.get_binary_cache_dir(),
+                           max_size_mb * 1024 * 1024)
+    except Exception, e:
+        log_warning("Binary cache disabled: %s" % e)
+        return None
+
+###############################################################################
+# BinaryCache
+###############################################################################
+class BinaryCache(object):
+    """
+    Content addressed local store of mongodb archives shared by all installs
+    of a host. Each archive is stored once, as objects/<sha256[:2]>/<sha256>,
+    and index.json maps refs (see binary_repo.get_binary_cache_ref()) to
+    {"sha256", "name"}. Reads touch the object so that the least recently
+    used ones are evicted first once the cache grows over max_size bytes.
+    """
+
+    ###########################################################################
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    ###########################################################################
+    def lookup(self, ref):
+        """
+        Returns (object path, archive name, sha256) of ref or None
+        """
+        entry = self._read_index().get(ref)
+        if not entry:
+            return None
+        path = self._get_object_path(entry["sha256"])
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        log_verbose("Binary cache hit for '%s': %s" % (ref, path))
+        return path, entry["name"], entry["sha256"]
+
+    ###########################################################################
+    def put_file(self, ref, file_path):
+        """
+        Adds a copy of the archive file_path as ref. Returns its sha256
+        """
+        writer = self.new_writer()
+        try:
+            with open(file_path, "rb") as f:
+                while True:
+                    data = f.read(COPY_BUFFER_SIZE)
+                    if not data:
+                        break
+                    writer.write(data)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.commit(ref, os.path.basename(file_path))
+
+    ###########################################################################
+    def move_file(self, ref, file_path):
+        """
+        Moves the archive file_path (e.g. downloaded into get_download_dir())
+        into the cache as ref. Returns its sha256
+        """
+        checksum = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while True:
+                data = f.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                checksum.update(data)
+        sha256 = checksum.hexdigest()
+        self.add(ref, os.path.basename(file_path), file_path, sha256)
+        return sha256
+
+    ###########################################################################
+    def get_download_dir(self):
+        """
+        Returns the dir to download archives into before they are moved into
+        the cache (see move_file()). Partial downloads are kept there to be
+        resumed until they get stale
+        """
+        tmp_dir = os.path.join(self.cache_dir, TMP_DIR)
+        ensure_dir(tmp_dir)
+        return tmp_dir
+
+    ###########################################################################
+    def new_writer(self):
+        """
+        Returns a BinaryCacheWriter to add an archive as it is read from
+        somewhere else (e.g. a download stream)
+        """
+        tmp_dir = os.path.join(self.cache_dir, TMP_DIR)
+        ensure_dir(tmp_dir)
+        return BinaryCacheWriter(self, tmp_dir)
+
+    ###########################################################################
+    def add(self, ref, name, tmp_path, sha256):
+        """
+        Moves the complete archive tmp_path into the store as ref
+        """
+        lock_file = self._lock()
+        try:
+            object_path = self._get_object_path(sha256)
+            if os.path.exists(object_path):
+                os.remove(tmp_path)
+            else:
+                ensure_dir(os.path.dirname(object_path))
+                os.rename(tmp_path, object_path)
+
+            index = self._read_index()
+            index[ref] = {"sha256": sha256, "name": name}
+            self._write_index(index)
+            log_verbose("Added '%s' to binary cache as %s" % (ref, sha256))
+            self._evict(index, keep=sha256)
+        finally:
+            self._unlock(lock_file)
+
+    ###########################################################################
+    def get_size(self):
+        return sum([size for path, size, mtime in self._list_objects()])
+
+    ###########################################################################
+    def _evict(self, index, keep=None):
+        """
+        Removes least recently used objects (but keep) until the cache fits
+        in max_size, and refs to them. Also removes stale temp files. Must be
+        called under the lock
+        """
+        self._sweep_tmp()
+        objects = sorted(self._list_objects(), key=lambda o: o[2])
+        total_size = sum([size for path, size, mtime in objects])
+        removed = []
+        for path, size, mtime in objects:
+            if total_size <= self.max_size:
+                break
+            sha256 = os.path.basename(path)
+            if sha256 == keep:
+                continue
+            log_verbose("Evicting %s from binary cache" % path)
+            os.remove(path)
+            total_size -= size
+            removed.append(sha256)
+
+        if removed:
+            for ref in [r for r, e in index.items()
+                        if e["sha256"] in removed]:
+                del index[ref]
+            self._write_index(index)
+
+    ###########################################################################
+    def _sweep_tmp(self):
+        tmp_dir = os.path.join(self.cache_dir, TMP_DIR)
+        if not os.path.isdir(tmp_dir):
+            return
+        min_mtime = time.time() - STALE_TMP_SECS
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < min_mtime:
+                    log_verbose("Removing stale binary cache temp file %s" %
+                                path)
+                    os.remove(path)
+            except OSError:
+                # finished (or swept) by someone else meanwhile
+                pass
+
+    ###########################################################################
+    def _list_objects(self):
+        objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR)
+        result = []
+        if not os.path.isdir(objects_dir):
+            return result
+        for sub_dir in os.listdir(objects_dir):
+            sub_dir_path = os.path.join(objects_dir, sub_dir)
+            for name in os.listdir(sub_dir_path):
+                path = os.path.join(sub_dir_path, name)
+                stat = os.stat(path)
+                result.append((path, stat.st_size, stat.st_mtime))
+        return result
+
+    ###########################################################################
+    def _get_object_path(self, sha256):
+        return os.path.join(self.cache_dir, OBJECTS_DIR, sha256[:2], sha256)
+
+    ###########################################################################
+    def _read_index(self):
+        """
+        Returns the index. An unreadable (e.g. corrupt) index is treated as
+        empty, i.e. as a cache miss, and gets replaced by the next add()
+        """
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, ValueError), e:
+            log_exception(e)
+            log_warning("Ignoring unreadable binary cache index '%s': %s" %
+                        (path, e))
+            return {}
+
+    ###########################################################################
+    def _write_index(self, index):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = "%s.tmp" % path
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=4)
+        os.rename(tmp_path, path)
+
+    ###########################################################################
+    def _lock(self):
+        ensure_dir(self.cache_dir)
+        lock_file = open(os.path.join(self.cache_dir, LOCK_FILE), "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    ###########################################################################
+    def _unlock(self, lock_file):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+###############################################################################
+# BinaryCacheWriter
+###############################################################################
+class BinaryCacheWriter(object):
+    """
+    Writes an archive to a temp file of the cache while computing its
+    sha256. commit() adds it to the cache, discard() drops it
+    """
+
+    ###########################################################################
+    def __init__(self, cache, tmp_dir):
+        self._cache = cache
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+
+    ###########################################################################
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+
+    ###########################################################################
+    def commit(self, ref, name):
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        self._cache.add(ref, name, self._tmp_path, sha256)
+        return sha256
+
+    ###########################################################################
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -3,11 +3,20 @@ __author__ = 'abdul'
 import platform
 import os
 import sys
-from utils import download_url
+import time
+import threading
+import Queue
+import hashlib
+import binascii
+from utils import parallel_map
+from range_download import (
+    download_url_parallel, get_published_sha256, open_url_stream,
+    RangeStreamReader
+)
 from errors import MongoctlException, FileNotInRepoError
-from mongoctl_logging import log_info, log_verbose
-from prompt import is_interactive_mode
-from boto.s3.connection import S3Connection, Key
+from mongoctl_logging import log_info, log_verbose, log_warning
+from boto.s3.connection import S3Connection, Key, OrdinaryCallingFormat
+from boto.s3.multipart import MultiPartUpload
 from mongodb_version import make_version_info, MongoDBEdition
 import config
 import urllib
@@ -15,6 +24,23 @@ import urllib
 VERSION_2_6_1 = make_version_info("2.6.1")
 VERSION_3_0 = make_version_info("3.0.0")
 
+# max secs to wait for repositories to answer whether they have a file
+REPO_PROBE_TIMEOUT = 30
+
+# s3 files are transferred in parts of this size, this many at a time
+DEFAULT_S3_PART_SIZE_MB = 16
+
+DEFAULT_S3_TRANSFER_WORKERS = 8
+
+# smallest part size s3 accepts (but for the last part)
+MIN_S3_PART_SIZE_MB = 5
+
+# metadata recording the part size of multipart uploads so that downloads
+# can verify their "<md5>-<number of parts>" ETag
+S3_PART_SIZE_META = "part-size"
+
+S3_READ_BLOCK_SIZE = 256 * 1024
+
 ###############################################################################
 # MongoDBBinaryRepository
 ###############################################################################
@@ -74,15 +100,35 @@ class MongoDBBinaryRepository(object):
                    (url, response.getcode(), mongodb_version))
             raise MongoctlException(msg)
 
-        return download_url(url, destination,
-                            show_errors=not is_interactive_mode())
+        return download_url_parallel(url, destination)
+
 
+    ###########################################################################
+    def open_file_stream(self, mongodb_version, mongodb_edition):
+        """
+        Returns a file-like object to read the archive from as it downloads
+        (with parallel range requests if the server supports them)
+        """
+        url = self.get_download_url(mongodb_version, mongodb_edition)
+        if not url:
+            raise FileNotInRepoError("File not found in repo")
+        log_info("Streaming %s..." % url)
+        return open_url_stream(url)
+
+    ###########################################################################
+    def get_file_sha256(self, mongodb_version, mongodb_edition):
+        """
+        Returns the published SHA-256 of the archive, if any
+        """
+        url = self.get_download_url(mongodb_version, mongodb_edition)
+        return url and get_published_sha256(url)
 
     ###########################################################################
     def file_exists(self, mongodb_version, mongodb_edition):
         url = self.get_download_url(mongodb_version, mongodb_edition)
         if url:
             response = urllib.urlopen(url)
+            response.close()
             return response.code == 200
         else:
             return False
@@ -191,6 +237,11 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
         self._bucket_name = None
         self._access_key = None
         self._secret_key = None
+        self._host = None
+        self._port = None
+        self._is_secure = True
+        self._part_size = DEFAULT_S3_PART_SIZE_MB * 1024 * 1024
+        self._transfer_workers = DEFAULT_S3_TRANSFER_WORKERS
 
         self._bucket = None
 
@@ -208,8 +259,7 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
     def bucket(self):
 
         if not self._bucket:
-            conn = S3Connection(self.access_key, self.secret_key)
-            self._bucket = conn.get_bucket(self.bucket_name)
+            self._bucket = self._connect().get_bucket(self.bucket_name)
 
         return self._bucket
 
@@ -238,6 +288,51 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
     def secret_key(self, val):
         self._secret_key = val
 
+    ###########################################################################
+    @property
+    def host(self):
+        return self._host
+
+    @host.setter
+    def host(self, val):
+        self._host = val
+
+    ###########################################################################
+    @property
+    def port(self):
+        return self._port
+
+    @port.setter
+    def port(self, val):
+        self._port = val
+
+    ###########################################################################
+    @property
+    def is_secure(self):
+        return self._is_secure
+
+    @is_secure.setter
+    def is_secure(self, val):
+        self._is_secure = val
+
+    ###########################################################################
+    @property
+    def part_size(self):
+        return self._part_size
+
+    @part_size.setter
+    def part_size(self, val):
+        self._part_size = val
+
+    ###########################################################################
+    @property
+    def transfer_workers(self):
+        return self._transfer_workers
+
+    @transfer_workers.setter
+    def transfer_workers(self, val):
+        self._transfer_workers = val
+
     ###########################################################################
     def download_file(self, mongodb_version, mongodb_edition,
                       destination=None):
@@ -248,6 +343,46 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
         return self._download_file_from_bucket(file_path, destination)
 
 
+    ###########################################################################
+    def open_file_stream(self, mongodb_version, mongodb_edition):
+        """
+            Returns a file-like object to read the archive from as it
+            downloads in ranges of part_size bytes (the part size of the
+            upload if known), up to transfer_workers at a time. Reading it
+            to the end verifies its ETag
+        """
+        file_path = self.get_download_url(mongodb_version, mongodb_edition)
+        key = file_path and self.bucket.get_key(file_path)
+        if not key:
+            raise FileNotInRepoError("No such file '%s' in bucket '%s'" %
+                                     (file_path, self.bucket_name))
+        log_info("Streaming '%s' from s3 bucket '%s'" %
+                 (file_path, self.bucket_name))
+
+        upload_part_size = key.get_metadata(S3_PART_SIZE_META)
+        part_size = int(upload_part_size or self.part_size)
+        num_parts = -(-key.size // part_size)
+        file_checksum = hashlib.md5()
+        part_digests = []
+
+        def fetch(start, end):
+            return self._read_part(key, (start, end))
+
+        def on_part(data):
+            file_checksum.update(data)
+            part_digests.append(hashlib.md5(data).digest())
+            if len(part_digests) == num_parts:
+                verify_s3_etag(key.etag, file_path, part_digests,
+                               strict=upload_part_size is not None,
+                               file_md5=file_checksum.hexdigest())
+
+        return RangeStreamReader(fetch, key.size, part_size,
+                                 self.transfer_workers, on_part=on_part)
+
+    ###########################################################################
+    def get_file_sha256(self, mongodb_version, mongodb_edition):
+        return None
+
     ###########################################################################
     def file_exists(self, mongodb_version, mongodb_edition):
 
@@ -269,8 +404,31 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
         self._upload_file_to_bucket(file_path, destination)
 
     ###########################################################################
-    def _download_file_from_bucket(self, file_path, destination):
+    def _connect(self):
+        if self.host:
+            # s3 compatible store
+            return S3Connection(self.access_key, self.secret_key,
+                                host=self.host, port=self.port,
+                                is_secure=self.is_secure,
+                                calling_format=OrdinaryCallingFormat())
+        return S3Connection(self.access_key, self.secret_key)
+
+    ###########################################################################
+    def _get_worker_bucket(self):
+        """
+            Returns the bucket on a connection of its own, for one transfer
+            worker thread
+        """
+        return self._connect().get_bucket(self.bucket_name, validate=False)
 
+    ###########################################################################
+    def _download_file_from_bucket(self, file_path, destination):
+        """
+            Downloads file_path with up to transfer_workers concurrent range
+            requests of part_size bytes (the part size of the upload if
+            known) written in place into a temp file, which is renamed into
+            destination once its ETag is verified
+        """
         key = self.bucket.get_key(file_path)
         file_name = os.path.basename(file_path)
 
@@ -280,17 +438,109 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
 
         log_info("Downloading '%s' from s3 bucket '%s'" %
                     (file_path, self.bucket_name))
+        start_time = time.time()
 
         destination_path = os.path.join(destination, file_name)
-        file_obj = open(destination_path, mode="w")
+        tmp_path = "%s.tmp" % destination_path
+        upload_part_size = key.get_metadata(S3_PART_SIZE_META)
+        part_size = int(upload_part_size or self.part_size)
+        ranges = [(start, min(start + part_size, key.size) - 1)
+                  for start in range(0, key.size, part_size)]
+
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.truncate(key.size)
+
+        progress = {"transferred": 0}
+        progress_lock = threading.Lock()
+
+        def on_data(length):
+            with progress_lock:
+                progress["transferred"] += length
+                _download_progress(progress["transferred"], key.size)
+
+        def fetch(byte_range):
+            return self._download_part(key, tmp_path, byte_range, on_data)
+
+        results = parallel_map(fetch, ranges,
+                               max_workers=self.transfer_workers)
+        print("")
+        failed = [ex for byte_range, result, ex in results if ex is not None]
+        try:
+            if failed:
+                raise MongoctlException("Failed to download %s part(s) of "
+                                        "'%s' from s3 bucket '%s'. First "
+                                        "error: %s" %
+                                        (len(failed), file_path,
+                                         self.bucket_name, failed[0]))
+            verify_s3_etag(key.etag, tmp_path,
+                           [result for byte_range, result, ex in results],
+                           strict=upload_part_size is not None)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        os.rename(tmp_path, destination_path)
+        duration = max(time.time() - start_time, 0.001)
+        log_info("Download completed successfully (%s part(s), %.1f MB/s)" %
+                 (len(ranges), key.size / 1048576.0 / duration))
 
-        num_call_backs = key.size / 1000
-        key.get_contents_to_file(file_obj, cb=_download_progress,
-                                 num_cb=num_call_backs)
+        return destination_path
 
-        print("Download completed successfully!!")
+    ###########################################################################
+    def _download_part(self, key, tmp_path, byte_range, on_data):
+        """
+            Writes byte_range of key at its offset in tmp_path. Returns the
+            MD5 digest of the range
+        """
+        start, end = byte_range
+        part_key = self._open_part(key, byte_range)
+        checksum = hashlib.md5()
+        received = 0
+        try:
+            with open(tmp_path, "r+b") as tmp_file:
+                tmp_file.seek(start)
+                while True:
+                    data = part_key.read(S3_READ_BLOCK_SIZE)
+                    if not data:
+                        break
+                    tmp_file.write(data)
+                    checksum.update(data)
+                    received += len(data)
+                    on_data(len(data))
+        finally:
+            part_key.close()
+
+        if received != end - start + 1:
+            raise MongoctlException("Incomplete part bytes=%s-%s of '%s' "
+                                    "(got %s bytes)" %
+                                    (start, end, key.name, received))
+        return checksum.digest()
 
-        return destination_path
+    ###########################################################################
+    def _read_part(self, key, byte_range):
+        """
+            Returns the content of byte_range of key
+        """
+        part_key = self._open_part(key, byte_range)
+        try:
+            return part_key.read()
+        finally:
+            part_key.close()
+
+    ###########################################################################
+    def _open_part(self, key, byte_range):
+        """
+            Returns a Key of its own (for one transfer worker thread) open
+            for reading byte_range of key
+        """
+        headers = {"Range": "bytes=%s-%s" % byte_range}
+        if key.etag:
+            # fail rather than mix two versions of the file
+            headers["If-Match"] = key.etag
+
+        part_key = Key(self._get_worker_bucket(), key.name)
+        part_key.open_read(headers=headers)
+        return part_key
 
     ###########################################################################
     def _upload_file_to_bucket(self, file_path, destination):
@@ -299,18 +549,92 @@ class S3MongoDBBinaryRepository(MongoDBBinaryRepository):
         destination_path = os.path.join(destination, file_name)
         log_info("Uploading '%s' to s3 bucket '%s' to '%s'" %
                 (file_path, self.bucket_name, destination))
+        start_time = time.time()
+        size = os.path.getsize(file_path)
 
-        file_obj = open(file_path)
-        k = Key(self.bucket)
-        k.key = destination_path
-        # set meta data (has to be before setting content in
-        # order for it to work)
-        k.set_metadata("Content-Type", "application/x-compressed")
+        if size > self.part_size:
+            self._multipart_upload_file(file_path, destination_path, size)
+        else:
+            with open(file_path, "rb") as file_obj:
+                k = Key(self.bucket)
+                k.key = destination_path
+                # set meta data (has to be before setting content in
+                # order for it to work)
+                k.set_metadata("Content-Type", "application/x-compressed")
 
-        k.set_contents_from_file(file_obj)
+                # boto checks the returned ETag against the file's MD5
+                k.set_contents_from_file(file_obj)
 
-        log_info("Completed upload '%s' to s3 bucket '%s'!" %
-                 (file_path, self.bucket_name))
+        duration = max(time.time() - start_time, 0.001)
+        log_info("Completed upload '%s' to s3 bucket '%s' (%.1f MB/s)!" %
+                 (file_path, self.bucket_name, size / 1048576.0 / duration))
+
+    ###########################################################################
+    def _multipart_upload_file(self, file_path, key_name, size):
+        """
+            Uploads file_path as a multipart upload of part_size parts, up
+            to transfer_workers at a time. The upload is aborted if a part
+            fails and the object is deleted if its ETag does not match the
+            MD5s of the parts
+        """
+        parts = [(number, offset, min(self.part_size, size - offset))
+                 for number, offset in
+                 enumerate(range(0, size, self.part_size), 1)]
+        log_verbose("Uploading '%s' in %s parts of up to %s bytes" %
+                    (file_path, len(parts), self.part_size))
+
+        upload = self.bucket.initiate_multipart_upload(
+            key_name,
+            headers={"Content-Type": "application/x-compressed"},
+            metadata={S3_PART_SIZE_META: str(self.part_size)})
+
+        def send(part):
+            return self._upload_part(file_path, key_name, upload.id, part)
+
+        results = parallel_map(send, parts,
+                               max_workers=self.transfer_workers)
+        failed = [ex for part, result, ex in results if ex is not None]
+        if failed:
+            upload.cancel_upload()
+            raise MongoctlException("Failed to upload %s part(s) of '%s' to "
+                                    "s3 bucket '%s'. First error: %s" %
+                                    (len(failed), file_path,
+                                     self.bucket_name, failed[0]))
+
+        part_etags = [(part[0], etag) for part, etag, ex in results]
+        try:
+            completed = self.bucket.complete_multipart_upload(
+                key_name, upload.id, get_complete_upload_xml(part_etags))
+        except Exception:
+            upload.cancel_upload()
+            raise
+
+        expected_etag = get_multipart_etag(
+            [binascii.unhexlify(etag) for number, etag in part_etags])
+        if (completed.etag or "").strip('"') != expected_etag:
+            self.bucket.delete_key(key_name)
+            raise MongoctlException("ETag mismatch for '%s' uploaded to s3 "
+                                    "bucket '%s': expected %s but got %s" %
+                                    (key_name, self.bucket_name,
+                                     expected_etag, completed.etag))
+
+    ###########################################################################
+    def _upload_part(self, file_path, key_name, upload_id, part):
+        """
+            Uploads one (number, offset, size) part of file_path. Returns
+            its ETag (the hex MD5 of the part)
+        """
+        number, offset, size = part
+        upload = MultiPartUpload(self._get_worker_bucket())
+        upload.key_name = key_name
+        upload.id = upload_id
+        with open(file_path, "rb") as file_obj:
+            file_obj.seek(offset)
+            # boto checks the returned ETag against the part's MD5
+            part_key = upload.upload_part_from_file(file_obj, number,
+                                                    size=size)
+        log_verbose("Uploaded part %s of '%s'" % (number, file_path))
+        return part_key.etag.strip('"')
 
 ###############################################################################
 _registered_repos = list()
@@ -341,34 +665,150 @@ def get_binary_repository(name):
     raise MongoctlException("Unknown repository '%s'" % name)
 
 ###########################################################################
-def download_mongodb_binary(mongodb_version, mongodb_edition,
-                            destination=None):
-    destination = destination or os.getcwd()
-
+def iter_binary_repositories(mongodb_version, mongodb_edition, repos=None,
+                             timeout=REPO_PROBE_TIMEOUT):
+    """
+    Yields, in order, the repos (defaults to the registered repositories)
+    that have the mongodb binary. All repositories are asked at the same
+    time; each one is yielded as soon as it and every repository before it
+    have answered, without waiting for the ones after it. Repositories that
+    have not answered within timeout secs are yielded too (in their place)
+    so that callers can still try them in order of preference.
+    """
     log_info("Looking for a download for MongoDB ('%s', '%s')" %
              (mongodb_version, mongodb_edition))
 
-    for repo in get_registered_binary_repositories():
-        log_verbose("Trying from '%s' binary repository..." % repo.name)
+    candidates = []
+    for repo in repos or get_registered_binary_repositories():
         if mongodb_edition in repo.supported_editions:
-            try:
-                if repo.file_exists(mongodb_version, mongodb_edition):
-                    return repo.download_file(mongodb_version, mongodb_edition,
-                                              destination=destination)
-                else:
-                    log_verbose("Repository '%s' doesnt have this version. Skipping..." % repo.name)
-                    continue
-            except FileNotInRepoError, e:
-                log_verbose("No mongodb binary (version: '%s', edition: '%s' )"
-                            "found in repo '%s'" %
-                            (mongodb_version, mongodb_edition, repo.name))
+            candidates.append(repo)
         else:
             log_verbose("Binary repository '%s' does not support edition '%s'."
                         " Supported editions %s" %
                         (repo.name, mongodb_edition, repo.supported_editions))
 
-    raise MongoctlException("No mongodb binary (version: '%s', edition: '%s')"
-                            % (mongodb_version, mongodb_edition))
+    answer_queue = Queue.Queue()
+
+    def probe(index, repo):
+        log_verbose("Trying from '%s' binary repository..." % repo.name)
+        try:
+            has_file = repo.file_exists(mongodb_version, mongodb_edition)
+        except FileNotInRepoError:
+            has_file = False
+        except Exception, e:
+            log_verbose("Unable to check binary repository '%s': %s" %
+                        (repo.name, e))
+            has_file = False
+        if not has_file:
+            log_verbose("Repository '%s' doesnt have this version." %
+                        repo.name)
+        answer_queue.put((index, has_file))
+
+    for index, repo in enumerate(candidates):
+        # daemon: probes still running once a winner is found are abandoned
+        thread = threading.Thread(target=probe, args=(index, repo))
+        thread.daemon = True
+        thread.start()
+
+    answers = {}
+    deadline = time.time() + timeout
+    timed_out = False
+    for index, repo in enumerate(candidates):
+        while index not in answers:
+            try:
+                if timed_out:
+                    answer = answer_queue.get_nowait()
+                else:
+                    answer = answer_queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                answers[answer[0]] = answer[1]
+            except Queue.Empty:
+                if timed_out:
+                    break
+                log_verbose("Timed out waiting for binary repositories. "
+                            "Trying the ones that did not answer in order")
+                timed_out = True
+
+        if answers.get(index, timed_out):
+            log_verbose("Using binary repository '%s'" % repo.name)
+            yield repo
+
+###########################################################################
+def get_binary_cache_ref(mongodb_version, mongodb_edition, repo_name):
+    """
+    Returns the binary cache key of the mongodb binary of repository
+    repo_name for this host's platform. Refs are per repository since
+    custom repositories can publish their own builds of a version
+    """
+    args = get_template_args(mongodb_version, mongodb_edition)
+    return "%s/mongodb-%s%s-%s-%s" % (
+        repo_name, args["platform_spec"],
+        "-%s%s" % (args["os_dist_name"], args["os_dist_version_no_dots"])
+        if args["os_dist_name"] else "",
+        mongodb_edition, mongodb_version)
+
+###########################################################################
+def get_binary_cache_refs(mongodb_version, mongodb_edition):
+    """
+    Returns the binary cache refs of the mongodb binary for the registered
+    repositories that support mongodb_edition, in order
+    """
+    return [get_binary_cache_ref(mongodb_version, mongodb_edition, repo.name)
+            for repo in get_registered_binary_repositories()
+            if mongodb_edition in repo.supported_editions]
+
+###########################################################################
+def download_mongodb_binary(mongodb_version, mongodb_edition, destination):
+    """
+    Downloads the archive of the mongodb binary into destination from the
+    first registered repository that has it (see open_mongodb_binary_stream())
+    and returns (repo, archive path). Interrupted downloads from HTTP
+    repositories are resumed by the next call (see download_url_parallel())
+    """
+    def download(repo):
+        return repo.download_file(mongodb_version, mongodb_edition,
+                                  destination=destination)
+
+    return _from_first_binary_repository(mongodb_version, mongodb_edition,
+                                         download)
+
+###########################################################################
+def open_mongodb_binary_stream(mongodb_version, mongodb_edition):
+    """
+    Returns (repo, stream) for the first registered repository that has the
+    archive (see iter_binary_repositories()). If that repository fails to
+    open it, the next ones are tried in order
+    """
+    def open_stream(repo):
+        return repo.open_file_stream(mongodb_version, mongodb_edition)
+
+    return _from_first_binary_repository(mongodb_version, mongodb_edition,
+                                         open_stream)
+
+###########################################################################
+def _from_first_binary_repository(mongodb_version, mongodb_edition, func):
+    """
+    Returns (repo, func(repo)) for the first repository of
+    iter_binary_repositories() for which func does not fail
+    """
+    error = None
+    for repo in iter_binary_repositories(mongodb_version, mongodb_edition):
+        try:
+            return repo, func(repo)
+        except FileNotInRepoError:
+            log_warning("No mongodb binary (version: '%s', edition: '%s') "
+                        "found in repo '%s' after all" %
+                        (mongodb_version, mongodb_edition, repo.name))
+        except Exception, e:
+            log_warning("Unable to download from binary repository '%s': "
+                        "%s" % (repo.name, e))
+            error = e
+
+    msg = ("No mongodb binary (version: '%s', edition: '%s')" %
+           (mongodb_version, mongodb_edition))
+    if error:
+        msg += " could be downloaded. Last error: %s" % error
+    raise MongoctlException(msg)
 
 ###############################################################################
 # HELPERS
@@ -381,6 +821,16 @@ def _make_binary_repo(name, repo_config):
         repo.bucket_name = repo_config["bucketName"]
         repo.access_key = repo_config["accessKey"]
         repo.secret_key = repo_config["secretKey"]
+        repo.host = repo_config.get("host")
+        repo.port = repo_config.get("port")
+        repo.is_secure = repo_config.get("isSecure", True)
+        if "partSizeMB" in repo_config:
+            part_size_mb = max(int(repo_config["partSizeMB"]),
+                               MIN_S3_PART_SIZE_MB)
+            repo.part_size = part_size_mb * 1024 * 1024
+        if "transferWorkers" in repo_config:
+            repo.transfer_workers = max(int(repo_config["transferWorkers"]),
+                                        1)
     else:
         repo = MongoDBBinaryRepository()
 
@@ -391,6 +841,69 @@ def _make_binary_repo(name, repo_config):
     return repo
 
 
+###############################################################################
+def verify_s3_etag(etag, file_path, part_digests, strict=True,
+                   file_md5=None):
+    """
+    Checks file_path, downloaded in parts whose MD5 digests are
+    part_digests, against the ETag of its s3 object: the MD5 of the file
+    (file_md5, computed from file_path if not given) for single PUT objects
+    or get_multipart_etag() of the parts for multipart uploads. A multipart
+    ETag can only be checked if the parts were downloaded with the upload's
+    part size so it is not an error for it not to match unless strict.
+    Raises a MongoctlException on mismatch
+    """
+    etag = (etag or "").strip('"')
+    if not etag:
+        log_verbose("No ETag to verify '%s' against" % file_path)
+        return
+
+    if "-" in etag:
+        actual_etag = get_multipart_etag(part_digests)
+    elif len(part_digests) == 1:
+        actual_etag = binascii.hexlify(part_digests[0])
+    else:
+        actual_etag = file_md5 or get_file_md5(file_path)
+
+    if actual_etag == etag:
+        log_verbose("Verified '%s' against its ETag %s" % (file_path, etag))
+    elif "-" in etag and not strict:
+        log_verbose("Unable to verify '%s' against its multipart ETag %s: "
+                    "unknown part size" % (file_path, etag))
+    else:
+        raise MongoctlException("ETag mismatch for '%s': expected %s but "
+                                "got %s" % (file_path, etag, actual_etag))
+
+###############################################################################
+def get_multipart_etag(part_digests):
+    """
+    Returns the ETag s3 gives to a multipart upload of parts with MD5
+    digests part_digests
+    """
+    return "%s-%s" % (hashlib.md5("".join(part_digests)).hexdigest(),
+                      len(part_digests))
+
+###############################################################################
+def get_file_md5(file_path):
+    checksum = hashlib.md5()
+    with open(file_path, "rb") as f:
+        while True:
+            data = f.read(S3_READ_BLOCK_SIZE)
+            if not data:
+                break
+            checksum.update(data)
+    return checksum.hexdigest()
+
+###############################################################################
+def get_complete_upload_xml(part_etags):
+    """
+    Returns the CompleteMultipartUpload body for (part number, ETag) pairs
+    """
+    parts = ["<Part><PartNumber>%s</PartNumber><ETag>\"%s\"</ETag></Part>" %
+             (number, etag) for number, etag in part_etags]
+    return ("<CompleteMultipartUpload>%s</CompleteMultipartUpload>" %
+            "".join(parts))
+
 ###############################################################################
 def _download_progress(transferred, size):
     percentage = (float(transferred)/float(size)) * 100
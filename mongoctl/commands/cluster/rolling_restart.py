@@ -0,0 +1,25 @@
+__author__ = 'abdul'
+
+import mongoctl.repository as repository
+
+from mongoctl.objects.replicaset_cluster import (
+    ReplicaSetCluster, ROLLING_RESTART_MAX_REPL_LAG
+)
+from mongoctl.errors import MongoctlException
+
+###############################################################################
+# rolling-restart command
+###############################################################################
+def rolling_restart_command(parsed_options):
+    cluster = repository.lookup_and_validate_cluster(parsed_options.cluster)
+    if not isinstance(cluster, ReplicaSetCluster):
+        raise MongoctlException("Cluster '%s' is not a replicaset cluster" %
+                                cluster.id)
+
+    max_repl_lag = parsed_options.maxReplLag
+    if max_repl_lag is not None:
+        max_repl_lag = int(max_repl_lag)
+    else:
+        max_repl_lag = ROLLING_RESTART_MAX_REPL_LAG
+
+    cluster.rolling_restart(max_repl_lag=max_repl_lag)
@@ -0,0 +1,211 @@
+__author__ = 'abdul'
+
+import mongoctl.repository as repository
+
+from mongoctl.mongoctl_logging import log_info, log_warning, log_error
+from mongoctl.errors import MongoctlException
+from mongoctl.prompt import prompt_confirm, prompt_execute_task
+from mongoctl.utils import parallel_map, kill_process
+
+from mongoctl.objects.replicaset_cluster import (
+    ReplicaSetCluster, query_members
+)
+from mongoctl.objects.sharded_cluster import ShardedCluster
+from mongoctl.objects.mongod import MongodServer
+
+from mongoctl.commands.server.start import (
+    start_server, prepare_mongod_server, get_started_servers,
+    mongod_needs_numactl, get_numactl_exe, confirm_start_without_numactl
+)
+
+###############################################################################
+# CONSTS
+###############################################################################
+DEFAULT_MAX_PARALLEL_STARTS = 10
+
+###############################################################################
+# start-cluster command
+###############################################################################
+def start_cluster_command(parsed_options):
+    cluster = repository.lookup_and_validate_cluster(parsed_options.cluster)
+    max_parallel = parsed_options.maxParallel
+    if max_parallel:
+        max_parallel = int(max_parallel)
+
+    start_cluster(cluster,
+                  max_parallel=max_parallel or DEFAULT_MAX_PARALLEL_STARTS,
+                  rs_init=parsed_options.rsInit)
+
+###############################################################################
+def start_cluster(cluster, max_parallel=DEFAULT_MAX_PARALLEL_STARTS,
+                  rs_init=False):
+    """
+    Starts all (local) servers of a cluster. Sharded clusters are started in
+    dependency order: config servers, then all shard members, then mongos
+    routers. Servers of each tier are started in parallel (at most
+    max_parallel at a time) and each replica set is initiated once after all
+    its members are up.
+    """
+    log_info("Starting cluster '%s'..." % cluster.id)
+
+    if isinstance(cluster, ShardedCluster):
+        start_sharded_cluster(cluster, max_parallel=max_parallel,
+                              rs_init=rs_init)
+    elif isinstance(cluster, ReplicaSetCluster):
+        start_replica_sets([cluster], max_parallel=max_parallel,
+                           rs_init=rs_init)
+    else:
+        raise MongoctlException("Unsupported cluster type for cluster '%s'" %
+                                cluster.id)
+
+    log_info("Cluster '%s' started successfully!" % cluster.id)
+
+###############################################################################
+def start_sharded_cluster(cluster, max_parallel=DEFAULT_MAX_PARALLEL_STARTS,
+                          rs_init=False):
+
+    # 1- config servers
+    log_info("Starting config servers of cluster '%s'..." % cluster.id)
+    config_servers = cluster.config_servers
+    if isinstance(config_servers, ReplicaSetCluster):
+        start_replica_sets([config_servers], max_parallel=max_parallel,
+                           rs_init=rs_init)
+    else:
+        start_servers(config_servers, max_parallel=max_parallel)
+
+    # 2- shards. All shard members are started together
+    log_info("Starting shards of cluster '%s'..." % cluster.id)
+    shard_replicas = []
+    shard_servers = []
+    for shard_member in cluster.shards:
+        if shard_member.get_cluster():
+            shard_replicas.append(shard_member.get_cluster())
+        elif shard_member.get_server():
+            shard_servers.append(shard_member.get_server())
+
+    start_replica_sets(shard_replicas, max_parallel=max_parallel,
+                       rs_init=rs_init, extra_servers=shard_servers)
+
+    # 3- mongos routers
+    log_info("Starting mongos routers of cluster '%s'..." % cluster.id)
+    start_servers(cluster.get_servers(), max_parallel=max_parallel)
+
+###############################################################################
+def start_replica_sets(replica_clusters, max_parallel=DEFAULT_MAX_PARALLEL_STARTS,
+                       rs_init=False, extra_servers=None):
+    servers = list(extra_servers or [])
+    for replica_cluster in replica_clusters:
+        servers.extend(replica_cluster.get_servers())
+
+    start_servers(servers, max_parallel=max_parallel)
+    init_replica_sets(replica_clusters, max_parallel=max_parallel,
+                      rs_init=rs_init)
+
+###############################################################################
+def start_servers(servers, max_parallel=DEFAULT_MAX_PARALLEL_STARTS):
+    """
+    Starts the local servers in parallel. Servers are always forked. Replica
+    set configuration is skipped; see init_replica_sets(). Prompts happen
+    here on the main thread, never in the start threads. Returns a
+    server id => pid dict
+    """
+    local_servers = []
+    for server in servers:
+        if server.is_use_local():
+            local_servers.append(server)
+        else:
+            log_info("Skipping server '%s' since it is not local." % server.id)
+
+    if (mongod_needs_numactl() and not get_numactl_exe() and
+            [s for s in local_servers if isinstance(s, MongodServer)]):
+        confirm_start_without_numactl()
+
+    def start_it(server):
+        server.apply_cmd_options_overrides({"fork": True})
+        return start_server(server, skip_repl_config=True, parallel=True)
+
+    results = parallel_map(start_it, local_servers, max_workers=max_parallel)
+    failed = [(server, ex) for server, result, ex in results if ex is not None]
+    if failed:
+        for server, ex in failed:
+            log_error("Failed to start server '%s': %s" % (server.id, ex))
+        prompt_kill_failed_servers([server for server, ex in failed])
+        raise MongoctlException("Failed to start server(s) %s" %
+                                ", ".join([s.id for s, ex in failed]))
+
+    return dict((server.id, pid) for server, pid, ex in results)
+
+###############################################################################
+def prompt_kill_failed_servers(failed_servers):
+    """
+    Offers to kill the processes of servers that were started but then
+    failed (e.g. while being prepared)
+    """
+    failed_ids = set([server.id for server in failed_servers])
+    condemned = [(pid, server)
+                 for pid, server in get_started_servers().items()
+                 if server.id in failed_ids]
+    if not condemned:
+        return
+
+    def kill_them():
+        for pid, server in condemned:
+            kill_process(pid, force=True)
+            log_info("Server '%s' process terminated at operator behest." %
+                     server.id)
+
+    prompt_execute_task("Kill server(s) %s now?" %
+                        ", ".join([s.id for pid, s in condemned]),
+                        kill_them)
+
+###############################################################################
+def init_replica_sets(replica_clusters, max_parallel=DEFAULT_MAX_PARALLEL_STARTS,
+                      rs_init=False):
+    """
+    Initiates (or adds missing members to) each replica set once. Prompts
+    (unless rs_init) happen first so that initiations can run in parallel
+    """
+    to_init = []
+    for replica_cluster in replica_clusters:
+        members = replica_cluster.get_members()
+        online = query_members(members,
+                               lambda m: m.get_server().is_online())
+        if len([m for m, is_online in online if is_online]) < len(members):
+            log_warning("Not all members of replica set '%s' are online. "
+                        "Skipping replica set configuration. Run "
+                        "'configure-cluster %s' once all members are "
+                        "started." % (replica_cluster.id, replica_cluster.id))
+            continue
+
+        if replica_cluster.is_replicaset_initialized():
+            missing = [s.id for s in replica_cluster.get_servers()
+                       if not replica_cluster.is_member_configured_for(s)]
+            if not missing:
+                continue
+            prompt = ("Do you want to add server(s) %s to replica set "
+                      "cluster '%s'?" % (", ".join(missing),
+                                         replica_cluster.id))
+        else:
+            prompt = ("Do you want to initialize replica set cluster '%s'?" %
+                      replica_cluster.id)
+
+        if rs_init or prompt_confirm(prompt):
+            to_init.append(replica_cluster)
+
+    results = parallel_map(configure_started_replica_set, to_init,
+                           max_workers=max_parallel)
+    failed = [(rc, ex) for rc, result, ex in results if ex is not None]
+    if failed:
+        for replica_cluster, ex in failed:
+            log_error("Failed to configure replica set '%s': %s" %
+                      (replica_cluster.id, ex))
+        raise MongoctlException("Failed to configure replica set(s) %s" %
+                                ", ".join([rc.id for rc, ex in failed]))
+
+###############################################################################
+def configure_started_replica_set(replica_cluster):
+    replica_cluster.configure_replicaset()
+    # now that there is a primary, finish preparing the server (users)
+    primary_server = replica_cluster.get_primary_server()
+    if primary_server:
+        prepare_mongod_server(primary_server)
@@ -0,0 +1,195 @@
+__author__ = 'abdul'
+
+import mongoctl.repository as repository
+
+from mongoctl.mongoctl_logging import log_info, log_warning, log_error
+from mongoctl.errors import MongoctlException, ServerStopPendingError
+from mongoctl.utils import parallel_map
+
+from mongoctl.objects.replicaset_cluster import ReplicaSetCluster
+from mongoctl.objects.sharded_cluster import ShardedCluster
+
+from mongoctl.commands.server.stop import (
+    do_stop_server, prompt_force_stop_server
+)
+
+###############################################################################
+# CONSTS
+###############################################################################
+DEFAULT_MAX_PARALLEL_STOPS = 10
+
+###############################################################################
+# stop-cluster command
+###############################################################################
+def stop_cluster_command(parsed_options):
+    cluster = repository.lookup_and_validate_cluster(parsed_options.cluster)
+    max_parallel = parsed_options.maxParallel
+    if max_parallel:
+        max_parallel = int(max_parallel)
+
+    stop_cluster(cluster,
+                 max_parallel=max_parallel or DEFAULT_MAX_PARALLEL_STOPS,
+                 force=parsed_options.forceStop)
+
+###############################################################################
+def stop_cluster(cluster, max_parallel=DEFAULT_MAX_PARALLEL_STOPS,
+                 force=False):
+    """
+    Stops all (local) servers of a cluster in the reverse order of
+    start-cluster: mongos routers, then shards, then config servers. Within
+    each replica set, the primary is first stepped down to its most
+    caught-up secondary while all members are still up. Then all other
+    members are stopped and the new primary last, so that no acknowledged
+    writes are left to roll back on restart.
+    """
+    log_info("Stopping cluster '%s'..." % cluster.id)
+
+    if isinstance(cluster, ShardedCluster):
+        stop_sharded_cluster(cluster, max_parallel=max_parallel, force=force)
+    elif isinstance(cluster, ReplicaSetCluster):
+        stop_replica_sets([cluster], max_parallel=max_parallel, force=force)
+    else:
+        raise MongoctlException("Unsupported cluster type for cluster '%s'" %
+                                cluster.id)
+
+    log_info("Cluster '%s' stopped successfully!" % cluster.id)
+
+###############################################################################
+def stop_sharded_cluster(cluster, max_parallel=DEFAULT_MAX_PARALLEL_STOPS,
+                         force=False):
+
+    # 1- mongos routers
+    log_info("Stopping mongos routers of cluster '%s'..." % cluster.id)
+    stop_servers(cluster.get_servers(), max_parallel=max_parallel,
+                 force=force)
+
+    # 2- shards. All shards are stopped together
+    log_info("Stopping shards of cluster '%s'..." % cluster.id)
+    shard_replicas = []
+    shard_servers = []
+    for shard_member in cluster.shards:
+        if shard_member.get_cluster():
+            shard_replicas.append(shard_member.get_cluster())
+        elif shard_member.get_server():
+            shard_servers.append(shard_member.get_server())
+
+    stop_replica_sets(shard_replicas, max_parallel=max_parallel, force=force,
+                      extra_servers=shard_servers)
+
+    # 3- config servers
+    log_info("Stopping config servers of cluster '%s'..." % cluster.id)
+    config_servers = cluster.config_servers
+    if isinstance(config_servers, ReplicaSetCluster):
+        stop_replica_sets([config_servers], max_parallel=max_parallel,
+                          force=force)
+    else:
+        stop_servers(config_servers, max_parallel=max_parallel, force=force)
+
+###############################################################################
+def stop_replica_sets(replica_clusters, max_parallel=DEFAULT_MAX_PARALLEL_STOPS,
+                      force=False, extra_servers=None):
+    """
+    Stops the replica sets together: primaries are stepped down first (while
+    a majority is up to elect their successors), then all the other members
+    are stopped, then the successors and extra_servers.
+    """
+    handoffs, stop_tiers = get_replica_sets_stop_plan(
+        replica_clusters, extra_servers=extra_servers)
+
+    # 1- step down primaries
+    def step_down(handoff):
+        replica_cluster, primary, candidate = handoff
+        if not candidate:
+            log_warning("No caught-up secondary to step primary '%s' down "
+                        "to. Stopping it last." % primary.id)
+        elif primary.is_primary():
+            try:
+                replica_cluster.step_down_primary_to(primary, candidate)
+            except Exception, e:
+                log_warning("Stopping primary '%s' without a step down: %s" %
+                            (primary.id, e))
+
+    parallel_map(step_down, [h for h in handoffs
+                             if h[1].is_use_local()],
+                 max_workers=max_parallel)
+
+    # 2- everything else (incl. former primaries), then the successors
+    for tier in stop_tiers:
+        stop_servers(tier, max_parallel=max_parallel, force=force)
+
+###############################################################################
+def get_replica_sets_stop_plan(replica_clusters, extra_servers=None):
+    """
+    Returns a (handoffs, stop tiers) tuple. handoffs is a list of
+    (replica cluster, primary, step down candidate) tuples. The last tier
+    holds the step down candidates (or the primaries that have none) and
+    extra_servers; the first tier holds all the other members
+    """
+    handoffs = []
+    first_tier = []
+    last_tier = list(extra_servers or [])
+
+    for replica_cluster in replica_clusters:
+        primary, candidate = get_step_down_handoff(replica_cluster)
+        if primary:
+            handoffs.append((replica_cluster, primary, candidate))
+        last = candidate or primary
+        if last:
+            last_tier.append(last)
+        first_tier.extend([s for s in replica_cluster.get_servers()
+                           if not last or s.id != last.id])
+
+    return handoffs, [first_tier, last_tier]
+
+###############################################################################
+def get_step_down_handoff(replica_cluster):
+    """
+    Returns a (primary server, step down candidate server) tuple for the
+    replica set. Either can be None (e.g. no primary is elected)
+    """
+    try:
+        primary_server = replica_cluster.get_primary_server()
+        if not primary_server:
+            return None, None
+
+        candidate = replica_cluster.get_most_caught_up_secondary()
+        return primary_server, candidate and candidate.get_server()
+    except Exception, e:
+        log_warning("Unable to determine primary of replica set '%s': %s" %
+                    (replica_cluster.id, e))
+        return None, None
+
+###############################################################################
+def stop_servers(servers, max_parallel=DEFAULT_MAX_PARALLEL_STOPS,
+                 force=False):
+    """
+    Stops the local servers in parallel. Forceful stops of servers that did
+    not stop gracefully are prompted for here on the main thread, after all
+    stops, never in the stop threads
+    """
+    local_servers = []
+    for server in servers:
+        if server.is_use_local():
+            local_servers.append(server)
+        else:
+            log_info("Skipping server '%s' since it is not local." % server.id)
+
+    def stop_it(server):
+        do_stop_server(server, force=force, parallel=True)
+
+    results = parallel_map(stop_it, local_servers, max_workers=max_parallel)
+    failed = []
+    for server, result, ex in results:
+        if isinstance(ex, ServerStopPendingError):
+            try:
+                prompt_force_stop_server(server, ex)
+            except Exception, e:
+                failed.append((server, e))
+        elif ex is not None:
+            failed.append((server, ex))
+
+    if failed:
+        for server, ex in failed:
+            log_error("Failed to stop server '%s': %s" % (server.id, ex))
+        raise MongoctlException("Failed to stop server(s) %s" %
+                                ", ".join([s.id for s, ex in failed]))
@@ -2,12 +2,17 @@ __author__ = 'abdul'
 
 import os
 import re
+import json
+import tempfile
+import threading
 
 import mongoctl.repository as repository
 from mongoctl.mongoctl_logging import *
 from mongoctl import config
 from mongoctl.errors import MongoctlException
-from mongoctl.utils import is_exe, which, resolve_path, execute_command
+from mongoctl.utils import (
+    is_exe, which, resolve_path, execute_command, ensure_dir
+)
 from mongoctl.mongodb_version import make_version_info, MongoDBEdition
 from mongoctl.mongo_uri_tools import is_mongo_uri
 
@@ -19,6 +24,8 @@ MONGO_HOME_ENV_VAR = "MONGO_HOME"
 
 MONGO_VERSIONS_ENV_VAR = "MONGO_VERSIONS"
 
+DEFAULT_EXE_VERSION_CACHE_FILE = "~/.mongoctl/exe_versions.cache"
+
 # VERSION CHECK PREFERENCE CONSTS
 class VersionPreference(object):
     EXACT = "EXACT"
@@ -300,6 +307,15 @@ def get_mongo_home_exe(mongo_home, executable_name):
 def mongo_exe_version(mongo_exe):
     mongod_path = os.path.join(os.path.dirname(mongo_exe), "mongod")
 
+    version_info = lookup_cached_exe_version(mongod_path)
+    if version_info is None:
+        version_info = probe_mongod_version(mongod_path)
+        cache_exe_version(mongod_path, version_info)
+
+    return version_info
+
+###############################################################################
+def probe_mongod_version(mongod_path):
     try:
         re_expr = "v?((([0-9]+)\.([0-9]+)\.([0-9]+))([^, ]*))"
         vers_spew = execute_command([mongod_path, "--version"])
@@ -326,6 +342,108 @@ def mongo_exe_version(mongo_exe):
         raise MongoctlException("Unable to get mongo version of '%s'."
                                 " Cause: %s" % (mongod_path, e))
 
+###############################################################################
+# Exe version cache
+###############################################################################
+# Probing a mongod version forks the binary twice (--version and --help) so
+# results are persisted to disk keyed by the binary's
+# (path, inode, mtime, size). Any change to the binary invalidates its entry.
+# Versions can be probed from several threads (e.g. parallel starts) so the
+# cache and its saving are guarded by a lock.
+__exe_version_cache__ = None
+__exe_version_cache_lock__ = threading.RLock()
+
+###############################################################################
+def get_exe_version_cache_file():
+    cache_file = config.get_mongoctl_config_val("exeVersionCacheFile",
+                                                DEFAULT_EXE_VERSION_CACHE_FILE)
+    if cache_file:
+        return resolve_path(cache_file)
+
+###############################################################################
+def get_exe_version_cache():
+    global __exe_version_cache__
+
+    with __exe_version_cache_lock__:
+        if __exe_version_cache__ is None:
+            __exe_version_cache__ = {}
+            cache_file = get_exe_version_cache_file()
+            if cache_file and os.path.exists(cache_file):
+                try:
+                    with open(cache_file) as f:
+                        __exe_version_cache__ = json.load(f)
+                except Exception, e:
+                    log_exception(e)
+                    log_verbose("Ignoring unreadable exe version cache '%s':"
+                                " %s" % (cache_file, e))
+
+        return __exe_version_cache__
+
+###############################################################################
+def exe_file_signature(exe_path):
+    st = os.stat(exe_path)
+    return [st.st_ino, st.st_mtime, st.st_size]
+
+###############################################################################
+def lookup_cached_exe_version(exe_path):
+    entry = get_exe_version_cache().get(exe_path)
+    if not entry:
+        return None
+
+    try:
+        if entry["signature"] != exe_file_signature(exe_path):
+            log_verbose("Exe version cache entry for '%s' is stale" %
+                        exe_path)
+            return None
+        return make_version_info(entry["version"], edition=entry["edition"])
+    except Exception, e:
+        log_exception(e)
+        return None
+
+###############################################################################
+def cache_exe_version(exe_path, version_info):
+    try:
+        with __exe_version_cache_lock__:
+            get_exe_version_cache()[exe_path] = {
+                "signature": exe_file_signature(exe_path),
+                "version": version_info.version_number,
+                "edition": version_info.edition
+            }
+            save_exe_version_cache()
+    except Exception, e:
+        # the cache is only an optimization, never fail because of it
+        log_exception(e)
+        log_verbose("Unable to update exe version cache: %s" % e)
+
+###############################################################################
+def save_exe_version_cache():
+    cache_file = get_exe_version_cache_file()
+    if not cache_file:
+        return
+
+    cache_dir = os.path.dirname(cache_file)
+    ensure_dir(cache_dir)
+    # write to a temp file (unique per call) then rename so that concurrent
+    # mongoctl processes never see a partially written cache
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir,
+                                    prefix="%s." %
+                                           os.path.basename(cache_file))
+    try:
+        with __exe_version_cache_lock__:
+            with os.fdopen(fd, "w") as f:
+                json.dump(get_exe_version_cache(), f)
+        os.rename(tmp_file, cache_file)
+    except Exception:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+###############################################################################
+def clear_exe_version_cache():
+    global __exe_version_cache__
+    with __exe_version_cache_lock__:
+        __exe_version_cache__ = None
+
 ###############################################################################
 class MongoExeObject():
     pass
@@ -1,11 +1,20 @@
 __author__ = 'abdul'
 
 
+import os
+import json
+import zlib
+import subprocess
+import threading
+import Queue
+
 import mongoctl.repository as repository
 
 from mongoctl.mongo_uri_tools import is_mongo_uri, parse_mongo_uri
 
-from mongoctl.utils import resolve_path, ensure_dir
+from mongoctl.utils import (
+    resolve_path, ensure_dir, parallel_map, which, ChunkedChecksumWriter
+)
 from mongoctl.mongoctl_logging import log_info , log_warning
 
 from mongoctl.commands.command_utils import (
@@ -16,7 +25,13 @@ from mongoctl.errors import MongoctlException
 
 from mongoctl.utils import call_command
 from mongoctl.objects.server import Server
+from mongoctl.objects.replicaset_cluster import ReplicaSetCluster
+from mongoctl.objects.sharded_cluster import ShardedCluster
 from mongoctl.mongodb_version import MongoDBVersionInfo
+from mongoctl.native_dump import native_dump, DEFAULT_NATIVE_DUMP_WORKERS
+from mongoctl.commands.common.oplog_slices import (
+    get_server_oplog_checkpoint, record_full_dump_checkpoint, dump_oplog_slice
+)
 
 
 ###############################################################################
@@ -38,6 +53,44 @@ SUPPORTED_MONGO_DUMP_OPTIONS = [
     "dumpDbUsersAndRoles"
 ]
 
+# file describing the layout of a per-shard dump of a sharded cluster
+SHARDED_DUMP_MANIFEST = "sharded_dump.json"
+
+SHARDED_DUMP_CONFIG_DIR = "config"
+
+SHARDED_DUMP_SHARDS_DIR = "shards"
+
+# name of the (compressed) archive written by a streaming dump
+STREAM_ARCHIVE_NAME = "dump.archive"
+
+DEFAULT_STREAM_CHUNK_SIZE_MB = 1024
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# first mongodump version that can write an --archive to stdout
+MIN_ARCHIVE_DUMP_VERSION = MongoDBVersionInfo("3.2.0")
+
+# marks the end of the blocks queued by gzip_stream_blocks()
+STREAM_END = object()
+
+# compression => (file extension, [(compressor exe, args)]). The first exe
+# found is used. gzip falls back to in-process zlib
+STREAM_COMPRESSIONS = {
+    "none": ("", []),
+    "gzip": (".gz", [("pigz", ["-c"]), ("gzip", ["-c"])]),
+    "zstd": (".zst", [("zstd", ["-q", "-c", "-T0"])]),
+    "lz4": (".lz4", [("lz4", ["-q", "-c"])])
+}
+
+# dump options supported by the native (pymongo) dump engine
+NATIVE_DUMP_OPTIONS = [
+    "out",
+    "collection",
+    "query",
+    "verbose",
+    "authenticationDatabase"
+]
+
 
 ###############################################################################
 # dump command
@@ -47,6 +100,24 @@ def dump_command(parsed_options):
     # get and validate dump target
     target = parsed_options.target
     use_best_secondary = parsed_options.useBestSecondary
+    per_shard = parsed_options.perShard
+    native_workers = None
+    if parsed_options.nativeDump:
+        native_workers = int(parsed_options.nativeWorkers or
+                             DEFAULT_NATIVE_DUMP_WORKERS)
+    stream_options = None
+    if parsed_options.compress:
+        if parsed_options.compress not in STREAM_COMPRESSIONS:
+            raise MongoctlException("Unknown compression '%s'. Please select"
+                                    " from %s" %
+                                    (parsed_options.compress,
+                                     sorted(STREAM_COMPRESSIONS.keys())))
+        chunk_size_mb = int(parsed_options.chunkSize or
+                            DEFAULT_STREAM_CHUNK_SIZE_MB)
+        stream_options = {
+            "compression": parsed_options.compress,
+            "chunk_size": chunk_size_mb * 1024 * 1024
+        }
     #max_repl_lag = parsed_options.maxReplLag
     is_addr = is_db_address(target)
     is_path = is_dbpath(target)
@@ -62,6 +133,20 @@ def dump_command(parsed_options):
         raise MongoctlException("Invalid target value '%s'. Target has to be"
                                 " a valid db address or dbpath." % target)
     dump_options = extract_mongo_dump_options(parsed_options)
+    start_oplog_chain = parsed_options.startOplogChain
+    if start_oplog_chain and (parsed_options.oplogSlice or not is_addr):
+        raise MongoctlException("--start-oplog-chain can only be used with "
+                                "full dumps of a db address")
+
+    if parsed_options.oplogSlice:
+        if not is_addr:
+            raise MongoctlException("Oplog slices can only be dumped from a "
+                                    "db address")
+        mongo_dump_oplog_slice_db_address(target,
+                                          dump_options.get("out") or "dump",
+                                          username=parsed_options.username,
+                                          password=parsed_options.password)
+        return
 
     if is_addr:
         mongo_dump_db_address(target,
@@ -69,10 +154,18 @@ def dump_command(parsed_options):
                               password=parsed_options.password,
                               use_best_secondary=use_best_secondary,
                               max_repl_lag=None,
-                              dump_options=dump_options)
+                              dump_options=dump_options,
+                              per_shard=per_shard,
+                              native_workers=native_workers,
+                              stream_options=stream_options,
+                              start_oplog_chain=start_oplog_chain)
     else:
+        if native_workers:
+            raise MongoctlException("Native dump is not supported for "
+                                    "dbpaths")
         dbpath = resolve_path(target)
-        mongo_dump_db_path(dbpath, dump_options=dump_options)
+        mongo_dump_db_path(dbpath, dump_options=dump_options,
+                           stream_options=stream_options)
 
 ###############################################################################
 # mongo_dump
@@ -82,12 +175,20 @@ def mongo_dump_db_address(db_address,
                           password=None,
                           use_best_secondary=False,
                           max_repl_lag=None,
-                          dump_options=None):
+                          dump_options=None,
+                          per_shard=False,
+                          native_workers=None,
+                          stream_options=None,
+                          start_oplog_chain=False):
 
     if is_mongo_uri(db_address):
         mongo_dump_uri(uri=db_address, username=username, password=password,
                        use_best_secondary=use_best_secondary,
-                       dump_options=dump_options)
+                       dump_options=dump_options,
+                       per_shard=per_shard,
+                       native_workers=native_workers,
+                       stream_options=stream_options,
+                       start_oplog_chain=start_oplog_chain)
         return
 
     # db_address is an id string
@@ -98,7 +199,10 @@ def mongo_dump_db_address(db_address,
     server = repository.lookup_server(id)
     if server:
         mongo_dump_server(server, database=database, username=username,
-                          password=password, dump_options=dump_options)
+                          password=password, dump_options=dump_options,
+                          native_workers=native_workers,
+                          stream_options=stream_options,
+                          start_oplog_chain=start_oplog_chain)
         return
     else:
         cluster = repository.lookup_cluster(id)
@@ -107,24 +211,33 @@ def mongo_dump_db_address(db_address,
                                password=password,
                                use_best_secondary=use_best_secondary,
                                max_repl_lag=max_repl_lag,
-                               dump_options=dump_options)
+                               dump_options=dump_options,
+                               per_shard=per_shard,
+                               native_workers=native_workers,
+                               stream_options=stream_options,
+                               start_oplog_chain=start_oplog_chain)
             return
 
             # Unknown destination
     raise MongoctlException("Unknown db address '%s'" % db_address)
 
 ###############################################################################
-def mongo_dump_db_path(dbpath, dump_options=None):
+def mongo_dump_db_path(dbpath, dump_options=None, stream_options=None):
 
     do_mongo_dump(dbpath=dbpath,
-                  dump_options=dump_options)
+                  dump_options=dump_options,
+                  stream_options=stream_options)
 
 ###############################################################################
 def mongo_dump_uri(uri,
                    username=None,
                    password=None,
                    use_best_secondary=False,
-                   dump_options=None):
+                   dump_options=None,
+                   per_shard=False,
+                   native_workers=None,
+                   stream_options=None,
+                   start_oplog_chain=False):
 
     uri_wrapper = parse_mongo_uri(uri)
     database = uri_wrapper.database
@@ -138,21 +251,31 @@ def mongo_dump_uri(uri,
                           database=database,
                           username=username,
                           password=password,
-                          dump_options=dump_options)
+                          dump_options=dump_options,
+                          native_workers=native_workers,
+                          stream_options=stream_options,
+                          start_oplog_chain=start_oplog_chain)
     else:
         mongo_dump_cluster(server_or_cluster,
                            database=database,
                            username=username,
                            password=password,
                            use_best_secondary=use_best_secondary,
-                           dump_options=dump_options)
+                           dump_options=dump_options,
+                           per_shard=per_shard,
+                           native_workers=native_workers,
+                           stream_options=stream_options,
+                           start_oplog_chain=start_oplog_chain)
 
 ###############################################################################
 def mongo_dump_server(server,
                       database=None,
                       username=None,
                       password=None,
-                      dump_options=None):
+                      dump_options=None,
+                      native_workers=None,
+                      stream_options=None,
+                      start_oplog_chain=False):
     repository.validate_server(server)
 
     auth_db = database or "admin"
@@ -163,15 +286,105 @@ def mongo_dump_server(server,
         if not password:
             password = server.lookup_password("admin", username)
 
+    # a full dump of a replica set member can start an oplog slice chain.
+    # Entries written during the dump get replayed again by the first slice,
+    # which is harmless since oplog replay is idempotent
+    checkpoint_ts = None
+    out_dir = (dump_options or {}).get("out") or "dump"
+    if start_oplog_chain:
+        if not is_full_dump(database, dump_options):
+            raise MongoctlException("An oplog slice chain can only start with"
+                                    " a full dump (no database, collection "
+                                    "or query)")
+        checkpoint_ts = get_server_oplog_checkpoint(server, username=username,
+                                                    password=password)
+        if not checkpoint_ts:
+            raise MongoctlException("Unable to start an oplog slice chain: "
+                                    "cannot read the oplog of server '%s'. "
+                                    "Is it a replica set member?" % server.id)
+
+    if native_workers:
+        if stream_options:
+            raise MongoctlException("Streaming (--compress) is not supported"
+                                    " with native dump")
+        mongo_native_dump_server(server, database=database,
+                                 username=username, password=password,
+                                 dump_options=dump_options,
+                                 workers=native_workers)
+    else:
+        do_mongo_dump(host=server.get_connection_host_address(),
+                      port=server.get_port(),
+                      database=database,
+                      username=username,
+                      password=password,
+                      version_info=server.get_mongo_version_info(),
+                      dump_options=dump_options,
+                      ssl=server.use_ssl_client(),
+                      stream_options=stream_options)
+
+    if checkpoint_ts:
+        record_full_dump_checkpoint(out_dir, server, checkpoint_ts)
 
-    do_mongo_dump(host=server.get_connection_host_address(),
-                  port=server.get_port(),
-                  database=database,
-                  username=username,
-                  password=password,
-                  version_info=server.get_mongo_version_info(),
-                  dump_options=dump_options,
-                  ssl=server.use_ssl_client())
+###############################################################################
+def is_full_dump(database, dump_options):
+    dump_options = dump_options or {}
+    return (not database and not dump_options.get("collection") and
+            not dump_options.get("query"))
+
+###############################################################################
+def mongo_dump_oplog_slice_db_address(db_address, backup_dir,
+                                      username=None,
+                                      password=None):
+    """
+    Incremental backup: dumps the oplog entries written since the last full
+    dump (or slice) in backup_dir, from the best secondary of a cluster
+    """
+    if is_mongo_uri(db_address):
+        server_or_cluster = repository.build_server_or_cluster_from_uri(
+            db_address)
+    else:
+        server_or_cluster = (repository.lookup_server(db_address) or
+                             repository.lookup_cluster(db_address))
+    if not server_or_cluster:
+        raise MongoctlException("Unknown db address '%s'" % db_address)
+
+    if isinstance(server_or_cluster, ShardedCluster):
+        raise MongoctlException("Oplog slices of a sharded cluster have to be"
+                                " dumped per shard into the shard's dir of a"
+                                " --per-shard dump")
+    elif isinstance(server_or_cluster, ReplicaSetCluster):
+        server, use_oplog = get_shard_dump_server(server_or_cluster)
+    else:
+        server = server_or_cluster
+
+    dump_oplog_slice(server, backup_dir, username=username,
+                     password=password)
+
+###############################################################################
+def mongo_native_dump_server(server,
+                             database=None,
+                             username=None,
+                             password=None,
+                             dump_options=None,
+                             workers=DEFAULT_NATIVE_DUMP_WORKERS):
+    dump_options = dump_options or {}
+    unsupported = [name for name in dump_options
+                   if name not in NATIVE_DUMP_OPTIONS]
+    if unsupported:
+        raise MongoctlException("Native dump does not support option(s) %s."
+                                " Use mongodump instead." %
+                                ", ".join(sorted(unsupported)))
+
+    out_dir = dump_options.get("out") or "dump"
+    log_info("Dumping server '%s' into '%s' (native dump, %s workers)..." %
+             (server.id, out_dir, workers))
+    native_dump(server, out_dir,
+                database=database,
+                collection=dump_options.get("collection"),
+                query=dump_options.get("query"),
+                username=username,
+                password=password,
+                workers=workers)
 
 ###############################################################################
 def mongo_dump_cluster(cluster,
@@ -180,28 +393,65 @@ def mongo_dump_cluster(cluster,
                        password=None,
                        use_best_secondary=False,
                        max_repl_lag=False,
-                       dump_options=None):
+                       dump_options=None,
+                       per_shard=False,
+                       native_workers=None,
+                       stream_options=None,
+                       start_oplog_chain=False):
     repository.validate_cluster(cluster)
 
-    if use_best_secondary:
+    if per_shard:
+        if not isinstance(cluster, ShardedCluster):
+            raise MongoctlException("Per shard dump is only supported for "
+                                    "sharded clusters. '%s' is not a sharded"
+                                    " cluster." % cluster.id)
+        if database:
+            raise MongoctlException("Per shard dump can only dump all "
+                                    "databases (it uses --oplog)")
+        # checked here, before the balancer is stopped
+        if native_workers:
+            raise MongoctlException("Per shard dump does not support native "
+                                    "dump (it uses --oplog)")
+        if stream_options:
+            raise MongoctlException("Per shard dump does not support "
+                                    "--compress (restore expects BSON "
+                                    "dump directories)")
+        mongo_dump_sharded_cluster(cluster,
+                                   username=username,
+                                   password=password,
+                                   max_repl_lag=max_repl_lag,
+                                   dump_options=dump_options,
+                                   native_workers=native_workers,
+                                   stream_options=stream_options,
+                                   start_oplog_chain=start_oplog_chain)
+    elif use_best_secondary:
         mongo_dump_cluster_best_secondary(cluster=cluster,
                                           max_repl_lag=max_repl_lag,
                                           database=database,
                                           username=username,
                                           password=password,
-                                          dump_options=dump_options)
+                                          dump_options=dump_options,
+                                          native_workers=native_workers,
+                                          stream_options=stream_options,
+                                          start_oplog_chain=start_oplog_chain)
     else:
         mongo_dump_cluster_primary(cluster=cluster,
                                    database=database,
                                    username=username,
                                    password=password,
-                                   dump_options=dump_options)
+                                   dump_options=dump_options,
+                                   native_workers=native_workers,
+                                   stream_options=stream_options,
+                                   start_oplog_chain=start_oplog_chain)
 ###############################################################################
 def mongo_dump_cluster_primary(cluster,
                                database=None,
                                username=None,
                                password=None,
-                               dump_options=None):
+                               dump_options=None,
+                               native_workers=None,
+                               stream_options=None,
+                               start_oplog_chain=False):
     log_info("Locating default server for cluster '%s'..." % cluster.id)
     default_server = cluster.get_default_server()
     if default_server:
@@ -210,7 +460,10 @@ def mongo_dump_cluster_primary(cluster,
                           database=database,
                           username=username,
                           password=password,
-                          dump_options=dump_options)
+                          dump_options=dump_options,
+                          native_workers=native_workers,
+                          stream_options=stream_options,
+                          start_oplog_chain=start_oplog_chain)
     else:
         raise MongoctlException("No default server found for cluster '%s'" %
                                 cluster.id)
@@ -222,7 +475,10 @@ def mongo_dump_cluster_best_secondary(cluster,
                                       database=None,
                                       username=None,
                                       password=None,
-                                      dump_options=None):
+                                      dump_options=None,
+                                      native_workers=None,
+                                      stream_options=None,
+                                      start_oplog_chain=False):
 
     #max_repl_lag = max_repl_lag or 3600
     log_info("Finding best secondary server for cluster '%s' with replication"
@@ -234,11 +490,129 @@ def mongo_dump_cluster_best_secondary(cluster,
 
         log_info("Found secondary server '%s'. Dumping..." % server.id)
         mongo_dump_server(server, database=database, username=username,
-                          password=password, dump_options=dump_options)
+                          password=password, dump_options=dump_options,
+                          native_workers=native_workers,
+                          stream_options=stream_options,
+                          start_oplog_chain=start_oplog_chain)
     else:
         raise MongoctlException("No secondary server found for cluster '%s'" %
                                 cluster.id)
 
+###############################################################################
+def mongo_dump_sharded_cluster(cluster,
+                               username=None,
+                               password=None,
+                               max_repl_lag=None,
+                               dump_options=None,
+                               native_workers=None,
+                               stream_options=None,
+                               start_oplog_chain=False):
+    """
+    Dumps the config servers and every shard of the sharded cluster in
+    parallel, each one from its best secondary with --oplog, while the
+    balancer is stopped. Layout of the output dir:
+        sharded_dump.json    manifest (see restore)
+        config/              dump of the config servers
+        shards/<shard id>/   dump of each shard
+    """
+    dump_options = dict(dump_options or {})
+    out_dir = dump_options.pop("out", None) or "dump"
+    dump_options.pop("oplog", None)
+
+    targets = [(SHARDED_DUMP_CONFIG_DIR, cluster.config_servers)]
+    for shard_member in cluster.shards:
+        shard = shard_member.get_member_cluster_or_server()
+        targets.append((os.path.join(SHARDED_DUMP_SHARDS_DIR, shard.id),
+                        shard))
+
+    # config.shards refers to shards by the name addShard returned
+    shard_names = cluster.get_shard_names()
+
+    balancer_was_enabled = cluster.is_balancer_enabled()
+    if balancer_was_enabled:
+        cluster.stop_balancer()
+
+    try:
+        def dump_target(target):
+            rel_dir, server_or_cluster = target
+            server, use_oplog = get_shard_dump_server(server_or_cluster,
+                                                      max_repl_lag)
+            log_info("Dumping '%s' from server '%s' into '%s'..." %
+                     (rel_dir, server.id, os.path.join(out_dir, rel_dir)))
+            target_options = dict(dump_options)
+            target_options["out"] = os.path.join(out_dir, rel_dir)
+            if use_oplog:
+                target_options["oplog"] = True
+            mongo_dump_server(server, username=username, password=password,
+                              dump_options=target_options,
+                              native_workers=native_workers,
+                              stream_options=stream_options,
+                              start_oplog_chain=(start_oplog_chain and
+                                                 use_oplog))
+            return use_oplog
+
+        results = parallel_map(dump_target, targets,
+                               max_workers=len(targets))
+        failed = [(t, ex) for t, use_oplog, ex in results if ex is not None]
+        if failed:
+            raise MongoctlException("Failed to dump %s of sharded cluster "
+                                    "'%s'. First error: %s" %
+                                    (", ".join([t[0] for t, ex in failed]),
+                                     cluster.id, failed[0][1]))
+    finally:
+        if balancer_was_enabled:
+            cluster.start_balancer()
+
+    manifest = {
+        "cluster": cluster.id,
+        "balancerEnabled": balancer_was_enabled,
+        "config": {
+            "dir": SHARDED_DUMP_CONFIG_DIR,
+            "oplog": results[0][1]
+        },
+        "shards": [{"_id": t[1].id, "dir": t[0],
+                    "name": shard_names.get(t[1].id, t[1].id),
+                    "oplog": use_oplog}
+                   for t, use_oplog, ex in results[1:]]
+    }
+    with open(os.path.join(out_dir, SHARDED_DUMP_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    log_info("Sharded cluster '%s' dumped successfully into '%s'" %
+             (cluster.id, out_dir))
+
+###############################################################################
+def get_shard_dump_server(server_or_cluster, max_repl_lag=None):
+    """
+    Returns a (server, use oplog) tuple for dumping a shard or the config
+    servers: the best secondary of a replica set (primary if there is none)
+    or an online server of a standalone shard / legacy config servers
+    """
+    if isinstance(server_or_cluster, ReplicaSetCluster):
+        best_secondary = server_or_cluster.get_dump_best_secondary(
+            max_repl_lag=max_repl_lag)
+        if best_secondary:
+            return best_secondary.get_server(), True
+
+        log_warning("No secondary server found for cluster '%s'. Dumping "
+                    "from primary..." % server_or_cluster.id)
+        primary_server = server_or_cluster.get_primary_server()
+        if not primary_server:
+            raise MongoctlException("No primary server found for cluster "
+                                    "'%s'" % server_or_cluster.id)
+        return primary_server, True
+
+    servers = server_or_cluster
+    if isinstance(servers, Server):
+        servers = [servers]
+    for server in servers:
+        if server.is_online():
+            # --oplog needs a replica set member
+            return server, False
+
+    raise MongoctlException("No online server found among %s" %
+                            ", ".join([s.id for s in servers]))
+
 ###############################################################################
 def do_mongo_dump(host=None,
                   port=None,
@@ -248,11 +622,24 @@ def do_mongo_dump(host=None,
                   password=None,
                   version_info=None,
                   dump_options=None,
-                  ssl=False):
-
+                  ssl=False,
+                  stream_options=None):
+    """
+    Runs mongodump. If stream_options is specified, mongodump writes an
+    --archive to its stdout which is compressed and written in chunks to the
+    'out' dir (see stream_dump_archive())
+    """
+
+    stream_out_dir = None
+    if stream_options:
+        dump_options = dict(dump_options or {})
+        stream_out_dir = dump_options.pop("out", None) or "dump"
 
     # create dump command with host and port
-    dump_cmd = [get_mongo_dump_executable(version_info)]
+    dump_exe = get_mongo_dump_executable(version_info)
+    if stream_options:
+        validate_archive_dump_executable(dump_exe)
+    dump_cmd = [dump_exe.path]
 
     # ssl options
     if ssl:
@@ -295,6 +682,9 @@ def do_mongo_dump(host=None,
     if dump_options and "out" in dump_options:
         ensure_dir(dump_options["out"])
 
+    if stream_options:
+        dump_cmd.append("--archive")
+
     cmd_display =  dump_cmd[:]
     # mask user/password
     if username:
@@ -305,7 +695,118 @@ def do_mongo_dump(host=None,
 
 
     log_info("Executing command: \n%s" % " ".join(cmd_display))
-    call_command(dump_cmd, bubble_exit_code=True)
+    if stream_options:
+        stream_dump_archive(dump_cmd, stream_out_dir, **stream_options)
+    else:
+        call_command(dump_cmd, bubble_exit_code=True)
+
+###############################################################################
+def stream_dump_archive(dump_cmd, out_dir, compression="gzip",
+                        chunk_size=DEFAULT_STREAM_CHUNK_SIZE_MB * 1024 * 1024):
+    """
+    Runs dump_cmd (which writes an archive to stdout) and writes its output,
+    compressed on the fly by a separate process (or thread), into
+    out_dir/dump.archive[.ext].NNN chunks with sha256 checksums computed as
+    data flows. The data is only written once.
+    """
+    extension, compressor_exes = STREAM_COMPRESSIONS[compression]
+    ensure_dir(out_dir)
+    archive_path = os.path.join(out_dir, STREAM_ARCHIVE_NAME + extension)
+    writer = ChunkedChecksumWriter(archive_path, chunk_size)
+
+    processes = []
+    dump_process = subprocess.Popen(dump_cmd, stdout=subprocess.PIPE)
+    processes.append((dump_cmd[0], dump_process))
+
+    compressor_cmd = None
+    for exe_name, args in compressor_exes:
+        exe_path = which(exe_name)
+        if exe_path:
+            compressor_cmd = [exe_path] + args
+            break
+
+    compress_thread = None
+    if compressor_cmd:
+        log_info("Compressing dump stream with '%s'" %
+                 " ".join(compressor_cmd))
+        compressor = subprocess.Popen(compressor_cmd,
+                                      stdin=dump_process.stdout,
+                                      stdout=subprocess.PIPE)
+        # compressor owns the pipe now
+        dump_process.stdout.close()
+        processes.append((compressor_cmd[0], compressor))
+        blocks = iter(lambda: compressor.stdout.read(STREAM_BLOCK_SIZE), "")
+    elif compression == "gzip":
+        log_info("No gzip executable found. Compressing dump stream "
+                 "in-process")
+        block_queue = Queue.Queue(maxsize=16)
+        compress_thread = threading.Thread(
+            target=gzip_stream_blocks, args=(dump_process.stdout, block_queue))
+        compress_thread.daemon = True
+        compress_thread.start()
+        blocks = iter_queued_blocks(block_queue)
+    elif compression == "none":
+        blocks = iter(lambda: dump_process.stdout.read(STREAM_BLOCK_SIZE), "")
+    else:
+        dump_process.kill()
+        raise MongoctlException("Unable to find a '%s' executable in your "
+                                "path" % compression)
+
+    try:
+        for block in blocks:
+            writer.write(block)
+    except Exception:
+        for name, process in processes:
+            if process.poll() is None:
+                process.kill()
+        raise
+    finally:
+        stream_checksum = writer.close()
+
+    for name, process in processes:
+        exit_code = process.wait()
+        if exit_code != 0:
+            raise MongoctlException("Streaming dump failed: '%s' exited with"
+                                    " code %s" % (name, exit_code))
+    if compress_thread:
+        compress_thread.join()
+
+    log_info("Dump stream written to '%s' (%s chunk(s), %.1f MB, sha256 %s)"
+             % (archive_path, len(writer.chunk_checksums),
+                writer.byte_count / 1048576.0, stream_checksum))
+
+###############################################################################
+def gzip_stream_blocks(in_stream, block_queue):
+    """
+    Puts gzip compressed blocks of in_stream into block_queue followed by
+    STREAM_END, or by the exception that stopped the compression
+    """
+    try:
+        # wbits 16 + MAX_WBITS => gzip container
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for block in iter(lambda: in_stream.read(STREAM_BLOCK_SIZE), ""):
+            compressed = compressor.compress(block)
+            if compressed:
+                block_queue.put(compressed)
+        block_queue.put(compressor.flush())
+        block_queue.put(STREAM_END)
+    except Exception, e:
+        block_queue.put(e)
+
+###############################################################################
+def iter_queued_blocks(block_queue):
+    """
+    Yields the blocks put by gzip_stream_blocks() until STREAM_END. Raises
+    if the compression failed
+    """
+    while True:
+        block = block_queue.get()
+        if block is STREAM_END:
+            return
+        elif isinstance(block, Exception):
+            raise MongoctlException("Compressing the dump stream failed: %s"
+                                    % block)
+        yield block
 
 
 ###############################################################################
@@ -324,4 +825,12 @@ def get_mongo_dump_executable(version_info):
         log_warning("Using mongodump '%s' that does not exactly match "
                     "server version '%s'" % (dump_exe.version, version_info))
 
-    return dump_exe.path
+    return dump_exe
+
+###############################################################################
+def validate_archive_dump_executable(dump_exe):
+    if dump_exe.version and dump_exe.version < MIN_ARCHIVE_DUMP_VERSION:
+        raise MongoctlException("Streaming dumps need mongodump %s or later "
+                                "(--archive). mongodump at '%s' is version "
+                                "'%s'." % (MIN_ARCHIVE_DUMP_VERSION,
+                                           dump_exe.path, dump_exe.version))
@@ -0,0 +1,255 @@
+__author__ = 'abdul'
+
+import os
+import gzip
+import time
+
+import bson
+from bson.son import SON
+from bson.timestamp import Timestamp
+from bson.codec_options import CodecOptions
+from pymongo import ReplaceOne, UpdateOne, DeleteOne
+
+from mongoctl.utils import parallel_map
+from mongoctl.mongoctl_logging import log_info, log_verbose, log_warning
+from mongoctl.errors import MongoctlException
+from mongoctl.commands.common.oplog_slices import (
+    read_oplog_checkpoint, format_ts
+)
+
+###############################################################################
+# CONSTS
+###############################################################################
+# max number of oplog entries applied per batch
+DEFAULT_REPLAY_BATCH_SIZE = 5000
+
+# max number of namespaces of a batch applied at the same time
+DEFAULT_REPLAY_WORKERS = 8
+
+# oplog file written by mongodump --oplog
+DUMP_OPLOG_FILE = "oplog.bson"
+
+# largest inc, i.e. a "<seconds>" timestamp includes all ops of that second
+MAX_TS_INC = 0xFFFFFFFF
+
+# namespaces whose ops are never replayed
+SKIPPED_NS_PREFIXES = ["local.", "config.system.sessions",
+                       "config.transactions"]
+
+# oplog entries keep their field order: it matters for (embedded) _id
+# matches and for the documents written
+OPLOG_CODEC_OPTIONS = CodecOptions(document_class=SON)
+
+###############################################################################
+def parse_timestamp(value):
+    """
+    Parses "<seconds>[:<inc>]". Without an inc, the timestamp includes all
+    ops of that second
+    """
+    try:
+        parts = value.split(":")
+        if len(parts) == 1:
+            return Timestamp(int(parts[0]), MAX_TS_INC)
+        elif len(parts) == 2:
+            return Timestamp(int(parts[0]), int(parts[1]))
+    except (ValueError, TypeError):
+        pass
+    raise MongoctlException("Invalid timestamp '%s'. Expected "
+                            "<seconds>[:<increment>]" % value)
+
+###############################################################################
+def get_replay_sources(backup_dir, until_ts):
+    """
+    Returns the oplog files to replay, in order, for restoring the dump in
+    backup_dir up to until_ts: the dump's oplog.bson (if any) then its
+    oplog slices. Fails if they do not reach until_ts.
+    """
+    checkpoint = read_oplog_checkpoint(backup_dir)
+    if not checkpoint:
+        raise MongoctlException("No oplog checkpoint found in '%s'. Point in"
+                                " time restore needs a full dump taken by "
+                                "mongoctl with --start-oplog-chain." %
+                                backup_dir)
+    if until_ts < checkpoint["fullDumpTs"]:
+        raise MongoctlException("Cannot restore to %s: the full dump in '%s'"
+                                " starts at %s" %
+                                (format_ts(until_ts), backup_dir,
+                                 format_ts(checkpoint["fullDumpTs"])))
+
+    sources = []
+    dump_oplog = os.path.join(backup_dir, DUMP_OPLOG_FILE)
+    if os.path.exists(dump_oplog):
+        sources.append(dump_oplog)
+
+    chain_ts = checkpoint["fullDumpTs"]
+    for slice_info in checkpoint["slices"]:
+        if slice_info["startTs"] != chain_ts:
+            raise MongoctlException("Oplog slice chain of '%s' is broken at "
+                                    "%s" % (backup_dir, format_ts(chain_ts)))
+        if chain_ts >= until_ts:
+            break
+        sources.append(os.path.join(backup_dir, slice_info["file"]))
+        chain_ts = slice_info["endTs"]
+
+    # a "<seconds>" target is reached once the slices get into that second
+    if until_ts.inc == MAX_TS_INC:
+        covered = chain_ts.time >= until_ts.time
+    else:
+        covered = chain_ts >= until_ts
+
+    if not covered:
+        raise MongoctlException("Oplog slices of '%s' end at %s. Cannot "
+                                "restore to %s. Dump a new oplog slice "
+                                "first." % (backup_dir, format_ts(chain_ts),
+                                            format_ts(until_ts)))
+    elif chain_ts < until_ts:
+        log_warning("Oplog slices of '%s' end at %s. Ops after it (within "
+                    "the same second) will not be replayed." %
+                    (backup_dir, format_ts(chain_ts)))
+    return sources
+
+###############################################################################
+def iter_oplog_entries(sources, until_ts):
+    """
+    Yields the entries of the oplog files in ts order up to until_ts,
+    skipping the ones already covered by a previous file
+    """
+    last_ts = None
+    for path in sources:
+        if path.endswith(".gz"):
+            oplog_file = gzip.open(path, "rb")
+        else:
+            oplog_file = open(path, "rb")
+        try:
+            for entry in bson.decode_file_iter(oplog_file,
+                                               OPLOG_CODEC_OPTIONS):
+                ts = entry["ts"]
+                if last_ts is not None and ts <= last_ts:
+                    continue
+                if ts > until_ts:
+                    return
+                last_ts = ts
+                yield entry
+        finally:
+            oplog_file.close()
+
+###############################################################################
+def replay_oplog(server, sources, until_ts, username=None, password=None,
+                 batch_size=DEFAULT_REPLAY_BATCH_SIZE,
+                 workers=DEFAULT_REPLAY_WORKERS, throttle=None):
+    """
+    Applies the oplog entries of sources up to until_ts to server. CRUD ops
+    are applied in batches: each batch is grouped by namespace and each
+    namespace is applied with one ordered bulk write, up to workers
+    namespaces at a time. Commands (and ops that cannot be expressed as bulk
+    writes) are applied on their own with applyOps, between batches. Ops
+    are applied through a client with a socket per worker and no socket
+    timeout (see Server.get_worker_db()). With a throttle (see
+    ReplicationLagThrottle), each batch waits for the replica set to catch
+    up.
+    """
+    log_info("Replaying oplog on server '%s' up to %s..." %
+             (server.id, format_ts(until_ts)))
+    start_time = time.time()
+    stats = {"applied": 0, "lastTs": None}
+    batch = []
+
+    def flush():
+        if batch:
+            if throttle:
+                throttle.wait_for_lag()
+            apply_crud_batch(server, batch, username=username,
+                             password=password, workers=workers)
+            stats["applied"] += len(batch)
+            del batch[:]
+
+    for entry in iter_oplog_entries(sources, until_ts):
+        stats["lastTs"] = entry["ts"]
+        if entry["op"] == "n" or is_skipped_ns(entry.get("ns", "")):
+            continue
+
+        write = oplog_entry_to_write(entry)
+        if write is None:
+            # command (or unsupported op): a barrier for the batch
+            flush()
+            apply_ops_entry(server, entry, username=username,
+                            password=password, workers=workers)
+            stats["applied"] += 1
+        else:
+            batch.append((entry["ns"], write))
+            if len(batch) >= batch_size:
+                flush()
+                log_verbose("Replayed %s ops (at %s)" %
+                            (stats["applied"], format_ts(entry["ts"])))
+    flush()
+
+    duration = max(time.time() - start_time, 0.001)
+    log_info("Replayed %s oplog ops in %.1f secs (%.0f ops/s). Last applied"
+             " op: %s" % (stats["applied"], duration,
+                          stats["applied"] / duration,
+                          stats["lastTs"] and format_ts(stats["lastTs"])))
+    return stats["lastTs"]
+
+###############################################################################
+def is_skipped_ns(ns):
+    return any([ns.startswith(prefix) for prefix in SKIPPED_NS_PREFIXES])
+
+###############################################################################
+def oplog_entry_to_write(entry):
+    """
+    Returns the idempotent pymongo bulk write op for a CRUD oplog entry or
+    None if the entry has to be applied with applyOps
+    """
+    op = entry["op"]
+    if entry["ns"].endswith(".system.indexes"):
+        return None
+    elif op == "i":
+        doc = entry["o"]
+        return ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+    elif op == "d":
+        return DeleteOne(entry["o"])
+    elif op == "u":
+        update = entry["o"]
+        if update.get("$v", 1) != 1:
+            # delta updates (4.x+) only make sense to the server
+            return None
+        update = SON([(k, v) for k, v in update.items() if k != "$v"])
+        if any([k.startswith("$") for k in update]):
+            return UpdateOne(entry["o2"], update, upsert=True)
+        return ReplaceOne(entry["o2"], update, upsert=True)
+
+###############################################################################
+def apply_crud_batch(server, batch, username=None, password=None,
+                     workers=DEFAULT_REPLAY_WORKERS):
+    by_ns = {}
+    ns_order = []
+    for ns, write in batch:
+        if ns not in by_ns:
+            by_ns[ns] = []
+            ns_order.append(ns)
+        by_ns[ns].append(write)
+
+    def apply_ns(ns):
+        db_name, coll_name = ns.split(".", 1)
+        db = server.get_worker_db(db_name, workers, username=username,
+                                  password=password)
+        db[coll_name].bulk_write(by_ns[ns], ordered=True)
+
+    results = parallel_map(apply_ns, ns_order, max_workers=workers)
+    failed = [(ns, ex) for ns, result, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to replay oplog ops on %s. First "
+                                "error: %s" %
+                                (", ".join([ns for ns, ex in failed]),
+                                 failed[0][1]))
+
+###############################################################################
+def apply_ops_entry(server, entry, username=None, password=None,
+                    workers=DEFAULT_REPLAY_WORKERS):
+    admin_db = server.get_worker_db("admin", workers, username=username,
+                                    password=password)
+    try:
+        admin_db.command("applyOps", [entry])
+    except Exception, e:
+        raise MongoctlException("Failed to replay oplog op %s at %s: %s" %
+                                (entry.get("op"), format_ts(entry["ts"]), e))
@@ -0,0 +1,175 @@
+__author__ = 'abdul'
+
+import os
+import gzip
+import hashlib
+
+import pymongo
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from mongoctl.utils import ensure_dir
+from mongoctl.mongoctl_logging import log_info, log_warning, log_verbose
+from mongoctl.errors import MongoctlException
+
+###############################################################################
+# CONSTS
+###############################################################################
+# written in a dump's out dir. Records the oplog position the dump (and
+# the slices taken after it) covers
+OPLOG_CHECKPOINT_FILE = "oplog_checkpoint.json"
+
+OPLOG_SLICES_DIR = "oplog_slices"
+
+OPLOG_SLICE_EXTENSION = ".bson.gz"
+
+OPLOG_NS = "oplog.rs"
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+###############################################################################
+def get_oplog_collection(server, username=None, password=None):
+    local_db = server.get_db("local", username=username, password=password)
+    return local_db[OPLOG_NS]
+
+###############################################################################
+def get_oplog_ts(oplog, direction=pymongo.DESCENDING):
+    """
+    Returns the ts of the newest (or oldest) oplog entry or None if there is
+    no oplog
+    """
+    entry = oplog.find_one({}, projection={"ts": 1},
+                           sort=[("$natural", direction)])
+    return entry and entry["ts"]
+
+###############################################################################
+def get_server_oplog_checkpoint(server, username=None, password=None):
+    """
+    Returns the latest oplog ts of server to be recorded with a full dump or
+    None if it has no oplog (i.e. not a replica set member)
+    """
+    try:
+        oplog = get_oplog_collection(server, username=username,
+                                     password=password)
+        return get_oplog_ts(oplog)
+    except Exception, e:
+        log_verbose("Unable to read oplog of server '%s': %s" % (server.id, e))
+
+###############################################################################
+def read_oplog_checkpoint(backup_dir):
+    path = os.path.join(backup_dir, OPLOG_CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json_util.loads(f.read())
+
+###############################################################################
+def write_oplog_checkpoint(backup_dir, checkpoint):
+    """
+    Atomically (re)writes the checkpoint file of backup_dir
+    """
+    ensure_dir(backup_dir)
+    path = os.path.join(backup_dir, OPLOG_CHECKPOINT_FILE)
+    tmp_path = "%s.tmp" % path
+    with open(tmp_path, "w") as f:
+        f.write(json_util.dumps(checkpoint, indent=4))
+    os.rename(tmp_path, path)
+
+###############################################################################
+def record_full_dump_checkpoint(backup_dir, server, ts):
+    """
+    Starts a new slice chain for a full dump that began at oplog ts
+    """
+    write_oplog_checkpoint(backup_dir, {
+        "server": server.id,
+        "fullDumpTs": ts,
+        "ts": ts,
+        "slices": []
+    })
+    log_info("Recorded oplog checkpoint %s in '%s'" %
+             (format_ts(ts), backup_dir))
+
+###############################################################################
+def dump_oplog_slice(server, backup_dir, username=None, password=None):
+    """
+    Writes the oplog entries of server since the checkpoint of backup_dir
+    (see record_full_dump_checkpoint()) into a gzipped slice file under
+    backup_dir/oplog_slices and moves the checkpoint forward. Fails if the
+    oplog no longer goes back to the checkpoint.
+    """
+    checkpoint = read_oplog_checkpoint(backup_dir)
+    if not checkpoint:
+        raise MongoctlException("No oplog checkpoint found in '%s'. Take a "
+                                "full dump into it with --start-oplog-chain "
+                                "first." % backup_dir)
+
+    oplog = get_oplog_collection(server, username=username,
+                                 password=password)
+    start_ts = checkpoint["ts"]
+    oldest_ts = get_oplog_ts(oplog, direction=pymongo.ASCENDING)
+    end_ts = get_oplog_ts(oplog)
+    if oldest_ts is None:
+        raise MongoctlException("Server '%s' has no oplog" % server.id)
+
+    if oldest_ts > start_ts:
+        msg = ("The oplog of server '%s' no longer covers the gap since the "
+               "last checkpoint: it starts at %s but the checkpoint is %s. "
+               "Take a new full dump with --start-oplog-chain." %
+               (server.id, format_ts(oldest_ts), format_ts(start_ts)))
+        log_warning(msg)
+        raise MongoctlException(msg)
+
+    if end_ts <= start_ts:
+        log_info("No new oplog entries since checkpoint %s" %
+                 format_ts(start_ts))
+        return
+
+    slices_dir = os.path.join(backup_dir, OPLOG_SLICES_DIR)
+    ensure_dir(slices_dir)
+    slice_name = "%s-%s%s" % (ts_file_part(start_ts), ts_file_part(end_ts),
+                              OPLOG_SLICE_EXTENSION)
+    slice_path = os.path.join(slices_dir, slice_name)
+    tmp_path = "%s.tmp" % slice_path
+
+    log_info("Dumping oplog of server '%s' from %s to %s into '%s'..." %
+             (server.id, format_ts(start_ts), format_ts(end_ts), slice_path))
+
+    query = {
+        "ts": {"$gt": start_ts, "$lte": end_ts},
+        # periodic no-ops are not needed for replay
+        "op": {"$ne": "n"}
+    }
+    raw_oplog = oplog.with_options(codec_options=RAW_CODEC_OPTIONS)
+    checksum = hashlib.sha256()
+    count = 0
+    slice_file = gzip.open(tmp_path, "wb")
+    try:
+        for entry in raw_oplog.find(query, oplog_replay=True):
+            slice_file.write(entry.raw)
+            checksum.update(entry.raw)
+            count += 1
+    finally:
+        slice_file.close()
+    os.rename(tmp_path, slice_path)
+
+    checkpoint["slices"].append({
+        "file": os.path.join(OPLOG_SLICES_DIR, slice_name),
+        "server": server.id,
+        "startTs": start_ts,
+        "endTs": end_ts,
+        "count": count,
+        "bsonSha256": checksum.hexdigest()
+    })
+    checkpoint["ts"] = end_ts
+    write_oplog_checkpoint(backup_dir, checkpoint)
+
+    log_info("Dumped %s oplog entries into '%s'" % (count, slice_path))
+
+###############################################################################
+def format_ts(ts):
+    return "Timestamp(%s, %s)" % (ts.time, ts.inc)
+
+###############################################################################
+def ts_file_part(ts):
+    return "%010d_%05d" % (ts.time, ts.inc)
@@ -1,11 +1,22 @@
 __author__ = 'abdul'
 
+import os
+import json
+import gzip
+import time
+import threading
+import subprocess
+
+from bson import json_util
+from bson.json_util import JSONOptions
+from bson.son import SON
+
 import mongoctl.repository as repository
 
 from mongoctl.mongo_uri_tools import is_mongo_uri, parse_mongo_uri
 
-from mongoctl.utils import resolve_path
-from mongoctl.mongoctl_logging import log_info , log_warning
+from mongoctl.utils import resolve_path, parallel_map
+from mongoctl.mongoctl_logging import log_info , log_warning, log_verbose
 
 from mongoctl.commands.command_utils import (
     is_db_address, is_dbpath, extract_mongo_exe_options, get_mongo_executable,
@@ -15,7 +26,14 @@ from mongoctl.errors import MongoctlException
 
 from mongoctl.utils import call_command
 from mongoctl.objects.server import Server
+from mongoctl.objects.replicaset_cluster import ReplicaSetCluster
+from mongoctl.objects.sharded_cluster import ShardedCluster
 from mongoctl.mongodb_version import make_version_info
+from mongoctl.commands.common.dump import SHARDED_DUMP_MANIFEST
+from mongoctl.commands.common.oplog_replay import (
+    parse_timestamp, get_replay_sources, replay_oplog, DEFAULT_REPLAY_WORKERS
+)
+from mongoctl.commands.common.restore_throttle import ReplicationLagThrottle
 
 ###############################################################################
 # CONSTS
@@ -36,9 +54,26 @@ SUPPORTED_MONGO_RESTORE_OPTIONS = [
     "noIndexRestore",
     "stopOnError",
     "writeConcern",
-    "numParallelCollections"
+    "numParallelCollections",
+    "numInsertionWorkersPerCollection"
 ]
 
+# mongorestore insertion workers per collection for the base dump of a
+# point in time restore
+DEFAULT_PITR_INSERTION_WORKERS = 4
+
+# fast restore (--fast) sizing: concurrent inserts per core of the target,
+# halved for replica sets so that secondaries keep up
+FAST_RESTORE_WRITERS_PER_CORE = 2
+MAX_FAST_RESTORE_PARALLEL_COLLECTIONS = 8
+# used when the target's core count cannot be determined
+DEFAULT_FAST_RESTORE_CORES = 4
+
+# secs between two throughput reports of a fast restore
+RESTORE_PROGRESS_INTERVAL = 10
+
+METADATA_JSON_OPTIONS = JSONOptions(document_class=SON)
+
 
 ###############################################################################
 # restore command
@@ -64,6 +99,20 @@ def restore_command(parsed_options):
         raise MongoctlException("Invalid destination value '%s'. Destination has to be"
                                 " a valid db address or dbpath." % destination)
 
+    if parsed_options.until:
+        if not is_addr:
+            raise MongoctlException("Point in time restore needs a db "
+                                    "address destination")
+        replay_workers = int(parsed_options.replayWorkers or
+                             DEFAULT_REPLAY_WORKERS)
+        mongo_restore_point_in_time(destination, source,
+                                    parse_timestamp(parsed_options.until),
+                                    username=parsed_options.username,
+                                    password=parsed_options.password,
+                                    parsed_options=parsed_options,
+                                    replay_workers=replay_workers)
+        return
+
     if is_addr:
         mongo_restore_db_address(destination,
                                  source,
@@ -110,6 +159,76 @@ def mongo_restore_db_address(db_address,
 
     raise MongoctlException("Unknown db address '%s'" % db_address)
 
+###############################################################################
+def mongo_restore_point_in_time(db_address, source, until_ts,
+                                username=None,
+                                password=None,
+                                parsed_options=None,
+                                replay_workers=DEFAULT_REPLAY_WORKERS):
+    """
+    Restores the full dump in source (taken by mongoctl, see dump
+    --start-oplog-chain and --oplog-slice) then replays its oplog (the dump's own oplog.bson and the
+    oplog slices after it) up to until_ts with batched bulk writes, instead
+    of mongorestore --oplogReplay
+    """
+    if is_mongo_uri(db_address):
+        server_or_cluster = repository.build_server_or_cluster_from_uri(
+            db_address)
+    else:
+        if "/" in db_address:
+            raise MongoctlException("Point in time restore can only restore "
+                                    "a whole dump (no database)")
+        server_or_cluster = (repository.lookup_server(db_address) or
+                             repository.lookup_cluster(db_address))
+    if not server_or_cluster:
+        raise MongoctlException("Unknown db address '%s'" % db_address)
+
+    if isinstance(server_or_cluster, ShardedCluster):
+        raise MongoctlException("Point in time restore is not supported for "
+                                "sharded clusters")
+    elif isinstance(server_or_cluster, ReplicaSetCluster):
+        server = get_restore_primary(server_or_cluster)
+    else:
+        server = server_or_cluster
+
+    if parsed_options and parsed_options.oplogReplay:
+        raise MongoctlException("--oplogReplay cannot be used with --until")
+
+    # fail before restoring anything if the slices do not reach until_ts
+    sources = get_replay_sources(source, until_ts)
+
+    if username and not password:
+        password = server.lookup_password("admin", username)
+
+    restore_options = extract_mongo_restore_options(parsed_options)
+    extra_options = None
+    # --fast sizes insertion workers itself
+    if ("numInsertionWorkersPerCollection" not in restore_options and
+            not parsed_options.fastRestore):
+        extra_options = {
+            "numInsertionWorkersPerCollection": DEFAULT_PITR_INSERTION_WORKERS
+        }
+
+    # one throttle for both steps
+    throttle = get_restore_throttle(server, parsed_options)
+    try:
+        log_info("Restoring base dump '%s' into server '%s'..." %
+                 (source, server.id))
+        mongo_restore_server(server, source, username=username,
+                             password=password, parsed_options=parsed_options,
+                             extra_restore_options=extra_options,
+                             throttle=throttle)
+
+        replay_oplog(server, sources, until_ts, username=username,
+                     password=password, workers=replay_workers,
+                     throttle=throttle)
+    finally:
+        if throttle:
+            throttle.log_summary()
+
+    log_info("Server '%s' restored successfully from '%s'" %
+             (server.id, source))
+
 ###############################################################################
 def mongo_restore_db_path(dbpath, source, parsed_options=None):
     do_mongo_restore(source, dbpath=dbpath, parsed_options=parsed_options)
@@ -141,7 +260,13 @@ def mongo_restore_server(server, source,
                          database=None,
                          username=None,
                          password=None,
-                         parsed_options=None):
+                         parsed_options=None,
+                         extra_restore_options=None,
+                         throttle=None):
+    """
+    throttle: the ReplicationLagThrottle to use. By default one is made
+    (if --throttle-repl-lag is set) for this restore only
+    """
     repository.validate_server(server)
 
     # auto complete password if possible
@@ -151,16 +276,338 @@ def mongo_restore_server(server, source,
         if not password:
             password = server.lookup_password("admin", username)
 
-    do_mongo_restore(source,
-                     host=server.get_connection_host_address(),
-                     port=server.get_port(),
-                     database=database,
-                     username=username,
-                     password=password,
-                     version_info=server.get_mongo_version_info(),
-                     parsed_options=parsed_options,
-                     ssl=server.use_ssl_client())
+    own_throttle = throttle is None
+    if own_throttle:
+        throttle = get_restore_throttle(server, parsed_options)
+
+    try:
+        if parsed_options and parsed_options.fastRestore:
+            fast_mongo_restore_server(
+                server, source, database=database, username=username,
+                password=password, parsed_options=parsed_options,
+                extra_restore_options=extra_restore_options,
+                throttle=throttle)
+            return
+
+        do_mongo_restore(source,
+                         host=server.get_connection_host_address(),
+                         port=server.get_port(),
+                         database=database,
+                         username=username,
+                         password=password,
+                         version_info=server.get_mongo_version_info(),
+                         parsed_options=parsed_options,
+                         ssl=server.use_ssl_client(),
+                         extra_restore_options=extra_restore_options,
+                         throttle=throttle)
+    finally:
+        if own_throttle and throttle:
+            throttle.log_summary()
+
+###############################################################################
+def get_restore_throttle(server, parsed_options):
+    """
+    Returns a ReplicationLagThrottle for restoring into server if
+    --throttle-repl-lag is set and server is a replica set member
+    """
+    max_lag = parsed_options and parsed_options.throttleReplLag
+    if not max_lag:
+        return None
+
+    cluster = server.get_cluster()
+    if not isinstance(cluster, ReplicaSetCluster):
+        log_warning("Ignoring --throttle-repl-lag: server '%s' is not a "
+                    "replica set member" % server.id)
+        return None
+
+    log_info("Restore into replica set '%s' will pause whenever a secondary "
+             "is more than %s secs behind" % (cluster.id, max_lag))
+    return ReplicationLagThrottle(cluster, server, int(max_lag))
+
+
+###############################################################################
+def fast_mongo_restore_server(server, source,
+                              database=None,
+                              username=None,
+                              password=None,
+                              parsed_options=None,
+                              extra_restore_options=None,
+                              throttle=None):
+    """
+    Throughput oriented restore: mongorestore runs with worker counts sized
+    from the target's cores and member count and without indexes, which are
+    then built per collection in parallel. Insert throughput is reported
+    while it runs.
+    """
+    version_info = server.get_mongo_version_info()
+    if version_info and version_info < make_version_info("3.0.0"):
+        raise MongoctlException("Fast restore needs MongoDB 3.0.x or greater")
+
+    restore_options = extract_mongo_restore_options(parsed_options)
+    if "collection" in restore_options:
+        raise MongoctlException("Fast restore can only restore whole "
+                                "databases (no --collection)")
+
+    num_cores = get_server_num_cores(server)
+    num_members = get_data_member_count(server)
+    parallel_collections, insertion_workers = get_restore_worker_counts(
+        num_cores, num_members)
+
+    # user options win
+    fast_options = {}
+    for name, value in [("numParallelCollections", parallel_collections),
+                        ("numInsertionWorkersPerCollection", insertion_workers),
+                        ("noIndexRestore", True)]:
+        if name not in restore_options:
+            fast_options[name] = value
+    fast_options.update(extra_restore_options or {})
+    parallel_collections = int(restore_options.get("numParallelCollections",
+                                                   parallel_collections))
+
+    log_info("Fast restore into server '%s' (%s cores, %s data bearing "
+             "member(s)): %s parallel collection(s), %s insertion worker(s)"
+             " per collection" %
+             (server.id, num_cores, num_members, parallel_collections,
+              fast_options.get("numInsertionWorkersPerCollection",
+                               restore_options.get(
+                                   "numInsertionWorkersPerCollection"))))
+
+    monitor = RestoreThroughputMonitor(server)
+    monitor.start()
+    try:
+        do_mongo_restore(source,
+                         host=server.get_connection_host_address(),
+                         port=server.get_port(),
+                         database=database,
+                         username=username,
+                         password=password,
+                         version_info=version_info,
+                         parsed_options=parsed_options,
+                         ssl=server.use_ssl_client(),
+                         extra_restore_options=fast_options,
+                         throttle=throttle)
+    finally:
+        monitor.stop()
+
+    docs, num_bytes, duration = monitor.get_totals()
+    log_info("Loaded %s document(s) (%.1f MB) in %.1f secs (%.0f docs/s, "
+             "%.1f MB/s)" % (docs, num_bytes / 1048576.0, duration,
+                             docs / duration,
+                             num_bytes / 1048576.0 / duration))
+
+    # indexes were skipped by the user, not by fast restore
+    if restore_options.get("noIndexRestore"):
+        return
 
+    build_restored_indexes(server, source, database=database,
+                           username=username, password=password,
+                           keep_index_version=
+                           restore_options.get("keepIndexVersion"),
+                           max_workers=parallel_collections,
+                           throttle=throttle)
+
+###############################################################################
+def get_restore_worker_counts(num_cores, num_members):
+    """
+    Returns (numParallelCollections, numInsertionWorkersPerCollection) for a
+    target with num_cores cores and num_members data bearing members
+    """
+    budget = max(num_cores, 1) * FAST_RESTORE_WRITERS_PER_CORE
+    if num_members > 1:
+        budget /= 2
+    budget = max(budget, 2)
+    parallel_collections = max(1, min(MAX_FAST_RESTORE_PARALLEL_COLLECTIONS,
+                                      budget / 2))
+    return parallel_collections, max(1, budget / parallel_collections)
+
+###############################################################################
+def get_server_num_cores(server):
+    try:
+        host_info = server.db_command(SON([("hostInfo", 1)]), "admin")
+        return int(host_info["system"]["numCores"])
+    except Exception, e:
+        log_verbose("Unable to get number of cores of server '%s' (%s). "
+                    "Assuming %s" % (server.id, e, DEFAULT_FAST_RESTORE_CORES))
+        return DEFAULT_FAST_RESTORE_CORES
+
+###############################################################################
+def get_data_member_count(server):
+    cluster = server.get_cluster()
+    if isinstance(cluster, ReplicaSetCluster):
+        return len([m for m in cluster.get_members() if not m.is_arbiter()])
+    return 1
+
+###############################################################################
+def build_restored_indexes(server, source,
+                           database=None,
+                           username=None,
+                           password=None,
+                           keep_index_version=False,
+                           max_workers=MAX_FAST_RESTORE_PARALLEL_COLLECTIONS,
+                           throttle=None):
+    """
+    Builds the indexes recorded in the .metadata.json files of the dump in
+    source, one createIndexes per collection, max_workers collections at a
+    time (each waiting for throttle, if any). Index builds run on a client
+    with a socket per worker and no socket timeout since a build can take
+    hours
+    """
+    tasks = []
+    for db_name, db_dir in get_dump_db_dirs(source, database):
+        for file_name in sorted(os.listdir(db_dir)):
+            coll_name = get_metadata_collection_name(file_name)
+            if not coll_name:
+                continue
+            specs = read_index_specs(os.path.join(db_dir, file_name),
+                                     keep_index_version=keep_index_version)
+            if specs:
+                tasks.append((db_name, coll_name, specs))
+
+    if not tasks:
+        return
+
+    log_info("Building %s index(es) on %s collection(s) of server '%s'..." %
+             (sum([len(t[2]) for t in tasks]), len(tasks), server.id))
+    start_time = time.time()
+
+    def build_indexes(task):
+        db_name, coll_name, specs = task
+        db = server.get_worker_db(db_name, max_workers, username=username,
+                                  password=password)
+        if throttle:
+            throttle.wait_for_lag()
+        coll_start_time = time.time()
+        db.command(SON([("createIndexes", coll_name), ("indexes", specs)]))
+        log_info("Built %s index(es) on %s.%s in %.1f secs" %
+                 (len(specs), db_name, coll_name,
+                  time.time() - coll_start_time))
+
+    results = parallel_map(build_indexes, tasks, max_workers=max_workers)
+    failed = [(t, ex) for t, result, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to build indexes on %s. First error:"
+                                " %s" %
+                                (", ".join(["%s.%s" % (t[0], t[1])
+                                            for t, ex in failed]),
+                                 failed[0][1]))
+
+    log_info("Built all indexes in %.1f secs" % (time.time() - start_time))
+
+###############################################################################
+def get_dump_db_dirs(source, database=None):
+    """
+    Returns a list of (database name, dir) of a dump dir. With a database,
+    source is the database's dir (like mongorestore -d)
+    """
+    if database:
+        return [(database, source)]
+    return [(name, os.path.join(source, name))
+            for name in sorted(os.listdir(source))
+            if os.path.isdir(os.path.join(source, name))]
+
+###############################################################################
+def get_metadata_collection_name(file_name):
+    for ext in [".metadata.json", ".metadata.json.gz"]:
+        if file_name.endswith(ext):
+            return file_name[:-len(ext)]
+
+###############################################################################
+def read_index_specs(metadata_path, keep_index_version=False):
+    """
+    Returns the createIndexes specs of a collection's metadata file, without
+    the _id index
+    """
+    if metadata_path.endswith(".gz"):
+        metadata_file = gzip.open(metadata_path, "rb")
+    else:
+        metadata_file = open(metadata_path)
+    try:
+        metadata = json_util.loads(metadata_file.read(),
+                                   json_options=METADATA_JSON_OPTIONS)
+    finally:
+        metadata_file.close()
+
+    specs = []
+    for index in metadata.get("indexes") or []:
+        if index.get("name") == "_id_":
+            continue
+        spec = SON([(k, v) for k, v in index.items() if k != "ns"])
+        if not keep_index_version:
+            spec.pop("v", None)
+        specs.append(spec)
+    return specs
+
+###############################################################################
+# RestoreThroughputMonitor
+###############################################################################
+class RestoreThroughputMonitor(object):
+    """
+    Periodically logs the insert rate (docs/sec) and the inbound network
+    rate (bytes/sec) of a server from its serverStatus counters
+    """
+
+    ###########################################################################
+    def __init__(self, server, interval=RESTORE_PROGRESS_INTERVAL):
+        self._server = server
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_counters = None
+        self._last_counters = None
+        self._start_time = None
+
+    ###########################################################################
+    def start(self):
+        self._start_time = time.time()
+        self._start_counters = self._get_counters()
+        self._last_counters = self._start_counters
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    ###########################################################################
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self._last_counters = self._get_counters() or self._last_counters
+
+    ###########################################################################
+    def get_totals(self):
+        """
+        Returns (docs, bytes, secs) since start()
+        """
+        duration = max(time.time() - self._start_time, 0.001)
+        if not self._start_counters or not self._last_counters:
+            return 0, 0, duration
+        return (self._last_counters[0] - self._start_counters[0],
+                self._last_counters[1] - self._start_counters[1],
+                duration)
+
+    ###########################################################################
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            counters = self._get_counters()
+            if not counters or not self._last_counters:
+                continue
+            docs = counters[0] - self._last_counters[0]
+            num_bytes = counters[1] - self._last_counters[1]
+            self._last_counters = counters
+            log_info("Restore progress on server '%s': %.0f docs/s, %.1f "
+                     "MB/s (%s docs so far)" %
+                     (self._server.id, docs / float(self._interval),
+                      num_bytes / 1048576.0 / self._interval,
+                      counters[0] - self._start_counters[0]))
+
+    ###########################################################################
+    def _get_counters(self):
+        try:
+            status = self._server.server_status()
+            return (status["opcounters"]["insert"],
+                    status["network"]["bytesIn"])
+        except Exception, e:
+            log_verbose("Unable to get serverStatus of server '%s': %s" %
+                        (self._server.id, e))
 
 ###############################################################################
 def mongo_restore_cluster(cluster, source,
@@ -169,6 +616,16 @@ def mongo_restore_cluster(cluster, source,
                           password=None,
                           parsed_options=None):
     repository.validate_cluster(cluster)
+
+    if isinstance(cluster, ShardedCluster) and is_sharded_dump(source):
+        if database:
+            raise MongoctlException("A per shard dump can only be restored "
+                                    "as a whole (no database)")
+        mongo_restore_sharded_cluster(cluster, source, username=username,
+                                      password=password,
+                                      parsed_options=parsed_options)
+        return
+
     log_info("Locating default server for cluster '%s'..." % cluster.id)
     default_server = cluster.get_default_server()
     if default_server:
@@ -182,6 +639,138 @@ def mongo_restore_cluster(cluster, source,
         raise MongoctlException("No default server found for cluster '%s'" %
                                 cluster.id)
 
+###############################################################################
+def is_sharded_dump(source):
+    return os.path.isfile(os.path.join(source, SHARDED_DUMP_MANIFEST))
+
+###############################################################################
+def mongo_restore_sharded_cluster(cluster, source,
+                                  username=None,
+                                  password=None,
+                                  parsed_options=None):
+    """
+    Restores a per shard dump (see dump --per-shard) into a sharded cluster
+    whose shards have the same ids as the dumped ones: the config database
+    first, replacing the collections it has (config.shards entries keep the
+    dumped shard names and are pointed to this cluster's shards), then all
+    shards in parallel, replaying the oplog of each dump when it has one
+    """
+    with open(os.path.join(source, SHARDED_DUMP_MANIFEST)) as f:
+        manifest = json.load(f)
+
+    shard_targets = []
+    for shard_dump in manifest["shards"]:
+        shard_member = cluster.get_shard_member_by_shard_id(shard_dump["_id"])
+        if not shard_member:
+            raise MongoctlException("Dump shard '%s' has no matching shard "
+                                    "in sharded cluster '%s'" %
+                                    (shard_dump["_id"], cluster.id))
+        shard_targets.append((shard_dump, shard_member))
+
+    dest_shard_names = cluster.get_shard_names()
+    for shard_dump, shard_member in shard_targets:
+        dump_name = get_dump_shard_name(shard_dump)
+        dest_name = dest_shard_names.get(shard_dump["_id"])
+        if dest_name and dest_name != dump_name:
+            log_warning("Shard '%s' was added to sharded cluster '%s' as "
+                        "'%s' but is named '%s' in the dump. The restored "
+                        "config database uses '%s'." %
+                        (shard_dump["_id"], cluster.id, dest_name, dump_name,
+                         dump_name))
+
+    balancer_was_enabled = cluster.is_balancer_enabled()
+    if balancer_was_enabled:
+        cluster.stop_balancer()
+
+    restored = False
+    try:
+        do_restore_sharded_cluster(cluster, source, manifest, shard_targets,
+                                   username=username, password=password,
+                                   parsed_options=parsed_options)
+        restored = True
+    finally:
+        # once restored, the balancer is left as it was in the dumped cluster
+        if restored:
+            start_balancer = manifest.get("balancerEnabled")
+        else:
+            start_balancer = balancer_was_enabled
+        if start_balancer:
+            cluster.start_balancer()
+
+###############################################################################
+def do_restore_sharded_cluster(cluster, source, manifest, shard_targets,
+                               username=None,
+                               password=None,
+                               parsed_options=None):
+    # 1- config database
+    config_source = os.path.join(source, manifest["config"]["dir"], "config")
+    config_servers = cluster.config_servers
+    if isinstance(config_servers, ReplicaSetCluster):
+        config_servers = [get_restore_primary(config_servers)]
+    for config_server in config_servers:
+        log_info("Restoring config database into config server '%s'..." %
+                 config_server.id)
+        # drop the collections being restored so that the existing
+        # metadata of this cluster does not conflict with the dumped one
+        mongo_restore_server(config_server, config_source, database="config",
+                             username=username, password=password,
+                             parsed_options=parsed_options,
+                             extra_restore_options={"drop": True})
+        shards_collection = config_server.get_db("config")["shards"]
+        for shard_dump, shard_member in shard_targets:
+            dump_name = get_dump_shard_name(shard_dump)
+            result = shards_collection.update_one(
+                {"_id": dump_name},
+                {"$set": {"host":
+                              cluster.get_shard_member_address(shard_member)}})
+            if result.matched_count != 1:
+                raise MongoctlException("Shard '%s' not found in the config"
+                                        ".shards collection restored into "
+                                        "config server '%s'" %
+                                        (dump_name, config_server.id))
+
+    # 2- shards
+    def restore_shard(shard_target):
+        shard_dump, shard_member = shard_target
+        shard = shard_member.get_member_cluster_or_server()
+        server = shard
+        if isinstance(shard, ReplicaSetCluster):
+            server = get_restore_primary(shard)
+        extra_options = {"oplogReplay": True} if shard_dump["oplog"] else None
+        log_info("Restoring shard '%s' into server '%s'..." %
+                 (shard_dump["_id"], server.id))
+        mongo_restore_server(server, os.path.join(source, shard_dump["dir"]),
+                             username=username, password=password,
+                             parsed_options=parsed_options,
+                             extra_restore_options=extra_options)
+
+    results = parallel_map(restore_shard, shard_targets,
+                           max_workers=len(shard_targets) or 1)
+    failed = [(t, ex) for t, result, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to restore shard(s) %s. First "
+                                "error: %s" %
+                                (", ".join([t[0]["_id"] for t, ex in failed]),
+                                 failed[0][1]))
+
+    cluster.flush_router_configs()
+
+    log_info("Sharded cluster '%s' restored successfully from '%s'" %
+             (cluster.id, source))
+
+###############################################################################
+def get_dump_shard_name(shard_dump):
+    # dumps made before shard names were recorded used shard ids
+    return shard_dump.get("name") or shard_dump["_id"]
+
+###############################################################################
+def get_restore_primary(replica_cluster):
+    primary_server = replica_cluster.get_primary_server()
+    if not primary_server:
+        raise MongoctlException("No primary server found for cluster '%s'" %
+                                replica_cluster.id)
+    return primary_server
+
 ###############################################################################
 def do_mongo_restore(source,
                      host=None,
@@ -192,9 +781,13 @@ def do_mongo_restore(source,
                      password=None,
                      version_info=None,
                      parsed_options=None,
-                     ssl=False):
+                     ssl=False,
+                     extra_restore_options=None,
+                     throttle=None):
 
     restore_options = extract_mongo_restore_options(parsed_options)
+    if extra_restore_options:
+        restore_options.update(extra_restore_options)
     # create restore command with host and port
     restore_cmd = [get_mongo_restore_executable(version_info)]
 
@@ -256,7 +849,25 @@ def do_mongo_restore(source,
 
     # execute!
     log_info("Executing command: \n%s" % " ".join(cmd_display))
-    call_command(restore_cmd, bubble_exit_code=True)
+    if throttle:
+        call_throttled_command(restore_cmd, throttle)
+    else:
+        call_command(restore_cmd, bubble_exit_code=True)
+
+###############################################################################
+def call_throttled_command(command, throttle):
+    """
+    Like call_command(command, bubble_exit_code=True) but the process is
+    paused while throttle says the replica set is lagging
+    """
+    process = subprocess.Popen(command)
+    throttle.watch_process(process)
+    try:
+        returncode = process.wait()
+    finally:
+        throttle.stop()
+    if returncode:
+        exit(returncode)
 
 
 ###############################################################################
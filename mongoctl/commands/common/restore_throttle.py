@@ -0,0 +1,178 @@
+__author__ = 'abdul'
+
+import os
+import time
+import signal
+import threading
+
+from mongoctl.mongoctl_logging import log_info, log_verbose
+from mongoctl.objects.replicaset_cluster import get_max_secondary_repl_lag
+
+###############################################################################
+# CONSTS
+###############################################################################
+# secs between two replSetGetStatus polls
+DEFAULT_THROTTLE_POLL_INTERVAL = 5
+
+# a paused restore resumes once the lag is back under this ratio of the max
+# lag, so that it does not flap around the ceiling
+RESUME_LAG_RATIO = 0.5
+
+###############################################################################
+# ReplicationLagThrottle
+###############################################################################
+class ReplicationLagThrottle(object):
+    """
+    Back-pressure for writes into a live replica set: watches the repl lag
+    of its secondaries on the primary and holds writes back while the
+    furthest secondary is more than max_lag secs behind, until it is back
+    under max_lag * RESUME_LAG_RATIO. Delayed and hidden members are not
+    watched since they do not serve reads.
+
+    Writers either call wait_for_lag() between batches or have their
+    process paused (SIGSTOP) and resumed (SIGCONT) with watch_process().
+    Concurrent wait_for_lag() callers are gated through one check at a time.
+    One throttle can serve several restore steps; log_summary() reports
+    the pauses of all of them.
+    """
+
+    ###########################################################################
+    def __init__(self, replica_cluster, primary_server, max_lag,
+                 poll_interval=DEFAULT_THROTTLE_POLL_INTERVAL):
+        self._replica_cluster = replica_cluster
+        self._primary_server = primary_server
+        self.max_lag = max_lag
+        self._poll_interval = poll_interval
+        self._excluded_addresses = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._gate_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.pause_count = 0
+        self.paused_secs = 0
+
+    ###########################################################################
+    def get_lag(self):
+        """
+        Returns (lag in secs, member address) of the furthest secondary or
+        (None, None) if it cannot be determined
+        """
+        try:
+            rs_status = self._primary_server.get_rs_status()
+            if not rs_status:
+                return None, None
+            return get_max_secondary_repl_lag(rs_status["members"],
+                                              self._get_excluded_addresses())
+        except Exception, e:
+            log_verbose("Unable to get repl lag of replica set '%s': %s" %
+                        (self._replica_cluster.id, e))
+            return None, None
+
+    ###########################################################################
+    def is_lagging(self, paused):
+        """
+        Returns True if writes should be (or stay) paused. An unknown lag
+        never pauses writes
+        """
+        lag, address = self.get_lag()
+        if lag is None:
+            return False
+        if paused:
+            return lag > self.max_lag * RESUME_LAG_RATIO
+        if lag > self.max_lag:
+            log_info("Secondary '%s' of replica set '%s' is %s secs behind "
+                     "(max %s). Pausing restore..." %
+                     (address, self._replica_cluster.id, lag, self.max_lag))
+            return True
+        return False
+
+    ###########################################################################
+    def wait_for_lag(self):
+        """
+        Blocks while the replica set is lagging. Thread safe: while one
+        caller is paused the others queue behind it
+        """
+        with self._gate_lock:
+            if not self.is_lagging(False):
+                return
+            start_time = self._paused()
+            while True:
+                time.sleep(self._poll_interval)
+                if not self.is_lagging(True):
+                    break
+            self._resumed(start_time)
+
+    ###########################################################################
+    def watch_process(self, process):
+        """
+        Pauses/resumes process in the background until stop()
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, args=(process,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    ###########################################################################
+    def stop(self):
+        """
+        Stops watching the process (see watch_process())
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    ###########################################################################
+    def log_summary(self):
+        if self.pause_count:
+            log_info("Restore was paused %s time(s) for a total of %.0f secs"
+                     " to keep repl lag of replica set '%s' under %s secs" %
+                     (self.pause_count, self.paused_secs,
+                      self._replica_cluster.id, self.max_lag))
+
+    ###########################################################################
+    def _watch(self, process):
+        paused_since = None
+        try:
+            while not self._stop_event.wait(self._poll_interval):
+                if process.poll() is not None:
+                    return
+                lagging = self.is_lagging(paused_since is not None)
+                if lagging and paused_since is None:
+                    os.kill(process.pid, signal.SIGSTOP)
+                    paused_since = self._paused()
+                elif not lagging and paused_since is not None:
+                    os.kill(process.pid, signal.SIGCONT)
+                    self._resumed(paused_since)
+                    paused_since = None
+        finally:
+            # never leave the process stopped
+            if paused_since is not None and process.poll() is None:
+                os.kill(process.pid, signal.SIGCONT)
+                self._resumed(paused_since)
+
+    ###########################################################################
+    def _paused(self):
+        with self._stats_lock:
+            self.pause_count += 1
+        return time.time()
+
+    ###########################################################################
+    def _resumed(self, paused_since):
+        paused_secs = time.time() - paused_since
+        with self._stats_lock:
+            self.paused_secs += paused_secs
+        log_info("Resuming restore after %.0f secs" % paused_secs)
+
+    ###########################################################################
+    def _get_excluded_addresses(self):
+        if self._excluded_addresses is None:
+            rs_config = self._primary_server.get_rs_config() or {}
+            self._excluded_addresses = [
+                m["host"] for m in rs_config.get("members", [])
+                if m.get("hidden") or m.get("slaveDelay") or
+                m.get("secondaryDelaySecs")]
+            if self._excluded_addresses:
+                log_info("Not watching repl lag of delayed/hidden "
+                         "member(s) %s" % ", ".join(self._excluded_addresses))
+        return self._excluded_addresses
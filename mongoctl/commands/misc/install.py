@@ -16,7 +16,7 @@ from mongoctl.errors import MongoctlException
 
 from mongoctl.utils import (
     download_url, extract_archive, call_command, which, ensure_dir,
-    validate_openssl, execute_command, list_dir_files, is_exe
+    validate_openssl, execute_command, extract_archive_stream, ChecksumReader
 )
 
 from mongoctl.mongodb_version import make_version_info, is_valid_version_info
@@ -24,7 +24,11 @@ from mongoctl.commands.command_utils import (
     find__all_mongo_installations, get_mongo_installation
 )
 
-from mongoctl.binary_repo import download_mongodb_binary, get_template_args
+from mongoctl.binary_repo import (
+    open_mongodb_binary_stream, download_mongodb_binary, get_template_args,
+    get_binary_cache_ref, get_binary_cache_refs
+)
+from mongoctl.binary_cache import get_binary_cache
 
 ###############################################################################
 # CONSTS
@@ -132,42 +136,92 @@ def install_mongodb(mongodb_version=None, mongodb_edition=None, from_source=Fals
 
 
 
-    # XXX LOOK OUT! Two processes installing same version simultaneously => BAD.
-    # TODO: mutex to protect the following
-
+    # extract into a staging dir next to the target so that the target
+    # appears (atomically) only once complete and validated. Concurrent
+    # installs of the same version use different staging dirs; the first
+    # rename wins and the others use its install
+    staging_dir = os.path.join(mongodb_installs_dir, ".%s.staging-%s" %
+                               (os.path.basename(target_dir), os.getpid()))
     try:
-        ## download the url
-        archive_path = download_mongodb_binary(mongodb_version,
-                                               mongodb_edition)
-        archive_name = os.path.basename(archive_path)
-
-        mongo_dir_name = extract_archive(archive_name)
-
-        # apply include_only if specified
-        if include_only:
-            apply_include_only(mongo_dir_name, include_only)
-
-        log_info("Deleting archive %s" % archive_name)
-        os.remove(archive_name)
-        target_dir_name = os.path.basename(target_dir)
-        os.rename(mongo_dir_name, target_dir_name)
-
-        # move target to mongodb install dir (Unless target is already there!
-        # i.e current working dir == mongodb_installs_dir
-        if os.getcwd() != mongodb_installs_dir:
-            log_info("Moving extracted folder to %s" % mongodb_installs_dir)
-            shutil.move(target_dir_name, mongodb_installs_dir)
-
-        install_dir = os.path.join(mongodb_installs_dir, mongo_dir_name)
+        stream_extract_mongodb_binary(mongodb_version, mongodb_edition,
+                                      staging_dir, include_only=include_only)
         # install validation
-        validate_mongodb_install(target_dir)
+        validate_mongodb_install(staging_dir)
+        try:
+            os.rename(staging_dir, target_dir)
+        except OSError:
+            if not os.path.isdir(target_dir):
+                raise
+            validate_mongodb_install(target_dir)
+            log_info("MongoDB %s was installed into '%s' by a concurrent "
+                     "install" % (version_info, target_dir))
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return target_dir
         log_info("MongoDB %s installed successfully!" % version_info)
-        return install_dir
+        return target_dir
     except Exception, e:
         log_exception(e)
+        shutil.rmtree(staging_dir, ignore_errors=True)
         msg = "Failed to install MongoDB '%s'. Cause: %s" % (version_info, e)
         raise MongoctlException(msg)
 
+###############################################################################
+def stream_extract_mongodb_binary(mongodb_version, mongodb_edition, dest_dir,
+                                  include_only=None):
+    """
+    Extracts the archive of the mongodb binary into dest_dir. With the binary
+    cache enabled, the archive is extracted from the cache: the one cached
+    for the first of the registered repositories (in order) or else one
+    downloaded into it first (resumably, see download_mongodb_binary()).
+    Without it, the archive is extracted while it downloads (no copy of it
+    is written) and its published SHA-256, if any, is verified.
+    """
+    cache = get_binary_cache()
+    cached = None
+    if cache:
+        for cache_ref in get_binary_cache_refs(mongodb_version,
+                                               mongodb_edition):
+            cached = cache.lookup(cache_ref)
+            if cached:
+                break
+        else:
+            repo, archive_path = download_mongodb_binary(
+                mongodb_version, mongodb_edition, cache.get_download_dir())
+            cache_ref = get_binary_cache_ref(mongodb_version,
+                                             mongodb_edition, repo.name)
+            cache.move_file(cache_ref, archive_path)
+            cached = cache.lookup(cache_ref)
+
+    if cached:
+        cached_path, archive_name, expected_sha256 = cached
+        log_info("Using '%s' from binary cache" % archive_name)
+        stream = open(cached_path, "rb")
+    else:
+        repo, stream = open_mongodb_binary_stream(mongodb_version,
+                                                  mongodb_edition)
+        expected_sha256 = repo.get_file_sha256(mongodb_version,
+                                               mongodb_edition)
+
+    reader = ChecksumReader(stream)
+    member_filter = None
+    if include_only:
+        log_info("Extracting include-only files (%s)..." % include_only)
+        member_filter = make_include_only_filter(include_only)
+
+    log_info("Extracting into %s..." % dest_dir)
+    try:
+        extract_archive_stream(reader, dest_dir, member_filter=member_filter)
+        reader.drain()
+    finally:
+        stream.close()
+
+    if expected_sha256 and reader.hexdigest() != expected_sha256:
+        raise MongoctlException("SHA-256 mismatch for MongoDB %s archive: "
+                                "expected %s but got %s" %
+                                (mongodb_version, expected_sha256,
+                                 reader.hexdigest()))
+    log_info("Extracted %.1f MB" % (reader.byte_count / 1048576.0))
+
 
 ###############################################################################
 # install from source
@@ -353,28 +407,18 @@ def ensure_mongo_home_not_used(mongo_installation):
         raise MongoctlException(msg)
 
 ###############################################################################
-def apply_include_only(mongo_dir_name, include_only):
+def make_include_only_filter(include_only):
     """
-
-    :param mongo_dir_name:
-    :param include_only: list of exes names to include only
-    :return:
+    Returns an extract_archive_stream() member filter that keeps everything
+    but the executables of bin/ not in include_only. mongod is always kept
+    because it is used to determine the installation's version
     """
-    log_info("Keep include-only files (%s) from new mongo installation..." %
-             include_only)
-    bin_dir = os.path.join(mongo_dir_name, "bin")
-    exes = list_dir_files(bin_dir)
-    for exe_name in exes:
-        # we always keep mongod because it used to determine mongo
-        # installation version
-        if exe_name == "mongod":
-            continue
-        exe_path = os.path.join(bin_dir, exe_name)
-        if is_exe(exe_path):
-            if exe_name not in include_only:
-                log_info("Removing %s" % exe_name)
-                os.remove(exe_path)
-
-
-
-
+    def member_filter(name, member):
+        parts = name.split("/")
+        if len(parts) != 2 or parts[0] != "bin" or parts[1] == "mongod":
+            return True
+        if member.isdir() or not member.mode & 0111:
+            return True
+        return parts[1] in include_only
+
+    return member_filter
@@ -8,8 +8,9 @@ from mongoctl.errors import MongoctlException
 
 from mongoctl.utils import call_command, which
 from mongoctl.binary_repo import (
-    get_binary_repository, S3MongoDBBinaryRepository
+    get_binary_repository, S3MongoDBBinaryRepository, get_binary_cache_ref
 )
+from mongoctl.binary_cache import get_binary_cache
 from mongoctl.mongodb_version import make_version_info, MongoDBEdition
 
 from mongoctl.commands.command_utils import get_mongo_installation
@@ -70,6 +71,13 @@ def push_mongodb(repo_name, mongodb_version, mongodb_edition=None,
 
     repo.upload_file(mongodb_version, mongodb_edition, target_archive_path)
 
+    # local installs of this version can now come from the cache
+    cache = get_binary_cache()
+    if cache:
+        cache.put_file(get_binary_cache_ref(mongodb_version, mongodb_edition,
+                                            repo.name),
+                       target_archive_path)
+
     # cleanup
     log_info("Cleanup")
     try:
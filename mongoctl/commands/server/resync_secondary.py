@@ -1,21 +1,48 @@
 __author__ = 'abdul'
 
 import mongoctl.repository as repository
+import os
 import shutil
+import time
 
-from mongoctl.mongoctl_logging import log_info
+from bson.son import SON
+from mongoctl.mongoctl_logging import log_info, log_warning, log_exception
 from mongoctl.errors import MongoctlException
+from mongoctl.utils import (
+    copy_tree_parallel, ensure_dir, delete_dir_in_background
+)
+from mongoctl.objects.mongod import LOCK_FILE_NAME
 from stop import do_stop_server
 from start import do_start_server
 
+###############################################################################
+# CONSTS
+###############################################################################
+# max number of data files copied at the same time when seeding
+DEFAULT_SEED_COPY_WORKERS = 8
+
 ###############################################################################
 # re-sync secondary command
 ###############################################################################
 def resync_secondary_command(parsed_options):
-    resync_secondary(parsed_options.server)
+    copy_workers = parsed_options.copyWorkers
+    if copy_workers:
+        copy_workers = int(copy_workers)
+
+    resync_secondary(parsed_options.server,
+                     seed_from=parsed_options.seedFrom,
+                     stop_seed=parsed_options.stopSeed,
+                     copy_workers=copy_workers or DEFAULT_SEED_COPY_WORKERS)
 
 ###############################################################################
-def resync_secondary(server_id):
+def resync_secondary(server_id, seed_from=None, stop_seed=False,
+                     copy_workers=DEFAULT_SEED_COPY_WORKERS):
+    """
+    Resyncs a secondary by wiping its dbpath. By default the server then does
+    a full initial sync. If seed_from is specified, the dbpath is seeded with
+    a physical copy of that member's data files instead (see
+    seed_db_path()) so the server only has to catch up from the oplog.
+    """
 
     server = repository.lookup_and_validate_server(server_id)
     server.validate_local_op("resync-secondary")
@@ -43,11 +70,169 @@ def resync_secondary(server_id):
                " status %s'" % (server_id, rs_state, server_id))
         raise MongoctlException(msg)
 
+    seed_server = None
+    if seed_from:
+        seed_server = validate_seed_server(server, seed_from)
+
     do_stop_server(server)
 
-    log_info("Deleting server's '%s' dbpath '%s'..." %
-             (server_id, server.get_db_path()))
+    trash_path = move_db_path_aside(server)
+
+    # delete before starting; do_start_server does not return for servers
+    # that do not fork
+    if trash_path:
+        pid = delete_dir_in_background(trash_path)
+        log_info("Deleting server's '%s' old dbpath '%s' in the background "
+                 "(pid %s). Progress is logged to mongoctl's log file." %
+                 (server_id, trash_path, pid))
 
-    shutil.rmtree(server.get_db_path())
+    if seed_server:
+        seed_db_path(server, seed_server, stop_seed=stop_seed,
+                     copy_workers=copy_workers)
 
     do_start_server(server)
+
+###############################################################################
+def move_db_path_aside(server):
+    """
+    Moves the server's dbpath aside so that the server can be started on a
+    fresh (empty) dbpath right away. The dbpath is renamed, or, if it is a
+    mount point, its contents are moved into a trash sub directory on the
+    same filesystem. Returns the path to delete, or None if the dbpath could
+    not be moved and was emptied in place instead
+    """
+    db_path = server.get_db_path().rstrip(os.sep)
+    suffix = "resync-%s" % time.strftime("%Y%m%d-%H%M%S")
+    try:
+        if os.path.ismount(db_path):
+            trash_path = os.path.join(db_path, ".%s" % suffix)
+            log_info("Server's '%s' dbpath '%s' is a mount point. Moving its "
+                     "contents aside to '%s'..." %
+                     (server.id, db_path, trash_path))
+            move_dir_contents(db_path, trash_path)
+        else:
+            trash_path = "%s.%s" % (db_path, suffix)
+            log_info("Moving server's '%s' dbpath '%s' aside to '%s'..." %
+                     (server.id, db_path, trash_path))
+            os.rename(db_path, trash_path)
+            ensure_dir(db_path)
+        return trash_path
+    except OSError, e:
+        log_exception(e)
+        log_warning("Unable to move dbpath '%s' aside (%s). Deleting its "
+                    "contents in place..." % (db_path, e))
+        empty_dir(db_path)
+        ensure_dir(db_path)
+
+###############################################################################
+def move_dir_contents(dir_path, dest_path):
+    """
+    Moves all entries of dir_path into dest_path, a new sub directory of it
+    """
+    os.mkdir(dest_path)
+    dest_name = os.path.basename(dest_path)
+    for name in os.listdir(dir_path):
+        if name != dest_name:
+            os.rename(os.path.join(dir_path, name),
+                      os.path.join(dest_path, name))
+
+###############################################################################
+def empty_dir(dir_path):
+    if not os.path.isdir(dir_path):
+        return
+    for name in os.listdir(dir_path):
+        path = os.path.join(dir_path, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+###############################################################################
+def validate_seed_server(server, seed_server_id):
+    seed_server = repository.lookup_and_validate_server(seed_server_id)
+    seed_server.validate_local_op("seed resync-secondary")
+
+    if seed_server.id == server.id:
+        raise MongoctlException("Server '%s' cannot be seeded from itself" %
+                                server.id)
+
+    cluster = server.get_cluster()
+    seed_cluster = seed_server.get_cluster()
+    if not cluster or not seed_cluster or cluster.id != seed_cluster.id:
+        raise MongoctlException("Seed server '%s' is not a member of the "
+                                "same replica set as server '%s'" %
+                                (seed_server.id, server.id))
+
+    if not seed_server.is_secondary():
+        raise MongoctlException("Seed server '%s' is not a healthy "
+                                "secondary. For more details, run 'mongoctl "
+                                "status %s'" % (seed_server.id,
+                                                seed_server.id))
+
+    if os.path.realpath(seed_server.get_db_path()) == \
+            os.path.realpath(server.get_db_path()):
+        raise MongoctlException("Seed server '%s' has the same dbpath as "
+                                "server '%s'" % (seed_server.id, server.id))
+    return seed_server
+
+###############################################################################
+def seed_db_path(server, seed_server, stop_seed=False,
+                 copy_workers=DEFAULT_SEED_COPY_WORKERS):
+    """
+    Copies the data files of seed_server into the (empty) dbpath of server.
+    The seed is write locked with fsyncLock during the copy (or stopped if
+    stop_seed) so the copied files are consistent. Files are reflinked when
+    the filesystem supports it. Hardlinks are never used since both servers
+    would then write to the same files.
+    """
+    src_db_path = seed_server.get_db_path()
+    dst_db_path = server.get_db_path()
+    ensure_dir(dst_db_path)
+
+    # files that belong to the running seed process, not to its data
+    exclude = [LOCK_FILE_NAME]
+    for path in [seed_server.get_pid_file_path(),
+                 seed_server.get_log_file_path()]:
+        rel_path = os.path.relpath(path, src_db_path)
+        if not rel_path.startswith(os.pardir):
+            exclude.append(rel_path)
+
+    if stop_seed:
+        do_stop_server(seed_server)
+    else:
+        fsync_lock_server(seed_server)
+
+    try:
+        log_info("Seeding dbpath '%s' from server '%s' dbpath '%s'..." %
+                 (dst_db_path, seed_server.id, src_db_path))
+        start_time = time.time()
+        files, total_bytes, reflinked = copy_tree_parallel(
+            src_db_path, dst_db_path, exclude=exclude,
+            max_workers=copy_workers)
+        duration = max(time.time() - start_time, 0.001)
+        log_info("Copied %s file(s) (%.1f MB, %s reflinked) in %.1f secs "
+                 "(%.1f MB/s)" % (files, total_bytes / 1048576.0, reflinked,
+                                  duration,
+                                  total_bytes / 1048576.0 / duration))
+    finally:
+        if stop_seed:
+            do_start_server(seed_server, skip_repl_config=True)
+        else:
+            fsync_unlock_server(seed_server)
+
+###############################################################################
+def fsync_lock_server(server):
+    log_info("Locking server '%s' for writes (fsyncLock)..." % server.id)
+    server.db_command(SON([("fsync", 1), ("lock", True)]), "admin")
+
+###############################################################################
+def fsync_unlock_server(server):
+    log_info("Unlocking server '%s' (fsyncUnlock)..." % server.id)
+    try:
+        server.db_command({"fsyncUnlock": 1}, "admin")
+    except Exception, e:
+        # servers older than 3.2 have no fsyncUnlock command
+        log_exception(e)
+        log_warning("fsyncUnlock failed on server '%s'. Trying legacy "
+                    "unlock..." % server.id)
+        server.get_db("admin")["$cmd.sys.unlock"].find_one()
@@ -6,6 +6,7 @@ import subprocess
 import re
 import signal
 import resource
+import threading
 
 import mongoctl.repository as repository
 import mongoctl.config as config
@@ -18,14 +19,15 @@ from mongoctl.mongoctl_logging import *
 from mongoctl.errors import MongoctlException
 from mongoctl import users
 from mongoctl.processes import(
-    communicate_to_child_process, create_subprocess, get_child_processes
+    communicate_to_child_process, create_subprocess, get_child_processes,
+    get_child_process
     )
 from mongoctl.prompt import prompt_execute_task
 from mongoctl.utils import (
     ensure_dir, which, wait_for, dir_exists, is_pid_alive,
-    validate_openssl
+    validate_openssl, is_port_open
 )
-from tail_log import tail_server_log, stop_tailing
+from tail_log import LogFollower, get_log_position
 from mongoctl.commands.command_utils import (
     get_mongo_executable, VersionPreference
     )
@@ -56,6 +58,29 @@ START_CONN_TIMEOUT_MS = 10 * 60 * 1000
 # Max time to wait for server to be online (i.e running and accepting connection) after start
 SERVER_ONLINE_TIMEOUT = 20 * 60
 
+# log line that means the server is accepting connections
+SERVER_READY_LOG_PATTERN = re.compile("waiting for connections", re.IGNORECASE)
+
+# log lines that mean the server failed to start
+SERVER_FATAL_LOG_PATTERN = re.compile("|".join([
+    "exception in initAndListen",
+    "Fatal Assertion",
+    "aborting after",
+    "Failed to set up listener",
+    "Address already in use",
+    "shutting down with code"
+]), re.IGNORECASE)
+
+# how often (in seconds) the log/pid are checked while waiting for start
+READINESS_POLL_INTERVAL = 0.1
+
+# how often (in seconds) to probe the port when the log gives no answer
+# e.g. when the server logs to stdout
+READINESS_PROBE_INTERVAL = 1
+
+# max time to wait for a replica set member to load its config after start
+REPL_CONFIG_LOAD_TIMEOUT = 10
+
 ###############################################################################
 # start command
 ###############################################################################
@@ -108,22 +133,36 @@ def dry_run_start_server_cmd(server, options_override=None, standalone=False):
 ###############################################################################
 # start server
 ###############################################################################
-def start_server(server, options_override=None, rs_add=False, no_init=False, standalone=False):
+def start_server(server, options_override=None, rs_add=False, no_init=False, standalone=False,
+                 skip_repl_config=False, parallel=False):
     # set the timeout to 10 minutes for this server
     server.connection_timeout_ms = START_CONN_TIMEOUT_MS
 
-    do_start_server(server,
-                    options_override=options_override,
-                    rs_add=rs_add,
-                    no_init=no_init,
-                    standalone=standalone)
+    return do_start_server(server,
+                           options_override=options_override,
+                           rs_add=rs_add,
+                           no_init=no_init,
+                           standalone=standalone,
+                           skip_repl_config=skip_repl_config,
+                           parallel=parallel)
 
 ###############################################################################
-__mongod_pid__ = None
-__current_server__ = None
+# pid => server of the servers started by this mongoctl process. Servers may
+# be started from several threads (start-cluster)
+__started_servers__ = {}
+__started_servers_lock__ = threading.Lock()
 
 ###############################################################################
-def do_start_server(server, options_override=None, rs_add=False, no_init=False, standalone=False):
+def do_start_server(server, options_override=None, rs_add=False, no_init=False, standalone=False,
+                    skip_repl_config=False, parallel=False):
+    """
+    skip_repl_config: do not init/add the server to its replica set after
+    start. Used when the caller configures the whole replica set itself
+    parallel: the server is started alongside others from a worker thread.
+    Echoed log lines are prefixed with the server id and failures are raised
+    instead of prompting/exiting; the caller handles them on the main thread.
+    Returns the server pid
+    """
     # ensure that the start was issued locally. Fail otherwise
     server.validate_local_op("start")
 
@@ -135,9 +174,12 @@ def do_start_server(server, options_override=None, rs_add=False, no_init=False,
                  server.id)
         # always call post server start if the server is already started
         # the post server start steps should be idempotent
-        _post_server_start(server, server.get_pid(), rs_add=rs_add, no_init=no_init,
-                           standalone=standalone)
-        return
+        server_pid = server.get_pid()
+        _post_server_start(server, server_pid, rs_add=rs_add, no_init=no_init,
+                           standalone=standalone,
+                           skip_repl_config=skip_repl_config,
+                           parallel=parallel)
+        return server_pid
     elif "timedOut" in status:
         raise MongoctlException("Unable to start server: Server '%s' seems to"
                                 " be already started but is"
@@ -165,9 +207,11 @@ def do_start_server(server, options_override=None, rs_add=False, no_init=False,
 
     server.log_server_activity("start")
 
-    server_pid = start_server_process(server, options_override, standalone=standalone)
+    server_pid = start_server_process(server, options_override, standalone=standalone,
+                                      parallel=parallel)
 
-    _post_server_start(server, server_pid, rs_add=rs_add, no_init=no_init, standalone=standalone)
+    _post_server_start(server, server_pid, rs_add=rs_add, no_init=no_init, standalone=standalone,
+                       skip_repl_config=skip_repl_config, parallel=parallel)
 
     # Note: The following block has to be the last block
     # because server_process.communicate() will not return unless you
@@ -177,6 +221,8 @@ def do_start_server(server, options_override=None, rs_add=False, no_init=False,
     if not server.is_fork():
         communicate_to_child_process(server_pid)
 
+    return server_pid
+
 ###############################################################################
 def _pre_server_start(server, options_override=None):
     # validate open ssl version as needed
@@ -230,10 +276,9 @@ def _post_server_start(server, server_pid, **kwargs):
 def _post_mongod_server_start(server, server_pid, **kwargs):
     try:
         # skip repl init if running in standalone mode
-        if not kwargs.get("standalone"):
-            # sleep for a couple of seconds to allow server to load replicaset
-            # config first
-            time.sleep(2)
+        if not kwargs.get("standalone") and not kwargs.get("skip_repl_config"):
+            # allow server to load replicaset config first
+            wait_for_repl_config_load(server)
             maybe_config_server_repl_set(server, rs_add=kwargs.get("rs_add"),
                                          no_init=kwargs.get("no_init"))
 
@@ -244,12 +289,39 @@ def _post_mongod_server_start(server, server_pid, **kwargs):
         server.set_runtime_parameters()
     except Exception, e:
         log_exception(e)
+        if kwargs.get("parallel"):
+            raise MongoctlException("Unable to fully prepare server '%s'. "
+                                    "Cause: %s" % (server.id, e))
         log_error("Unable to fully prepare server '%s'. Cause: %s \n"
                   "Stop server now if more preparation is desired..." %
                   (server.id, e))
         shall_we_terminate(server_pid)
         exit(1)
 
+###############################################################################
+def wait_for_repl_config_load(server):
+    """
+    isMaster may return an incomplete result while a member is still loading
+    its replica set config (https://jira.mongodb.org/browse/SERVER-13458):
+    "secondary" is present but neither "setName" nor "isreplicaset" are.
+    Wait (briefly) until that is no longer the case.
+    """
+    if not server.get_replicaset_cluster():
+        return
+
+    def repl_config_loaded():
+        result = server.is_master_command()
+        return (not result or
+                "setName" in result or
+                result.get("isreplicaset") or
+                "secondary" not in result)
+
+    if not wait_for(repl_config_loaded, timeout=REPL_CONFIG_LOAD_TIMEOUT,
+                    sleep_duration=0.2):
+        log_verbose("Server '%s' did not report a loaded replica set config "
+                    "after %s seconds. Proceeding..." %
+                    (server.id, REPL_CONFIG_LOAD_TIMEOUT))
+
 ###############################################################################
 def prepare_mongod_server(server):
     """
@@ -378,9 +450,6 @@ def _start_server_process_4real(server, options_override=None, standalone=False)
     if server.is_fork():
         child_process_out = subprocess.PIPE
 
-    global __mongod_pid__
-    global __current_server__
-
     parent_mongod = create_subprocess(start_cmd,
                                       stdout=child_process_out,
                                       preexec_fn=server_process_preexec,
@@ -389,12 +458,21 @@ def _start_server_process_4real(server, options_override=None, standalone=False)
     # check if the process was created successfully
 
     if server.is_fork():
-        __mongod_pid__ = get_forked_mongod_pid(parent_mongod)
+        mongod_pid = get_forked_mongod_pid(parent_mongod)
     else:
-        __mongod_pid__ = parent_mongod.pid
+        mongod_pid = parent_mongod.pid
 
-    __current_server__ = server
-    return __mongod_pid__
+    with __started_servers_lock__:
+        __started_servers__[mongod_pid] = server
+    return mongod_pid
+
+###############################################################################
+def get_started_servers():
+    """
+    Returns a pid => server dict of the servers started so far
+    """
+    with __started_servers_lock__:
+        return dict(__started_servers__)
 
 ###############################################################################
 def get_forked_mongod_pid(parent_mongod):
@@ -410,9 +488,14 @@ def get_forked_mongod_pid(parent_mongod):
 
 
 ###############################################################################
-def start_server_process(server, options_override=None, standalone=False):
+def start_server_process(server, options_override=None, standalone=False,
+                         parallel=False):
 
     set_server_executable_env_vars(server)
+    # remember where the log ends so that only lines of this run are watched
+    log_path = server.get_log_file_path()
+    log_follower = LogFollower(log_path, position=get_log_position(log_path))
+
     mongod_pid = _start_server_process_4real(server, options_override=options_override,
                                              standalone=standalone)
 
@@ -425,14 +508,14 @@ def start_server_process(server, options_override=None, standalone=False):
     log_info("******************************************************************"
              "*************\n")
 
-    log_tailer = tail_server_log(server)
     # wait until the server starts
     try:
-        is_online = wait_for(server_started_predicate(server, mongod_pid),
-                             timeout=SERVER_ONLINE_TIMEOUT)
+        log_prefix = "[%s] " % server.id if parallel else None
+        is_online = wait_for_server_ready(server, mongod_pid, log_follower,
+                                          timeout=SERVER_ONLINE_TIMEOUT,
+                                          log_prefix=log_prefix)
     finally:
-        # stop tailing
-        stop_tailing(log_tailer)
+        log_follower.close()
 
     log_info("\n****************************************************************"
              "***************")
@@ -554,16 +637,77 @@ def server_stopped_predicate(server, pid):
     return server_stopped
 
 ###############################################################################
-def server_started_predicate(server, mongod_pid):
-    def server_started():
-        # check if the command failed
-        if not is_pid_alive(mongod_pid):
+def wait_for_server_ready(server, mongod_pid, log_follower, timeout=None,
+                          log_prefix=None):
+    """
+    Follows the server log (echoing it) until it says the server is waiting
+    for connections, then confirms with a socket probe and a final
+    is_online() (mongod can accept connections before it answers commands,
+    e.g. during recovery). Fails as soon as the log reports a fatal startup
+    error or the process exits. The server is also probed every
+    READINESS_PROBE_INTERVAL in case the log is not available.
+    Echoed lines are prefixed with log_prefix, if any. Returns True if the server answers commands, False on timeout
+    """
+    probe_host = get_server_probe_host(server)
+    port = server.get_port()
+    start_time = time.time()
+    last_probe_time = start_time
+    fatal_line = None
+
+    while timeout is None or time.time() - start_time < timeout:
+        for line in log_follower.read_lines():
+            stdout_log((log_prefix or "") + line)
+            if SERVER_FATAL_LOG_PATTERN.search(line) and not fatal_line:
+                fatal_line = line
+            elif (SERVER_READY_LOG_PATTERN.search(line) and
+                      is_server_ready(server, probe_host, port)):
+                return True
+
+        if fatal_line:
+            raise MongoctlException("Could not start the server. Log file "
+                                    "reports: %s" % fatal_line.strip())
+
+        if not is_server_process_alive(mongod_pid):
+            # flush whatever the server logged before exiting
+            for line in log_follower.read_lines():
+                stdout_log((log_prefix or "") + line)
             raise MongoctlException("Could not start the server. Please check"
                                     " the log file.")
 
-        return server.is_online()
+        if time.time() - last_probe_time >= READINESS_PROBE_INTERVAL:
+            last_probe_time = time.time()
+            if is_server_ready(server, probe_host, port):
+                return True
 
-    return server_started
+        time.sleep(READINESS_POLL_INTERVAL)
+
+    return False
+
+###############################################################################
+def is_server_ready(server, probe_host, port):
+    # the cheap socket probe first so that is_online() (which waits for the
+    # connection timeout) only runs once the server listens
+    return is_port_open(probe_host, port) and server.is_online()
+
+###############################################################################
+def get_server_probe_host(server):
+    bind_ip = server.get_cmd_option("bind_ip")
+    if bind_ip:
+        host = str(bind_ip).split(",")[0].strip()
+        if host not in ["0.0.0.0", "::", ""]:
+            return host
+
+    return "127.0.0.1"
+
+###############################################################################
+def is_server_process_alive(pid):
+    # non-forked servers are our children: poll() so that they do not
+    # linger as zombies (which is_pid_alive() reports as alive)
+    child_process = get_child_process(pid)
+    if child_process is not None:
+        return child_process.poll() is None
+
+    return is_pid_alive(pid)
 
 ###############################################################################
 # NUMA Related functions
@@ -585,13 +729,30 @@ def apply_numactl(command):
         log_info("Using numactl '%s'" % numactl_exe)
         return [numactl_exe, "--interleave=all"] + command
     else:
-        msg = ("You are running on a NUMA machine. It is recommended to run "
-               "your server using numactl but we cannot find a numactl "
-               "executable in your PATH. Proceeding might cause problems that"
-               " will manifest in strange ways, such as massive slow downs for"
-               " periods of time or high system cpu time. Proceed?")
-        if not prompt_confirm(msg):
-            exit(0)
+        confirm_start_without_numactl()
+        return command
+
+###############################################################################
+__started_without_numactl__ = False
+
+###############################################################################
+def confirm_start_without_numactl():
+    """
+    Asks (once) whether to proceed without numactl. Exits if not. Parallel
+    starts call it up front so that the worker threads never prompt
+    """
+    global __started_without_numactl__
+    if __started_without_numactl__:
+        return
+
+    msg = ("You are running on a NUMA machine. It is recommended to run "
+           "your server using numactl but we cannot find a numactl "
+           "executable in your PATH. Proceeding might cause problems that"
+           " will manifest in strange ways, such as massive slow downs for"
+           " periods of time or high system cpu time. Proceed?")
+    if not prompt_confirm(msg):
+        exit(0)
+    __started_without_numactl__ = True
 
 ###############################################################################
 def get_numactl_exe():
@@ -672,13 +833,12 @@ def obfuscate_password_args(command):
 ###############################################################################
 
 def stop_server_signal_handler():
-    global __mongod_pid__
-
-    # otherwise prompt to kill server
-    global __current_server__
+    # prompt to kill the started server(s) if any
+    started_servers = get_started_servers().values()
 
-    if __mongod_pid__:
-        prompt_execute_task("Kill server '%s'?" % __current_server__.id,
+    if started_servers:
+        prompt_execute_task("Kill server(s) %s?" %
+                            ", ".join([s.id for s in started_servers]),
                             exit_mongoctl)
     else:
         exit_mongoctl()
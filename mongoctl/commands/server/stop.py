@@ -1,16 +1,21 @@
 __author__ = 'abdul'
 
+import os
+import re
+import time
+
 from bson.son import SON
 from mongoctl.utils import (
-    document_pretty_string, wait_for, kill_process, is_pid_alive
+    document_pretty_string, kill_process, is_pid_alive
 )
 from mongoctl.mongoctl_logging import *
-from mongoctl.errors import MongoctlException
+from mongoctl.errors import MongoctlException, ServerStopPendingError
+from mongoctl.processes import ProcessExitWatcher
 
 import mongoctl.repository
 import mongoctl.objects.server
 
-from start import server_stopped_predicate
+from tail_log import LogFollower, get_log_position
 from mongoctl.prompt import prompt_execute_task
 
 ###############################################################################
@@ -19,6 +24,31 @@ from mongoctl.prompt import prompt_execute_task
 
 MAX_SHUTDOWN_WAIT = 45
 
+# (log pattern, phase description) of the shutdown phases reported by stop
+SHUTDOWN_PHASES = [
+    (re.compile("stepping down|stepDown", re.IGNORECASE),
+     "stepping down"),
+    (re.compile("close listening sockets|closing listening socket",
+                re.IGNORECASE),
+     "closing listening sockets"),
+    (re.compile("WiredTiger.*(shutting down|closing)|checkpoint",
+                re.IGNORECASE),
+     "checkpointing data files"),
+    (re.compile("journal|final commit|flush", re.IGNORECASE),
+     "flushing journal"),
+    (re.compile("removing fs lock|removing lock file", re.IGNORECASE),
+     "removing lock file"),
+    (re.compile("dbexit|shutting down with code", re.IGNORECASE),
+     "exiting")
+]
+
+# seconds between "still waiting" progress messages during shutdown
+SHUTDOWN_PROGRESS_INTERVAL = 10
+
+# seconds to keep polling a pid that is still alive after mongod released its
+# lock file (it is still tearing down, unless the pid was recycled)
+LOCK_RELEASE_EXIT_GRACE = 5
+
 ###############################################################################
 # stop command
 ###############################################################################
@@ -42,7 +72,12 @@ def stop_server(server_id, force=False, port=None):
     do_stop_server(server, force)
 
 ###############################################################################
-def do_stop_server(server, force=False):
+def do_stop_server(server, force=False, parallel=False):
+    """
+    With parallel, the server is being stopped in a worker thread: instead of
+    prompting for a forceful stop, ServerStopPendingError is raised (see
+    prompt_force_stop_server())
+    """
     # ensure that the stop was issued locally. Fail otherwise
     server.validate_local_op("stop")
 
@@ -93,12 +128,35 @@ def do_stop_server(server, force=False):
         shutdown_success = mongo_stop_server(server, pid, force=False)
 
     if not can_stop_mongoly or not shutdown_success:
+        if parallel and not force:
+            raise ServerStopPendingError("Server '%s' did not stop "
+                                         "gracefully." % server.id, pid=pid,
+                                         try_mongo_force=can_stop_mongoly)
         log_verbose("  ... taking more forceful measures ... ")
         shutdown_success = \
             prompt_or_force_stop_server(server, pid, force,
                                         try_mongo_force=can_stop_mongoly)
 
+    end_stop_server(server, shutdown_success)
+
+###############################################################################
+def prompt_force_stop_server(server, stop_pending_error):
+    """
+    Prompts for the forceful stop of a server whose parallel stop raised
+    ServerStopPendingError. Must be called on the main thread
+    """
+    log_info("Server '%s' did not stop gracefully. Taking more forceful "
+             "measures..." % server.id)
+    shutdown_success = prompt_or_force_stop_server(
+        server, stop_pending_error.pid,
+        try_mongo_force=stop_pending_error.try_mongo_force)
+    end_stop_server(server, shutdown_success)
+
+###############################################################################
+def end_stop_server(server, shutdown_success):
     if shutdown_success:
+        # drop shared clients so later probes do not reuse dead sockets
+        server.evict_mongo_clients()
         log_info("Server '%s' has stopped." % server.id)
     else:
         raise MongoctlException("Unable to stop server '%s'." %
@@ -121,14 +179,21 @@ def mongo_stop_server(server, pid, force=False):
         log_info("\nSending the following command to %s:\n%s\n" %
                  (server.get_connection_address(),
                   document_pretty_string(shutdown_cmd)))
+        log_path = server.get_log_file_path()
+        log_follower = LogFollower(log_path,
+                                   position=get_log_position(log_path))
         server.disconnecting_db_command(shutdown_cmd, "admin")
 
         log_info("Will now wait for server '%s' to stop." % server.id)
         # Check that the server has stopped
-        stop_pred = server_stopped_predicate(server, pid)
-        wait_for(stop_pred,timeout=MAX_SHUTDOWN_WAIT)
-
-        if not stop_pred():
+        try:
+            exited = wait_for_server_exit(server, pid,
+                                          timeout=MAX_SHUTDOWN_WAIT,
+                                          log_follower=log_follower)
+        finally:
+            log_follower.close()
+
+        if not exited:
             log_error("Shutdown command failed...")
             return False
         else:
@@ -163,7 +228,7 @@ def kill_stop_server(server, pid):
     kill_process(pid, force=True)
 
     log_info("Will now wait for server '%s' (pid=%s) to die." % (server.id, pid))
-    wait_for(pid_dead_predicate(pid), timeout=MAX_SHUTDOWN_WAIT)
+    wait_for_server_exit(server, pid, timeout=MAX_SHUTDOWN_WAIT)
 
     if not is_pid_alive(pid):
         log_info("Forcefully-stopped server '%s'." % server.id)
@@ -172,6 +237,91 @@ def kill_stop_server(server, pid):
         log_error("Forceful stop of server '%s' failed." % server.id)
         return False
 
+###############################################################################
+def wait_for_server_exit(server, pid, timeout=MAX_SHUTDOWN_WAIT,
+                         log_follower=None):
+    """
+    Waits for the server process to exit, returning the moment it does.
+    Shutdown phases found in the server log are reported as they happen.
+    Unless the process is watched through a pidfd, a released mongod.lock
+    also counts as exited once the pid is gone or LOCK_RELEASE_EXIT_GRACE
+    has passed (the pid may have been recycled); if the pid is unknown the
+    lock is the only signal.
+    Returns True if the server exited within timeout
+    """
+    watcher = ProcessExitWatcher(pid) if pid is not None else None
+    start_time = time.time()
+    last_progress_time = start_time
+    current_phase = None
+    current_phase_index = -1
+    lock_release_time = None
+
+    try:
+        while True:
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                return False
+
+            if watcher is not None:
+                exited = watcher.wait(min(0.5, timeout - elapsed))
+            else:
+                time.sleep(min(0.5, timeout - elapsed))
+                exited = False
+
+            # kill(pid, 0) polling can be fooled by a recycled pid or an
+            # unsignalable process, so also consult mongod.lock
+            if not exited and (watcher is None or not watcher.uses_pidfd()):
+                exited = is_lock_file_released(server)
+                # mongod releases the lock before it is done tearing down
+                if exited and watcher is not None and watcher.is_alive():
+                    if lock_release_time is None:
+                        lock_release_time = time.time()
+                    exited = (time.time() - lock_release_time >=
+                              LOCK_RELEASE_EXIT_GRACE)
+
+            if log_follower:
+                for line in log_follower.read_lines():
+                    phase_index = get_shutdown_phase_index(line)
+                    # phases only move forward
+                    if phase_index > current_phase_index:
+                        current_phase_index = phase_index
+                        phase = SHUTDOWN_PHASES[phase_index][1]
+                        current_phase = phase
+                        last_progress_time = time.time()
+                        log_info("Server '%s' shutdown: %s..." %
+                                 (server.id, phase))
+
+            if exited:
+                return True
+
+            if time.time() - last_progress_time >= SHUTDOWN_PROGRESS_INTERVAL:
+                last_progress_time = time.time()
+                log_info("Still waiting for server '%s' to stop (%s, %d "
+                         "seconds elapsed)..." %
+                         (server.id, current_phase or "no progress logged",
+                          time.time() - start_time))
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+###############################################################################
+def get_shutdown_phase_index(log_line):
+    for i, (pattern, phase) in enumerate(SHUTDOWN_PHASES):
+        if pattern.search(log_line):
+            return i
+    return -1
+
+###############################################################################
+def is_lock_file_released(server):
+    """
+    mongod empties its mongod.lock on clean exit
+    """
+    if not hasattr(server, "get_lock_file_path"):
+        return not server.is_online()
+    lock_file_path = server.get_lock_file_path()
+    return (not os.path.exists(lock_file_path) or
+            os.path.getsize(lock_file_path) == 0)
+
 ###############################################################################
 def prompt_or_force_stop_server(server, pid,
                                 force=False, try_mongo_force=True):
@@ -217,10 +367,3 @@ def prompt_step_server_down(server, force):
                                "Step it down before proceeding to shutdown?" %
                                server.id,
                                step_down_func)
-
-###############################################################################
-def pid_dead_predicate(pid):
-    def pid_dead():
-        return not is_pid_alive(pid)
-
-    return pid_dead
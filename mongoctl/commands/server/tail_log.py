@@ -52,3 +52,70 @@ def stop_tailing(log_tailer):
     except Exception, e:
         log_exception(e)
         log_verbose("Failed to kill tail subprocess. Cause: %s" % e)
+
+###############################################################################
+def get_log_position(log_path):
+    """
+    Returns the (inode, size) of the log file or None if it does not exist
+    """
+    try:
+        st = os.stat(log_path)
+        return st.st_ino, st.st_size
+    except OSError:
+        return None
+
+###############################################################################
+# LogFollower Class
+###############################################################################
+class LogFollower(object):
+    """
+    In-process 'tail -f'. Returns lines appended to a log file after the
+    specified position. Copes with the log file not existing yet and with
+    it being replaced (mongod renames the previous log on start unless
+    --logappend is used) or truncated.
+    """
+
+    ###########################################################################
+    def __init__(self, log_path, position=None):
+        self.log_path = log_path
+        self._inode, self._offset = position or (None, 0)
+        self._file = None
+        self._partial_line = ""
+
+    ###########################################################################
+    def read_lines(self):
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return []
+
+        if st.st_ino != self._inode:
+            # new file: read it from the beginning
+            self.close()
+            self._inode = st.st_ino
+            self._offset = 0
+            self._partial_line = ""
+        elif st.st_size < self._offset:
+            # truncated
+            self._offset = 0
+            self._partial_line = ""
+
+        if self._file is None:
+            self._file = open(self.log_path)
+
+        self._file.seek(self._offset)
+        data = self._file.read()
+        self._offset += len(data)
+
+        lines = (self._partial_line + data).split("\n")
+        self._partial_line = lines.pop()
+        return lines
+
+    ###########################################################################
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception, e:
+                log_exception(e)
+            self._file = None
@@ -1,6 +1,8 @@
 __author__ = 'abdul'
 
 import urllib
+import hashlib
+import cPickle
 
 from utils import *
 
@@ -14,6 +16,14 @@ from bson import json_util
 ###############################################################################
 MONGOCTL_CONF_FILE_NAME = "mongoctl.config"
 
+# where compiled snapshots of local config files are kept. null disables them
+DEFAULT_CONFIG_SNAPSHOTS_DIR = "~/.mongoctl/config_snapshots"
+
+# local cache of downloaded/published mongodb archives (see binary_cache).
+# A max size of 0 disables it
+DEFAULT_BINARY_CACHE_DIR = "~/.mongoctl/binary_cache"
+DEFAULT_BINARY_CACHE_MAX_SIZE_MB = 4096
+
 
 ###############################################################################
 # Config root / files stuff
@@ -61,6 +71,22 @@ def get_mongodb_installs_dir():
 def set_mongodb_installs_dir(installs_dir):
     set_mongoctl_config_val('mongoDBInstallationsDirectory', installs_dir)
 
+###############################################################################
+def get_binary_cache_dir():
+    return resolve_path(get_mongoctl_config_val('binaryCacheDirectory',
+                                                DEFAULT_BINARY_CACHE_DIR))
+
+###############################################################################
+def get_binary_cache_max_size_mb():
+    return int(get_mongoctl_config_val('binaryCacheMaxSizeMB',
+                                       DEFAULT_BINARY_CACHE_MAX_SIZE_MB))
+
+###############################################################################
+def get_config_snapshots_dir():
+    snapshots_dir = get_mongoctl_config_val('configSnapshotsDirectory',
+                                            DEFAULT_CONFIG_SNAPSHOTS_DIR)
+    return snapshots_dir and resolve_path(snapshots_dir)
+
 ###############################################################################
 
 def get_default_users():
@@ -97,24 +123,35 @@ def get_mongoctl_config():
     global __mongo_config__
 
     if __mongo_config__ is None:
+        # mongoctl.config says where snapshots go so it is never snapshotted
         __mongo_config__ = read_config_json("mongoctl",
-                                            MONGOCTL_CONF_FILE_NAME)
+                                            MONGOCTL_CONF_FILE_NAME,
+                                            use_snapshot=False)
 
     return __mongo_config__
 
 
 ###############################################################################
-def read_config_json(name, path_or_url):
+def read_config_json(name, path_or_url, use_snapshot=True):
 
     try:
         log_verbose("Reading %s configuration"
                     " from '%s'..." % (name, path_or_url))
 
-        json_str = read_json_string(path_or_url)
-        # minify the json/remove comments and sh*t
-        json_str = json_minify(json_str)
-        json_val =json.loads(json_str,
-                             object_hook=json_util.object_hook)
+        json_val = None
+        if use_snapshot:
+            json_val = read_config_snapshot(path_or_url)
+        if json_val is None:
+            # grab the signature before reading so that a concurrent edit
+            # results in a stale (not a wrong) snapshot
+            signature = get_config_file_signature(path_or_url)
+            json_str = read_json_string(path_or_url)
+            # minify the json/remove comments and sh*t
+            json_str = json_minify(json_str)
+            json_val =json.loads(json_str,
+                                 object_hook=json_util.object_hook)
+            if use_snapshot and signature:
+                save_config_snapshot(path_or_url, signature, json_val)
 
         if not json_val and not isinstance(json_val,list): # b/c [] is not True
             raise MongoctlException("Unable to load %s "
@@ -127,6 +164,86 @@ def read_config_json(name, path_or_url):
         raise MongoctlException("Unable to load %s "
                                 "config file: %s: %s" % (name, path_or_url, e))
 
+###############################################################################
+# Config snapshots
+###############################################################################
+# Parsed local config files are pickled into the configSnapshotsDirectory
+# so that later invocations skip json_minify/json.loads. A snapshot is only
+# used while its source file's mtime and size are unchanged.
+
+def get_config_snapshot_path(full_path):
+    """
+    Returns the snapshot path of full_path or None if snapshots are disabled
+    """
+    snapshots_dir = get_config_snapshots_dir()
+    if not snapshots_dir:
+        return None
+    snapshot_name = "%s.pickle" % hashlib.sha1(full_path).hexdigest()
+    return os.path.join(snapshots_dir, snapshot_name)
+
+###############################################################################
+def get_config_file_signature(path_or_url):
+    """
+    Returns (mtime, size) of a local config file or None if it is not one
+    """
+    full_path = to_full_config_path(path_or_url)
+    if is_url(full_path) or not os.path.isfile(full_path):
+        return None
+
+    st = os.stat(full_path)
+    return st.st_mtime, st.st_size
+
+###############################################################################
+def read_config_snapshot(path_or_url):
+    signature = get_config_file_signature(path_or_url)
+    if signature is None:
+        return None
+
+    full_path = to_full_config_path(path_or_url)
+
+    snapshot_path = get_config_snapshot_path(full_path)
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return None
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = cPickle.load(f)
+        if (snapshot["source"] == full_path and
+                snapshot["signature"] == signature):
+            log_verbose("Using config snapshot '%s' for '%s'" %
+                        (snapshot_path, full_path))
+            return snapshot["value"]
+    except Exception, e:
+        log_exception(e)
+        log_verbose("Ignoring bad config snapshot '%s': %s" %
+                    (snapshot_path, e))
+
+    return None
+
+###############################################################################
+def save_config_snapshot(path_or_url, signature, json_val):
+    full_path = to_full_config_path(path_or_url)
+    snapshot_path = get_config_snapshot_path(full_path)
+    if not snapshot_path:
+        return
+    try:
+        ensure_dir(os.path.dirname(snapshot_path))
+        snapshot = {
+            "source": full_path,
+            "signature": signature,
+            "value": json_val
+        }
+        # write then rename so readers never see a partial snapshot
+        tmp_path = "%s.%s" % (snapshot_path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            cPickle.dump(snapshot, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, snapshot_path)
+    except Exception, e:
+        # snapshots are only an optimization, never fail because of them
+        log_exception(e)
+        log_verbose("Unable to save config snapshot for '%s': %s" %
+                    (full_path, e))
+
 ###############################################################################
 def read_json_string(path_or_url, validate_exists=True):
     path_or_url = to_full_config_path(path_or_url)
@@ -15,6 +15,25 @@ class MongoctlException(Exception):
 class FileNotInRepoError(MongoctlException):
     pass
 
+###############################################################################
+class PromptNotAllowedError(MongoctlException):
+    """
+    Raised when a thread that has prompting disabled needs to prompt (see
+    prompt.disable_thread_prompting())
+    """
+    pass
+
+###############################################################################
+class ServerStopPendingError(MongoctlException):
+    """
+    Raised by parallel stops when a server did not stop gracefully and the
+    (prompted) forceful stop is left to the caller's main thread
+    """
+    def __init__(self, message, pid=None, try_mongo_force=True):
+        super(ServerStopPendingError, self).__init__(message)
+        self.pid = pid
+        self.try_mongo_force = try_mongo_force
+
 
 def is_auth_error(e):
     return isinstance(e, OperationFailure) and e.code == 13
\ No newline at end of file
@@ -4,6 +4,8 @@ import pymongo
 import pymongo.uri_parser
 import pymongo.errors
 
+import threading
+
 import mongoctl_logging
 
 from pymo import mongo_client as _mongo_client
@@ -11,6 +13,10 @@ from pymo import mongo_client as _mongo_client
 # db connection timeout, 10 seconds
 CONN_TIMEOUT_MS = 10000
 
+# max sockets per shared client so that threaded callers do not queue on a
+# single one. Callers can ask for a different pool with maxPoolSize
+SHARED_CLIENT_POOL_SIZE = 16
+
 ###############################################################################
 def mongo_client(*args, **kwargs):
     """
@@ -23,19 +29,146 @@ def mongo_client(*args, **kwargs):
     kwargs = kwargs or {}
     connection_timeout_ms = kwargs.get("connectTimeoutMS") or CONN_TIMEOUT_MS
 
-    kwargs.update({
-        "socketTimeoutMS": connection_timeout_ms,
-        "connectTimeoutMS": connection_timeout_ms,
-        "maxPoolSize": 1
-    })
+    kwargs["connectTimeoutMS"] = connection_timeout_ms
+    # socketTimeoutMS=None (no timeout) is honored for long running ops
+    if "socketTimeoutMS" not in kwargs:
+        kwargs["socketTimeoutMS"] = connection_timeout_ms
+    if not kwargs.get("maxPoolSize"):
+        kwargs["maxPoolSize"] = 1
 
-    if pymongo.get_version_string().startswith("3.2"):
+    if is_pymongo_3_2():
         if kwargs and kwargs.get("serverSelectionTimeoutMS") is None:
             kwargs["connect"] = True
             kwargs["serverSelectionTimeoutMS"] = connection_timeout_ms
 
     return _mongo_client(*args, **kwargs)
 
+###############################################################################
+def is_pymongo_3_2():
+    return pymongo.get_version_string().startswith("3.2")
 
+###############################################################################
+# Shared client registry
+###############################################################################
+# process-wide registry of connected clients keyed by (address, client args,
+# login)
+__mongo_client_registry__ = {}
 
+__mongo_client_registry_lock__ = threading.RLock()
 
+###############################################################################
+def get_shared_mongo_client(address, check_health=True, login=None,
+                            **kwargs):
+    """
+    Returns a connected client for address/kwargs from the process-wide
+    registry, creating one if needed. kwargs (ssl params, timeouts, pool
+    size) and login are part of the registry key so clients with different
+    settings are never shared. Clients have a pool of
+    SHARED_CLIENT_POOL_SIZE sockets unless kwargs has a maxPoolSize.
+    Reused clients are health-checked with a single ismaster round trip
+    and are evicted/re-created if the check fails.
+    :param address:
+    :param check_health: whether to verify a reused client before returning it
+    :param login: (auth source db, username) of the only user that may
+     authenticate on the client, None for clients that are never
+     authenticated. See get_login_db()
+    :param kwargs: same as mongo_client()
+    :return:
+    """
+    kwargs = kwargs or {}
+    if not kwargs.get("maxPoolSize"):
+        kwargs["maxPoolSize"] = SHARED_CLIENT_POOL_SIZE
+    # bound server selection so that health checks against dead servers
+    # fail within the connection timeout (mongo_client() already does it,
+    # and connects eagerly, with pymongo 3.2)
+    if kwargs.get("serverSelectionTimeoutMS") is None and not is_pymongo_3_2():
+        kwargs["serverSelectionTimeoutMS"] = (kwargs.get("connectTimeoutMS") or
+                                              CONN_TIMEOUT_MS)
+
+    key = _client_registry_key(address, kwargs, login)
+
+    with __mongo_client_registry_lock__:
+        client = __mongo_client_registry__.get(key)
+
+    if client is not None:
+        if not check_health or _is_client_healthy(client):
+            return client
+        mongoctl_logging.log_verbose("Evicting unhealthy client for '%s'" %
+                                     address)
+        _evict_registry_key(key)
+
+    client = mongo_client(address, **kwargs)
+    with __mongo_client_registry_lock__:
+        existing = __mongo_client_registry__.get(key)
+        if existing is not None:
+            # another thread won the race; use its client and drop ours
+            _close_client(client)
+            return existing
+        __mongo_client_registry__[key] = client
+
+    return client
+
+###############################################################################
+def get_login_db(db, username):
+    """
+    Returns db on the shared client with the settings of db's client that
+    is reserved to username logging in to db. Authenticating on a shared
+    client would otherwise hand the login to every user of that client (and
+    fail for a second user of the same db)
+    """
+    login = (db.name, username)
+    with __mongo_client_registry_lock__:
+        keys = [key for key, client in __mongo_client_registry__.items()
+                if client is db.client]
+    if not keys or keys[0][2] == login:
+        # not a shared client (or already the login's own)
+        return db
+    address, kwargs, client_login = keys[0]
+    client = get_shared_mongo_client(address, check_health=False,
+                                     login=login, **dict(kwargs))
+    return client.get_database(db.name)
+
+###############################################################################
+def evict_mongo_client(address):
+    """
+    Closes and removes all registry clients connected to address
+    """
+    with __mongo_client_registry_lock__:
+        keys = [key for key in __mongo_client_registry__
+                if key[0] == address]
+    for key in keys:
+        _evict_registry_key(key)
+
+###############################################################################
+def clear_mongo_client_registry():
+    with __mongo_client_registry_lock__:
+        keys = __mongo_client_registry__.keys()
+    for key in keys:
+        _evict_registry_key(key)
+
+###############################################################################
+def _client_registry_key(address, kwargs, login=None):
+    return address, tuple(sorted(kwargs.items())), login
+
+###############################################################################
+def _evict_registry_key(key):
+    with __mongo_client_registry_lock__:
+        client = __mongo_client_registry__.pop(key, None)
+    if client is not None:
+        _close_client(client)
+
+###############################################################################
+def _is_client_healthy(client):
+    try:
+        client.admin.command("ismaster")
+        return True
+    except Exception, e:
+        mongoctl_logging.log_exception(e)
+        return False
+
+###############################################################################
+def _close_client(client):
+    try:
+        client.close()
+    except Exception, e:
+        mongoctl_logging.log_exception(e)
@@ -626,6 +626,83 @@ MONGOCTL_PARSER_DEF = {
                         "--use-best-secondary"
                     ],
                     "nargs": 0
+                },
+                    {
+                    "name": "perShard",
+                    "type" : "optional",
+                    "help": "Only for sharded clusters. Stop the balancer "
+                            "and dump the config servers and every shard in "
+                            "parallel (each from its best secondary with "
+                            "--oplog). The output can be restored with "
+                            "restore",
+                    "cmd_arg": [
+                        "--per-shard"
+                    ],
+                    "nargs": 0
+                },
+                    {
+                    "name": "nativeDump",
+                    "type" : "optional",
+                    "help": "Use mongoctl's built-in multi-threaded dump "
+                            "engine instead of mongodump. Large collections "
+                            "are read in _id ranges by concurrent cursors",
+                    "cmd_arg": [
+                        "--native"
+                    ],
+                    "nargs": 0
+                },
+                    {
+                    "name": "nativeWorkers",
+                    "type" : "optional",
+                    "help": "Used only with --native. Number of concurrent "
+                            "cursors (default 8)",
+                    "cmd_arg": [
+                        "--native-workers"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "compress",
+                    "type" : "optional",
+                    "help": "Stream the dump as a single archive compressed "
+                            "on the fly into the out dir (none, gzip, zstd "
+                            "or lz4) in chunks with sha256 checksums",
+                    "cmd_arg": [
+                        "--compress"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "chunkSize",
+                    "type" : "optional",
+                    "help": "Used only with --compress. Max size of each "
+                            "archive chunk file in MB (default 1024)",
+                    "cmd_arg": [
+                        "--chunk-size"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "oplogSlice",
+                    "type" : "optional",
+                    "help": "Incremental backup. Only dump the oplog entries "
+                            "written since the last full dump (or slice) in "
+                            "the out dir into a compressed slice file",
+                    "cmd_arg": [
+                        "--oplog-slice"
+                    ],
+                    "nargs": 0
+                },
+                    {
+                    "name": "startOplogChain",
+                    "type" : "optional",
+                    "help": "Record the oplog position of this full dump of "
+                            "a replica set member in the out dir so that "
+                            "--oplog-slice dumps can follow it",
+                    "cmd_arg": [
+                        "--start-oplog-chain"
+                    ],
+                    "nargs": 0
                 },
                 #   {
                 #    "name": "maxReplLag",
@@ -980,6 +1057,54 @@ MONGOCTL_PARSER_DEF = {
                     "cmd_arg":  ["--numParallelCollections", "-j"],
                     "nargs": 1,
                     "help": "number of collections to restore in parallel (4 by default)"
+                },
+                {
+                    "name": "numInsertionWorkersPerCollection",
+                    "type": "optional",
+                    "cmd_arg":  "--numInsertionWorkersPerCollection",
+                    "nargs": 1,
+                    "help": "number of insert operations to run concurrently "
+                            "per collection (1 by default, 4 for --until). "
+                            "3.0.x or greater only."
+                },
+                {
+                    "name": "fastRestore",
+                    "type": "optional",
+                    "cmd_arg":  "--fast",
+                    "nargs": 0,
+                    "help": "high throughput restore: size parallel "
+                            "collections and insertion workers from the "
+                            "target's cores and members, restore data "
+                            "without indexes then build indexes in parallel "
+                            "per collection. 3.0.x or greater only."
+                },
+                {
+                    "name": "throttleReplLag",
+                    "type": "optional",
+                    "cmd_arg":  "--throttle-repl-lag",
+                    "nargs": 1,
+                    "help": "when restoring into a live replica set, pause "
+                            "the restore whenever a secondary falls more "
+                            "than this many secs behind the primary and "
+                            "resume once it is halfway caught up"
+                },
+                {
+                    "name": "until",
+                    "type": "optional",
+                    "cmd_arg":  "--until",
+                    "nargs": 1,
+                    "help": "point in time restore: restore a full dump taken"
+                            " by mongoctl then replay its oplog slices up to"
+                            " (and including) this oplog timestamp, given "
+                            "as <seconds>[:<increment>]"
+                },
+                {
+                    "name": "replayWorkers",
+                    "type": "optional",
+                    "cmd_arg":  "--replay-workers",
+                    "nargs": 1,
+                    "help": "max number of namespaces to apply oplog ops to "
+                            "at the same time with --until (8 by default)"
                 }
             ]
         },
@@ -997,6 +1122,34 @@ MONGOCTL_PARSER_DEF = {
                     "nargs": 1,
                     "displayName": "SERVER_ID",
                     "help": "a valid server id"
+                },
+                    {
+                    "name": "seedFrom",
+                    "type" : "optional",
+                    "cmd_arg": ["--seed-from"],
+                    "nargs": 1,
+                    "help": "seed the dbpath with a copy of the data files of"
+                            " this (local) secondary instead of doing a full"
+                            " initial sync",
+                    "default": None
+                },
+                    {
+                    "name": "stopSeed",
+                    "type" : "optional",
+                    "cmd_arg": ["--stop-seed"],
+                    "nargs": 0,
+                    "help": "stop the seed server during the copy instead of"
+                            " locking it with fsyncLock",
+                    "default": False
+                },
+                    {
+                    "name": "copyWorkers",
+                    "type" : "optional",
+                    "cmd_arg": ["--copy-workers"],
+                    "nargs": 1,
+                    "help": "max number of files copied at the same time when"
+                            " seeding (default 8)",
+                    "default": None
                 },
                     {
                     "name": "assumeLocal",
@@ -1115,6 +1268,171 @@ MONGOCTL_PARSER_DEF = {
             ]
         },
 
+        #### start-cluster ####
+            {
+            "prog": "start-cluster",
+            "group": "clusterCommands",
+            "shortDescription" : "start all servers of a cluster",
+            "description" : "Starts all local servers of a replica set or "
+                            "sharded cluster in parallel. Sharded clusters "
+                            "are started in order: \nconfig servers, shards "
+                            "then mongos routers. Each replica set is \n"
+                            "initialized once all its members are started.",
+            "function": "mongoctl.commands.cluster.start_cluster.start_cluster_command",
+            "args": [
+                    {
+                    "name": "cluster",
+                    "type" : "positional",
+                    "nargs": 1,
+                    "displayName": "CLUSTER_ID",
+                    "help": "A valid cluster id"
+                },
+                    {
+                    "name": "maxParallel",
+                    "type" : "optional",
+                    "cmd_arg":  ["--max-parallel"],
+                    "nargs": 1,
+                    "help": "max number of servers to start at the same time"
+                            " (default 10)",
+                    "default": None
+                },
+                    {
+                    "name": "rsInit",
+                    "type" : "optional",
+                    "cmd_arg":  ["--rs-init"],
+                    "nargs": 0,
+                    "help": "initialize replica sets (or add new members) "
+                            "without prompting",
+                    "default": False
+                },
+                    {
+                    "name": "username",
+                    "type" : "optional",
+                    "help": "admin username",
+                    "cmd_arg": [
+                        "-u"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "password",
+                    "type" : "optional",
+                    "help": "admin password",
+                    "cmd_arg": [
+                        "-p"
+                    ],
+                    "nargs": "?"
+                }
+            ]
+        },
+
+        #### stop-cluster ####
+            {
+            "prog": "stop-cluster",
+            "group": "clusterCommands",
+            "shortDescription" : "stop all servers of a cluster",
+            "description" : "Stops all local servers of a replica set or "
+                            "sharded cluster in parallel. Sharded clusters "
+                            "are stopped in order: \nmongos routers, shards "
+                            "then config servers. In each replica set, \n"
+                            "the primary is first stepped down to its most "
+                            "caught-up secondary, \nthen the other members "
+                            "are stopped and that secondary last.",
+            "function": "mongoctl.commands.cluster.stop_cluster.stop_cluster_command",
+            "args": [
+                    {
+                    "name": "cluster",
+                    "type" : "positional",
+                    "nargs": 1,
+                    "displayName": "CLUSTER_ID",
+                    "help": "A valid cluster id"
+                },
+                    {
+                    "name": "maxParallel",
+                    "type" : "optional",
+                    "cmd_arg":  ["--max-parallel"],
+                    "nargs": 1,
+                    "help": "max number of servers to stop at the same time"
+                            " (default 10)",
+                    "default": None
+                },
+                    {   "name": "forceStop",
+                        "type": "optional",
+                        "cmd_arg": ["-f", "--force"],
+                        "nargs": 0,
+                        "help": "force stop if needed via kill",
+                        "default": False
+                },
+                    {
+                    "name": "username",
+                    "type" : "optional",
+                    "help": "admin username",
+                    "cmd_arg": [
+                        "-u"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "password",
+                    "type" : "optional",
+                    "help": "admin password",
+                    "cmd_arg": [
+                        "-p"
+                    ],
+                    "nargs": "?"
+                }
+            ]
+        },
+
+        #### rolling-restart ####
+            {
+            "prog": "rolling-restart",
+            "group": "clusterCommands",
+            "shortDescription" : "restart a replica set one member at a time",
+            "description" : "Restarts the members of a replica set cluster "
+                            "one at a time. Each restarted \nsecondary has "
+                            "to catch up before the next one is restarted. "
+                            "The primary \nis stepped down to the most "
+                            "caught-up secondary and restarted last.",
+            "function": "mongoctl.commands.cluster.rolling_restart.rolling_restart_command",
+            "args": [
+                    {
+                    "name": "cluster",
+                    "type" : "positional",
+                    "nargs": 1,
+                    "displayName": "CLUSTER_ID",
+                    "help": "A valid replica set cluster id"
+                },
+                    {
+                    "name": "maxReplLag",
+                    "type" : "optional",
+                    "cmd_arg":  ["--max-repl-lag"],
+                    "nargs": 1,
+                    "help": "max repl lag (in seconds) of a restarted member"
+                            " before moving on (default 10)",
+                    "default": None
+                },
+                    {
+                    "name": "username",
+                    "type" : "optional",
+                    "help": "admin username",
+                    "cmd_arg": [
+                        "-u"
+                    ],
+                    "nargs": 1
+                },
+                    {
+                    "name": "password",
+                    "type" : "optional",
+                    "help": "admin password",
+                    "cmd_arg": [
+                        "-p"
+                    ],
+                    "nargs": "?"
+                }
+            ]
+        },
+
         #### install-mongodb ####
             {
             "prog": "install-mongodb",
@@ -0,0 +1,312 @@
+__author__ = 'abdul'
+
+import os
+import datetime
+import threading
+import time
+
+from bson import json_util, ObjectId
+from bson.son import SON
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from mongoctl_logging import log_info, log_verbose
+from errors import MongoctlException
+from utils import ensure_dir, parallel_map
+
+###############################################################################
+# CONSTS
+###############################################################################
+DEFAULT_NATIVE_DUMP_WORKERS = 8
+
+# collections smaller than this (in bytes) are read with a single cursor
+MIN_PARTITIONED_COLLECTION_SIZE = 64 * 1024 * 1024
+
+# number of _id ranges per worker for partitioned collections. More ranges
+# than workers keeps all workers busy when ranges are uneven
+RANGES_PER_WORKER = 4
+
+# documents per (locked) write to a collection's bson file
+WRITE_BATCH_SIZE = 1000
+
+# databases that are never dumped
+EXCLUDED_DATABASES = ["local"]
+
+# system collections that are dumped
+INCLUDED_SYSTEM_COLLECTIONS = ["system.js", "system.users", "system.roles",
+                               "system.version"]
+
+# _id types that ranges can be made of along with the BSON type codes that
+# sort in the same bracket. A range query only matches _ids of its bracket
+PARTITION_ID_TYPES = [
+    ((ObjectId,), [7]),
+    ((int, long, float), [1, 16, 18, 19]),
+    ((basestring,), [2, 14]),
+    ((datetime.datetime,), [9])
+]
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+###############################################################################
+# native_dump
+###############################################################################
+def native_dump(server, out_dir, database=None, collection=None, query=None,
+                username=None, password=None,
+                workers=DEFAULT_NATIVE_DUMP_WORKERS):
+    """
+    Dumps server using pymongo instead of mongodump. Output has the same
+    layout as mongodump's (<out>/<db>/<collection>.bson and
+    .metadata.json) and can be restored with mongorestore. Large
+    collections are split into _id ranges which are read concurrently by
+    up to workers cursors, on a client with a socket per worker and no
+    socket timeout (a cursor may take long to fill a batch of a filtered
+    range).
+    """
+    if collection and not database:
+        raise MongoctlException("A collection can only be dumped with a "
+                                "database")
+
+    if isinstance(query, basestring):
+        query = json_util.loads(query)
+
+    if database:
+        db_names = [database]
+    else:
+        admin_db = server.get_db("admin", username=username,
+                                 password=password)
+        db_names = [name for name in admin_db.client.database_names()
+                    if name not in EXCLUDED_DATABASES]
+
+    start_time = time.time()
+    tasks = []
+    writers = []
+    for db_name in db_names:
+        db = server.get_worker_db(db_name, workers, username=username,
+                                  password=password)
+        db_out_dir = os.path.join(out_dir, db_name)
+        ensure_dir(db_out_dir)
+
+        for coll_name, options in get_dump_collections(db, collection):
+            write_collection_metadata(db, coll_name, options, db_out_dir)
+            writer = CollectionDumpWriter(
+                os.path.join(db_out_dir, "%s.bson" % coll_name))
+            writers.append(writer)
+
+            range_filters = get_id_range_filters(db, coll_name, workers)
+            log_verbose("Dumping %s.%s with %s cursor(s)" %
+                        (db_name, coll_name, len(range_filters)))
+            for range_filter in range_filters:
+                writer.add_task()
+                tasks.append((db[coll_name], merge_filters(query, range_filter),
+                              writer))
+
+    try:
+        results = parallel_map(dump_range, tasks, max_workers=workers)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    failed = [(task, ex) for task, result, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to dump %s range(s) of server '%s'. "
+                                "First error: %s" %
+                                (len(failed), server.id, failed[0][1]))
+
+    total_docs = sum([w.document_count for w in writers])
+    total_bytes = sum([w.byte_count for w in writers])
+    duration = max(time.time() - start_time, 0.001)
+    log_info("Dumped %s document(s) (%.1f MB) from %s collection(s) of "
+             "server '%s' in %.1f secs (%.1f MB/s)" %
+             (total_docs, total_bytes / 1048576.0, len(writers), server.id,
+              duration, total_bytes / 1048576.0 / duration))
+
+###############################################################################
+def get_dump_collections(db, collection=None):
+    """
+    Returns a list of (collection name, options) of db to dump. Views are
+    skipped.
+    """
+    result = []
+    for coll_info in db.list_collections():
+        name = coll_info["name"]
+        if collection and name != collection:
+            continue
+        if coll_info.get("type") == "view":
+            continue
+        if (name.startswith("system.") and
+                name not in INCLUDED_SYSTEM_COLLECTIONS):
+            continue
+        result.append((name, coll_info.get("options", {})))
+
+    return result
+
+###############################################################################
+def write_collection_metadata(db, coll_name, options, db_out_dir):
+    metadata = {
+        "options": options,
+        "indexes": list(db[coll_name].list_indexes())
+    }
+    path = os.path.join(db_out_dir, "%s.metadata.json" % coll_name)
+    with open(path, "w") as f:
+        f.write(json_util.dumps(metadata))
+
+###############################################################################
+def get_id_range_filters(db, coll_name, workers):
+    """
+    Returns a list of filters that together match every document of the
+    collection exactly once
+    """
+    stats = db.command("collstats", coll_name)
+    if stats.get("size", 0) < MIN_PARTITIONED_COLLECTION_SIZE or workers < 2:
+        return [{}]
+
+    num_ranges = workers * RANGES_PER_WORKER
+    return make_id_range_filters(get_id_split_points(db, coll_name, stats,
+                                                     num_ranges))
+
+###############################################################################
+def get_id_split_points(db, coll_name, stats, num_ranges):
+    """
+    Returns up to num_ranges - 1 sorted _id values splitting the collection
+    into ranges of about the same size, using splitVector or, if that fails
+    (e.g. no privileges), a $sample of _ids
+    """
+    split_points = []
+    try:
+        cmd = SON([("splitVector", "%s.%s" % (db.name, coll_name)),
+                   ("keyPattern", {"_id": 1}),
+                   ("maxChunkSizeBytes",
+                    max(stats["size"] / num_ranges, 1024 * 1024))])
+        split_points = [key["_id"] for key in
+                        db.command(cmd).get("splitKeys", [])]
+    except Exception, e:
+        log_verbose("splitVector failed for %s.%s (%s). Sampling _ids "
+                    "instead..." % (db.name, coll_name, e))
+        try:
+            pipeline = [{"$sample": {"size": num_ranges * 10}},
+                        {"$project": {"_id": 1}}]
+            split_points = sorted([doc["_id"] for doc in
+                                   db[coll_name].aggregate(pipeline)])
+        except Exception, e:
+            log_verbose("Unable to sample _ids of %s.%s (%s). Using a single"
+                        " cursor." % (db.name, coll_name, e))
+
+    # keep num_ranges - 1 evenly spread points
+    if len(split_points) >= num_ranges:
+        step = float(len(split_points)) / num_ranges
+        split_points = [split_points[int(i * step)]
+                        for i in range(1, num_ranges)]
+    return split_points
+
+###############################################################################
+def make_id_range_filters(split_points):
+    """
+    Makes the range filters for sorted split_points: one per range, plus one
+    for the _ids of other types (which no range query matches)
+    """
+    points = []
+    for point in split_points:
+        if not points or points[-1] != point:
+            points.append(point)
+    if not points:
+        return [{}]
+
+    type_codes = None
+    for python_types, codes in PARTITION_ID_TYPES:
+        if all([isinstance(p, python_types) and not isinstance(p, bool)
+                for p in points]):
+            type_codes = codes
+            break
+    if not type_codes:
+        # mixed or unsupported types
+        return [{}]
+
+    filters = [{"_id": {"$lt": points[0]}}]
+    for low, high in zip(points, points[1:]):
+        filters.append({"_id": {"$gte": low, "$lt": high}})
+    filters.append({"_id": {"$gte": points[-1]}})
+    filters.append({"$nor": [{"_id": {"$type": code}}
+                             for code in type_codes]})
+    return filters
+
+###############################################################################
+def merge_filters(query, range_filter):
+    if not query:
+        return range_filter
+    elif not range_filter:
+        return query
+    return {"$and": [query, range_filter]}
+
+###############################################################################
+def dump_range(task):
+    collection, range_filter, writer = task
+    raw_collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+    try:
+        batch = []
+        for doc in raw_collection.find(range_filter):
+            batch.append(doc.raw)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                writer.write_documents(batch)
+                batch = []
+        if batch:
+            writer.write_documents(batch)
+    finally:
+        writer.task_done()
+
+###############################################################################
+# CollectionDumpWriter
+###############################################################################
+class CollectionDumpWriter(object):
+    """
+    Appends raw BSON documents from multiple cursors to a single .bson file.
+    The file is only open while the collection's tasks run: it is opened by
+    the first write and closed when the last task is done, so that a dump
+    of many collections does not hold a file per collection open
+    """
+
+    ###########################################################################
+    def __init__(self, path):
+        self.path = path
+        self.document_count = 0
+        self.byte_count = 0
+        self._file = None
+        self._closed = False
+        self._pending_tasks = 0
+        self._lock = threading.Lock()
+
+    ###########################################################################
+    def add_task(self):
+        with self._lock:
+            self._pending_tasks += 1
+
+    ###########################################################################
+    def task_done(self):
+        with self._lock:
+            self._pending_tasks -= 1
+            if self._pending_tasks <= 0:
+                self._close()
+
+    ###########################################################################
+    def write_documents(self, raw_documents):
+        data = "".join(raw_documents)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "wb")
+            self._file.write(data)
+            self.document_count += len(raw_documents)
+            self.byte_count += len(data)
+
+    ###########################################################################
+    def close(self):
+        with self._lock:
+            self._close()
+
+    ###########################################################################
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._file is None:
+            # empty collection: mongorestore still expects the file
+            self._file = open(self.path, "wb")
+        self._file.close()
@@ -1,5 +1,8 @@
 __author__ = 'abdul'
 
+import threading
+import Queue
+
 import mongoctl.repository as repository
 
 from cluster import Cluster
@@ -7,11 +10,36 @@ from mongoctl import users
 from base import DocumentWrapper
 from mongoctl.utils import *
 from bson import DBRef
+from bson.son import SON
 
 from mongoctl.config import get_cluster_member_alt_address_mapping
-from mongoctl.mongoctl_logging import log_verbose, log_error, log_db_command
+from mongoctl.mongoctl_logging import (
+    log_verbose, log_error, log_warning, log_db_command
+)
 
-from mongoctl.prompt import prompt_confirm
+from mongoctl.prompt import prompt_confirm, disable_thread_prompting
+from mongoctl.errors import PromptNotAllowedError
+
+###############################################################################
+# CONSTS
+###############################################################################
+# max number of members queried concurrently
+MAX_MEMBER_QUERY_WORKERS = 10
+
+# deadline (in seconds) for a fan-out member query. Members that do not
+# answer by then are left out of the results
+MEMBER_QUERY_TIMEOUT = 15
+
+# max repl lag (in seconds) a restarted member may have before a rolling
+# restart moves on to the next member
+ROLLING_RESTART_MAX_REPL_LAG = 10
+
+# max time (in seconds) to wait for a restarted member to catch up
+ROLLING_RESTART_MEMBER_TIMEOUT = 60 * 10
+
+# secs the other electable secondaries are frozen for while the primary
+# steps down, so that the selected candidate wins the election
+STEP_DOWN_FREEZE_SECS = 30
 
 ###############################################################################
 # ReplicaSet Cluster Member Class
@@ -299,18 +327,29 @@ class ReplicaSetCluster(Cluster):
 
     ###########################################################################
     def get_primary_member(self):
-        for member in self.get_members():
-            if member.get_server().is_primary():
+        results = query_members(self.get_members(),
+                                lambda member: member.get_server().is_primary(),
+                                done=lambda member, is_primary: is_primary,
+                                raise_errors=True)
+        for member, is_primary in results:
+            if is_primary:
                 return member
 
         return None
 
     ###########################################################################
     def suggest_primary_member(self):
-        for member in self.get_members():
-            if(member.can_become_primary() and
-                       member.get_server() is not None and
-                   member.get_server().is_online_locally()):
+        candidates = filter(lambda m: m.can_become_primary(),
+                            self.get_members())
+
+        def is_online_locally(member):
+            server = member.get_server()
+            return server is not None and server.is_online_locally()
+
+        results = dict(query_members(candidates, is_online_locally))
+        # preserve configuration order
+        for member in candidates:
+            if results.get(member):
                 return member
 
     ###########################################################################
@@ -393,9 +432,15 @@ class ReplicaSetCluster(Cluster):
                                     " primary member '%s'" %
                                     primary_member.get_server().id)
 
-        for member in self.get_members():
-            if member.get_server().is_secondary():
-                repl_lag = member.get_server().get_repl_lag(master_status)
+        def secondary_repl_lag(member):
+            server = member.get_server()
+            if server.is_secondary():
+                return server.get_repl_lag(master_status)
+
+        for member, repl_lag in query_members(self.get_members(),
+                                              secondary_repl_lag,
+                                              raise_errors=True):
+            if repl_lag is not None:
                 if max_repl_lag and  repl_lag > max_repl_lag:
                     log_info("Excluding member '%s' because it's repl lag "
                              "(in seconds)%s is more than max %s. " %
@@ -421,6 +466,200 @@ class ReplicaSetCluster(Cluster):
             secondary_lag_tuples.sort(best_secondary_comp)
             return secondary_lag_tuples[0][0]
 
+    ###########################################################################
+    def get_most_caught_up_secondary(self, exclude_servers=None):
+        """
+        Returns the secondary member that can become primary with the least
+        repl lag (i.e. the best candidate for a step down)
+        """
+        primary_member = self.get_primary_member()
+        if not primary_member:
+            raise MongoctlException("Unable to determine primary member for"
+                                    " cluster '%s'" % self.id)
+
+        master_status = primary_member.get_server().get_member_rs_status()
+
+        if not master_status:
+            raise MongoctlException("Unable to determine replicaset status for"
+                                    " primary member '%s'" %
+                                    primary_member.get_server().id)
+
+        exclude_ids = [s.id for s in (exclude_servers or [])]
+        candidates = filter(lambda m: (m.can_become_primary() and
+                                       m.get_server().id not in exclude_ids),
+                            self.get_members())
+
+        def electable_repl_lag(member):
+            server = member.get_server()
+            if server.is_secondary():
+                return server.get_repl_lag(master_status)
+
+        lags = [(member, lag) for member, lag in
+                query_members(candidates, electable_repl_lag)
+                if lag is not None]
+        if lags:
+            lags.sort(key=lambda t: t[1])
+            return lags[0][0]
+
+    ###########################################################################
+    def rolling_restart(self, max_repl_lag=ROLLING_RESTART_MAX_REPL_LAG,
+                        member_timeout=ROLLING_RESTART_MEMBER_TIMEOUT,
+                        options_override=None):
+        """
+        Restarts all members one at a time. Secondaries and arbiters go
+        first; each has to be back as SECONDARY with a repl lag of at most
+        max_repl_lag secs before the next one is restarted. The primary is
+        then stepped down to the most caught-up secondary and restarted last
+        so writes are only unavailable during that single election.
+        """
+        log_info("Rolling restart of replica set cluster '%s'..." % self.id)
+        for server in self.get_servers():
+            server.validate_local_op("rolling restart")
+
+        joined = query_members(self.get_members(),
+                               lambda m: m.get_server().has_joined_replica())
+        joined_ids = [m.get_server().id for m, has_joined in joined
+                      if has_joined]
+        not_joined = [s.id for s in self.get_servers()
+                      if s.id not in joined_ids]
+        if not_joined:
+            raise MongoctlException("Cannot rolling restart replica set "
+                                    "cluster '%s'. Member(s) %s are not up "
+                                    "in the replica set." %
+                                    (self.id, ", ".join(not_joined)))
+
+        primary_member = self.get_primary_member()
+        if not primary_member:
+            raise MongoctlException("Unable to determine primary member for"
+                                    " cluster '%s'" % self.id)
+        primary_server = primary_member.get_server()
+
+        # 1- secondaries and arbiters, one at a time
+        for member in self.get_members():
+            if member.get_server().id != primary_server.id:
+                self.restart_member(member, max_repl_lag=max_repl_lag,
+                                    member_timeout=member_timeout,
+                                    options_override=options_override)
+
+        # 2- hand the primary over to the best candidate then restart it
+        candidate = self.get_most_caught_up_secondary()
+        if not candidate:
+            raise MongoctlException("No secondary of cluster '%s' can take "
+                                    "over as primary. Not restarting primary"
+                                    " '%s'." % (self.id, primary_server.id))
+
+        self.step_down_primary_to(primary_server, candidate.get_server())
+        self.restart_member(primary_member, max_repl_lag=max_repl_lag,
+                            member_timeout=member_timeout,
+                            options_override=options_override)
+
+        log_info("Rolling restart of replica set cluster '%s' completed "
+                 "successfully!" % self.id)
+
+    ###########################################################################
+    def restart_member(self, member, max_repl_lag=ROLLING_RESTART_MAX_REPL_LAG,
+                       member_timeout=ROLLING_RESTART_MEMBER_TIMEOUT,
+                       options_override=None):
+        # avoid circular imports
+        from mongoctl.commands.server.start import start_server
+        from mongoctl.commands.server.stop import do_stop_server
+
+        server = member.get_server()
+        log_info("Restarting member '%s' of replica set cluster '%s'..." %
+                 (server.id, self.id))
+        do_stop_server(server)
+        # a non forked member would never return control to the restart
+        server.apply_cmd_options_overrides({"fork": True})
+        # the member is already in the replica set config
+        start_server(server, options_override=options_override,
+                     skip_repl_config=True)
+
+        log_info("Waiting for member '%s' to catch up (max repl lag %s "
+                 "secs)..." % (server.id, max_repl_lag))
+        if not self.wait_for_member_caught_up(member, max_repl_lag,
+                                              timeout=member_timeout):
+            raise MongoctlException("Member '%s' did not catch up within %s "
+                                    "secs. Stopping rolling restart of "
+                                    "cluster '%s'." %
+                                    (server.id, member_timeout, self.id))
+
+    ###########################################################################
+    def wait_for_member_caught_up(self, member, max_repl_lag,
+                                  timeout=ROLLING_RESTART_MEMBER_TIMEOUT):
+        """
+        Waits until member is SECONDARY (or a joined arbiter) with a repl lag
+        of at most max_repl_lag secs. A member that is PRIMARY also counts as
+        caught up: a restarted former primary with the highest priority takes
+        over again. Returns True if it did so in time
+        """
+        server = member.get_server()
+
+        def is_caught_up():
+            if member.is_arbiter():
+                return server.has_joined_replica()
+            if server.is_primary():
+                return True
+            if not server.is_secondary():
+                return False
+
+            primary_member = self.get_primary_member()
+            if not primary_member:
+                return False
+            master_status = primary_member.get_server().get_member_rs_status()
+            member_status = server.get_member_rs_status()
+            if not master_status or not member_status:
+                return False
+
+            repl_lag = get_member_repl_lag(member_status, master_status)
+            log_verbose("Member '%s' repl lag is %s secs" %
+                        (server.id, repl_lag))
+            return repl_lag <= max_repl_lag
+
+        return wait_for(is_caught_up, timeout=timeout, sleep_duration=1)
+
+    ###########################################################################
+    def step_down_primary_to(self, primary_server, candidate_server):
+        """
+        Steps down the primary so that candidate_server takes over. Other
+        electable secondaries are frozen meanwhile so that the election has
+        one possible outcome
+        """
+        # avoid circular imports
+        from mongoctl.commands.server.stop import step_server_down
+
+        others = [m.get_server() for m in self.get_members()
+                  if m.can_become_primary() and
+                  m.get_server().id not in [primary_server.id,
+                                            candidate_server.id]]
+
+        def freeze(server, secs):
+            try:
+                server.db_command(SON([("replSetFreeze", secs)]), "admin")
+            except Exception, e:
+                log_exception(e)
+                log_warning("replSetFreeze failed on server '%s': %s" %
+                            (server.id, e))
+
+        log_info("Stepping down primary '%s' to secondary '%s'..." %
+                 (primary_server.id, candidate_server.id))
+        for server in others:
+            freeze(server, STEP_DOWN_FREEZE_SECS)
+        try:
+            if not step_server_down(primary_server):
+                raise MongoctlException("Failed to step down primary '%s'" %
+                                        primary_server.id)
+
+            if not wait_for(candidate_server.is_primary, timeout=60,
+                            sleep_duration=1):
+                raise MongoctlException("Timeout error: Waiting for server "
+                                        "'%s' to become primary took longer "
+                                        "than expected." %
+                                        candidate_server.id)
+            log_info("Server '%s' is primary now!" % candidate_server.id)
+        finally:
+            for server in others:
+                freeze(server, 0)
+
     ###########################################################################
     def is_replicaset_initialized(self):
         """
@@ -435,10 +674,14 @@ class ReplicaSetCluster(Cluster):
         # it's a good indicator that we just need to wait a bit
         # add an uptime check in for good measure
 
-        for member in self.get_members():
-            server = member.get_server()
+        results = query_members(
+            self.get_members(),
+            lambda member: member.get_server().has_joined_replica(),
+            done=lambda member, joined: joined,
+            raise_errors=True)
 
-            if server.has_joined_replica():
+        for member, joined in results:
+            if joined:
                 return True
 
         return False
@@ -849,4 +1092,144 @@ def get_member_repl_lag(member_status, master_status):
 
     return lag_in_seconds
 
+###############################################################################
+def get_max_secondary_repl_lag(rs_status_members, excluded_addresses=None):
+    """
+    Returns (lag in secs, member address) of the secondary that is the
+    furthest behind the primary in a replSetGetStatus members list, (0, None)
+    if there are no secondaries or (None, None) if there is no primary.
+    Members that are not SECONDARY (e.g. down or recovering) are ignored.
+    """
+    master_status = None
+    for member_status in rs_status_members:
+        if member_status.get("stateStr") == "PRIMARY":
+            master_status = member_status
+    if not master_status:
+        return None, None
+
+    excluded_addresses = excluded_addresses or []
+    lags = [(get_member_repl_lag(member_status, master_status),
+             member_status["name"])
+            for member_status in rs_status_members
+            if member_status.get("stateStr") == "SECONDARY" and
+            member_status["name"] not in excluded_addresses]
+
+    return max(lags) if lags else (0, None)
+
+###############################################################################
+# Concurrent member queries
+###############################################################################
+def query_members(members, query, done=None, timeout=MEMBER_QUERY_TIMEOUT,
+                  max_workers=MAX_MEMBER_QUERY_WORKERS, raise_errors=False,
+                  resolve_logins=True):
+    """
+    Runs query(member) for all members concurrently using a bounded pool of
+    worker threads and returns a list of (member, result) tuples in the order
+    the members answered.
+
+    :param done: optional predicate done(member, result). As soon as it
+                 returns True the results collected so far are returned
+                 without waiting for the remaining members
+    :param timeout: deadline in seconds for the whole fan-out. Members that
+                    did not answer in time (or failed) are left out of the
+                    result (partial results)
+    :param raise_errors: if True, the first member failure is raised unless
+                         done() was satisfied. Otherwise failures are logged
+                         as warnings
+    :param resolve_logins: workers never prompt. If True, members whose
+                           query needs a login that is not known yet are
+                           queried again once the login has been resolved
+                           (possibly prompted for) on the calling thread;
+                           see resolve_member_login()
+    """
+    if not members:
+        return []
+
+    member_queue = Queue.Queue()
+    for member in members:
+        member_queue.put(member)
+
+    result_queue = Queue.Queue()
+
+    def worker():
+        disable_thread_prompting()
+        while True:
+            try:
+                member = member_queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                result_queue.put((member, query(member), None))
+            except Exception, ex:
+                result_queue.put((member, None, ex))
+
+    for i in range(min(max_workers, len(members))):
+        # daemon workers so that stuck members never block mongoctl's exit
+        t = threading.Thread(target=worker, name="member-query-%s" % i)
+        t.daemon = True
+        t.start()
+
+    results = []
+    errors = []
+    login_needed = []
+    pending = len(members)
+    deadline = time.time() + timeout
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            log_verbose("Member query timed out after %s seconds. %s member(s)"
+                        " did not answer" % (timeout, pending))
+            break
+        try:
+            member, result, ex = result_queue.get(timeout=remaining)
+        except Queue.Empty:
+            continue
+
+        pending -= 1
+        if isinstance(ex, PromptNotAllowedError) and resolve_logins:
+            login_needed.append(member)
+            continue
+        if ex is not None:
+            log_exception(ex)
+            errors.append(ex)
+            if not raise_errors:
+                log_warning("Member query failed for member '%s': %s" %
+                            (member.get_property("host") or
+                             member.get_property("server"), ex))
+            continue
+
+        results.append((member, result))
+        if done and done(member, result):
+            return results
+
+    if login_needed and resolve_member_login(login_needed[0]):
+        results.extend(query_members(login_needed, query, done=done,
+                                     timeout=timeout,
+                                     max_workers=max_workers,
+                                     raise_errors=raise_errors,
+                                     resolve_logins=False))
+    elif login_needed:
+        errors.append(MongoctlException("Unable to login to member(s) %s" %
+                                        ", ".join([m.get_host() for m in
+                                                   login_needed])))
+
+    if raise_errors and errors:
+        raise errors[0]
+
+    return results
 
+###############################################################################
+def resolve_member_login(member):
+    """
+    Logs in to the admin db of the member's server on the calling (main)
+    thread, prompting if needed. Logins are memoized per cluster so the
+    other members' servers use it too. Returns True on success
+    """
+    try:
+        member.get_server().get_db("admin")
+        return True
+    except Exception, e:
+        log_exception(e)
+        log_warning("Unable to login to member '%s': %s" %
+                    (member.get_host(), e))
+        return False
@@ -546,15 +546,28 @@ class Server(DocumentWrapper):
             else:
                 raise
 
+    ###########################################################################
+    def get_worker_db(self, dbname, pool_size, username=None, password=None):
+        """
+        Like get_db() but on a client with a pool of pool_size sockets and
+        no socket timeout, for concurrent long running work (dumps,
+        restores, index builds) that would otherwise time out or queue on
+        the default client
+        """
+        kwargs = self.get_client_params()
+        kwargs.update({"maxPoolSize": pool_size, "socketTimeoutMS": None})
+        return self.get_db(dbname, username=username, password=password,
+                           client=self.new_mongo_client(**kwargs))
+
     ###########################################################################
     def command_needs_auth(self, dbname, cmd):
         return self.needs_to_auth(dbname)
 
     ###########################################################################
     def get_db(self, dbname, no_auth=False, username=None, password=None,
-               retry=True, never_auth_with_admin=False):
+               retry=True, never_auth_with_admin=False, client=None):
 
-        mongo_client = self.get_mongo_client()
+        mongo_client = client or self.get_mongo_client()
         db = mongo_client.get_database(dbname)
 
         # If the DB doesn't need to be authenticated to (or at least yet)
@@ -578,7 +591,7 @@ class Server(DocumentWrapper):
 
         # if we have the system user then always auth with it
         if local_user and users.is_system_user(local_user["username"]) and dbname != "local":
-            local_db = self.get_db("local", retry=retry)
+            local_db = self.get_db("local", retry=retry, client=client)
             return local_db.client.get_database(dbname)
 
         is_system_user = (login_user and
@@ -594,31 +607,34 @@ class Server(DocumentWrapper):
              not is_system_user and
              not self.supports_local_users())):
             # if this passes then we are authed!
-            admin_db = self.get_db("admin", retry=retry)
+            admin_db = self.get_db("admin", retry=retry,
+                                   client=client)
             return admin_db.client.get_database(dbname)
 
         # no retries on local db, so if we fail to auth to local we always
         # attempt to use admin
         retry = retry and dbname != "local"
-        auth_success = self.authenticate_db(db, dbname, retry=retry)
+        auth_db = self.authenticate_db(db, dbname, retry=retry)
 
         # If auth failed then give it a try by auth into admin db unless it
         # was specified not to
         if (not never_auth_with_admin and
-                not auth_success
+                not auth_db
             and dbname != "admin"):
-            admin_db = self.get_db("admin", retry=retry)
+            admin_db = self.get_db("admin", retry=retry,
+                                   client=client)
             return admin_db.client.get_database(dbname)
 
-        if auth_success:
-            return db
+        if auth_db:
+            return auth_db
         else:
             raise MongoctlException("Failed to authenticate to %s db" % dbname)
 
     ###########################################################################
     def authenticate_db(self, db, dbname, retry=True):
         """
-        Returns True if we manage to auth to the given db, else False.
+        Returns the given db, on the client of the login (see
+        mongo_utils.get_login_db()), if we manage to auth to it, else None.
         """
         log_verbose("Server '%s' attempting to authenticate to db '%s'" % (self.id, dbname))
         login_user = self.get_login_user(dbname)
@@ -627,6 +643,7 @@ class Server(DocumentWrapper):
 
 
         auth_success = False
+        auth_db = None
 
         if login_user:
             username = login_user["username"]
@@ -647,7 +664,8 @@ class Server(DocumentWrapper):
 
             # if auth success then exit loop and memoize login
             try:
-                auth_success = db.authenticate(username, password)
+                auth_db = mongo_utils.get_login_db(db, username)
+                auth_success = auth_db.authenticate(username, password)
                 log_verbose("Authentication attempt #%s to db '%s' result: %s" % (no_tries, dbname, auth_success))
             except OperationFailure, ofe:
                 if "auth fails" in str(ofe):
@@ -665,11 +683,10 @@ class Server(DocumentWrapper):
         if auth_success:
             self.set_login_user(dbname, username, password)
             log_verbose("Authentication Succeeded!")
+            return auth_db
         else:
             log_verbose("Authentication failed")
 
-        return auth_success
-
     ###########################################################################
     def get_working_login(self, database, username=None, password=None):
         """
@@ -824,6 +841,18 @@ class Server(DocumentWrapper):
 
         return self._mongo_client
 
+    ###########################################################################
+    def evict_mongo_clients(self):
+        """
+        Drops all shared clients of this server. Should be called when the
+        server process goes away so that pooled sockets are not reused
+        """
+        self._mongo_client = None
+        for address in set([self._connection_address, self.get_address(),
+                            self.get_local_address()]):
+            if address:
+                mongo_utils.evict_mongo_client(address)
+
     ###########################################################################
     def new_default_mongo_client(self):
         client_params = self.get_client_params()
@@ -836,7 +865,7 @@ class Server(DocumentWrapper):
         if self.connection_timeout_ms:
             kwargs["connectTimeoutMS"] = self.connection_timeout_ms
 
-        return mongo_utils.mongo_client(address, **kwargs)
+        return mongo_utils.get_shared_mongo_client(address, **kwargs)
 
     ###########################################################################
     def new_ssl_test_mongo_client(self):
@@ -925,7 +954,7 @@ class Server(DocumentWrapper):
         try:
             log_verbose("Checking if server '%s' is accessible on "
                         "address '%s'" % (self.id, address))
-            mongo_utils.mongo_client(address)
+            mongo_utils.get_shared_mongo_client(address)
             return True
         except Exception, e:
             log_exception(e)
@@ -8,10 +8,27 @@ from replicaset_cluster import ReplicaSetCluster
 from base import DocumentWrapper
 from bson import DBRef
 
-from mongoctl.mongoctl_logging import log_info
-from mongoctl.utils import document_pretty_string
+from bson.son import SON
+from mongoctl.mongoctl_logging import log_info, log_verbose
+from mongoctl.utils import document_pretty_string, wait_for
+from mongoctl.errors import MongoctlException
 
 import time
+
+###############################################################################
+# CONSTS
+###############################################################################
+# max time (in seconds) to wait for a running balancing round to finish
+BALANCER_STOP_TIMEOUT = 60 * 5
+
+###############################################################################
+def get_shard_host_addresses(shard_host):
+    """
+    Returns the addresses of a shard host string: 'host:port' or
+    'rs_name/host1:port1,host2:port2'
+    """
+    return shard_host.split("/", 1)[-1].split(",")
+
 ###############################################################################
 # ShardSet Cluster Class
 ###############################################################################
@@ -160,9 +177,11 @@ class ShardedCluster(Cluster):
 
         log_info("Executing command \n%s\non mongos '%s'" %
                  (document_pretty_string(cmd), mongos.id))
-        mongos.db_command(cmd, "admin")
+        result = mongos.db_command(cmd, "admin")
 
-        log_info("Shard '%s' added successfully!" % self.id)
+        log_info("Shard '%s' added successfully as '%s'!" %
+                 (shard.id, result.get("shardAdded")))
+        return result.get("shardAdded")
 
     ###########################################################################
     def get_add_shard_command(self, shard_member):
@@ -246,6 +265,28 @@ class ShardedCluster(Cluster):
         mongos = self.get_any_online_mongos()
         return mongos.db_command({"listShards": 1}, "admin")
 
+    ###########################################################################
+    def get_shard_names(self):
+        """
+        Returns a shard id => shard name dict of the configured shards. The
+        shard name is the one addShard returned (i.e. the config.shards _id)
+        which is not necessarily the shard id, e.g. 'shard0000' for a
+        standalone server shard
+        """
+        shard_list = self.list_shards() or {}
+        shard_names = {}
+        for shard_member in self.shards:
+            shard = shard_member.get_member_cluster_or_server()
+            addresses = set(get_shard_host_addresses(
+                self.get_shard_member_address(shard_member)))
+            for sh in shard_list.get("shards") or []:
+                if (sh["_id"] == shard.id or
+                        addresses & set(get_shard_host_addresses(sh["host"]))):
+                    shard_names[shard.id] = sh["_id"]
+                    break
+
+        return shard_names
+
     ###########################################################################
     def is_shard_configured(self, shard):
         shard_list = self.list_shards()
@@ -272,6 +313,74 @@ class ShardedCluster(Cluster):
         raise Exception("Unable to connect to a mongos")
 
 
+    ###########################################################################
+    def is_balancer_enabled(self):
+        mongos = self.get_any_online_mongos()
+        try:
+            # 3.4+
+            result = mongos.db_command({"balancerStatus": 1}, "admin")
+            return result.get("mode") != "off"
+        except Exception, e:
+            log_verbose("balancerStatus failed (%s). Checking "
+                        "config.settings..." % e)
+            settings = mongos.get_db("config")["settings"].find_one(
+                {"_id": "balancer"})
+            return not (settings and settings.get("stopped"))
+
+    ###########################################################################
+    def stop_balancer(self, timeout=BALANCER_STOP_TIMEOUT):
+        """
+        Disables the balancer and waits for any running balancing round (i.e.
+        chunk migration) to finish
+        """
+        log_info("Stopping balancer of ShardedCluster '%s'..." % self.id)
+        mongos = self.get_any_online_mongos()
+        try:
+            # 3.4+. Waits for the current round to finish
+            mongos.db_command(SON([("balancerStop", 1),
+                                   ("maxTimeMS", timeout * 1000)]), "admin")
+        except Exception, e:
+            log_verbose("balancerStop failed (%s). Updating "
+                        "config.settings..." % e)
+            config_db = mongos.get_db("config")
+            config_db["settings"].update_one({"_id": "balancer"},
+                                             {"$set": {"stopped": True}},
+                                             upsert=True)
+
+            def balancer_round_done():
+                return config_db["locks"].find_one(
+                    {"_id": "balancer", "state": {"$gt": 0}}) is None
+
+            if not wait_for(balancer_round_done, timeout=timeout,
+                            sleep_duration=1):
+                raise MongoctlException("Timeout error: balancer of "
+                                        "ShardedCluster '%s' did not stop "
+                                        "within %s secs" % (self.id, timeout))
+
+        log_info("Balancer of ShardedCluster '%s' stopped." % self.id)
+
+    ###########################################################################
+    def start_balancer(self):
+        log_info("Starting balancer of ShardedCluster '%s'..." % self.id)
+        mongos = self.get_any_online_mongos()
+        try:
+            mongos.db_command({"balancerStart": 1}, "admin")
+        except Exception, e:
+            log_verbose("balancerStart failed (%s). Updating "
+                        "config.settings..." % e)
+            mongos.get_db("config")["settings"].update_one(
+                {"_id": "balancer"}, {"$set": {"stopped": False}}, upsert=True)
+
+    ###########################################################################
+    def flush_router_configs(self):
+        """
+        Makes all online mongos reload the cluster metadata
+        """
+        for member in self.get_members():
+            server = member.get_server()
+            if server.is_online():
+                server.db_command({"flushRouterConfig": 1}, "admin")
+
     ###########################################################################
     def move_dbs_primary(self, db_names, dest_shard):
         log_info("Moving databases %s primary to shard '%s'" %
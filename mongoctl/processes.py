@@ -1,6 +1,15 @@
 __author__ = 'abdul'
 
+import os
+import sys
+import time
+import select
 import subprocess
+import ctypes
+import ctypes.util
+
+from utils import is_pid_alive
+from mongoctl_logging import log_verbose, log_exception
 ###############################################################################
 __child_subprocesses__ = []
 
@@ -26,4 +35,85 @@ def get_child_process(child_pid):
 ###############################################################################
 def get_child_processes():
     global __child_subprocesses__
-    return __child_subprocesses__
\ No newline at end of file
+    return __child_subprocesses__
+
+###############################################################################
+# ProcessExitWatcher Class
+###############################################################################
+# pidfd_open(2) has the same syscall number on all linux architectures
+SYS_PIDFD_OPEN = 434
+
+# poll interval (in seconds) used when pidfds are not supported
+PROCESS_EXIT_POLL_INTERVAL = 0.1
+
+class ProcessExitWatcher(object):
+    """
+    Blocks until a process exits. Uses a pidfd (Linux >= 5.3) which becomes
+    readable the moment the process exits. Otherwise falls back to polling
+    the child process (so that it gets reaped) or kill(pid, 0).
+    """
+
+    ###########################################################################
+    def __init__(self, pid):
+        self.pid = pid
+        self._pidfd = _pidfd_open(pid)
+        self._poller = None
+        if self._pidfd is not None:
+            self._poller = select.poll()
+            self._poller.register(self._pidfd, select.POLLIN)
+
+    ###########################################################################
+    def uses_pidfd(self):
+        return self._pidfd is not None
+
+    ###########################################################################
+    def is_alive(self):
+        child_process = get_child_process(self.pid)
+        if child_process is not None:
+            return child_process.poll() is None
+        return is_pid_alive(self.pid)
+
+    ###########################################################################
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds. Returns True if the process has exited
+        """
+        if self._poller is not None:
+            if self._poller.poll(int(timeout * 1000)):
+                # reap it if it is our child
+                child_process = get_child_process(self.pid)
+                if child_process is not None:
+                    child_process.poll()
+                return True
+            return False
+
+        end_time = time.time() + timeout
+        while self.is_alive():
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(PROCESS_EXIT_POLL_INTERVAL, remaining))
+        return True
+
+    ###########################################################################
+    def close(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+            self._pidfd = None
+            self._poller = None
+
+###############################################################################
+def _pidfd_open(pid):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.syscall(SYS_PIDFD_OPEN, pid, 0)
+        if fd >= 0:
+            return fd
+        log_verbose("pidfd_open(%s) failed with errno %s. Falling back to "
+                    "polling" % (pid, ctypes.get_errno()))
+    except Exception, e:
+        log_exception(e)
+
+    return None
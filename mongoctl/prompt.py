@@ -2,8 +2,9 @@ __author__ = 'abdul'
 
 import sys
 import getpass
+import threading
 
-from errors import MongoctlException
+from errors import MongoctlException, PromptNotAllowedError
 ###############################################################################
 # Global flags and their functions
 ###############################################################################
@@ -47,6 +48,25 @@ def is_interactive_mode():
     global __interactive_mode__
     return __interactive_mode__
 
+###############################################################################
+# prompting state of worker threads
+__thread_prompting__ = threading.local()
+
+def disable_thread_prompting():
+    """
+    Disables prompting in the current (worker) thread. Prompts raise
+    PromptNotAllowedError instead, leaving them to the main thread
+    """
+    __thread_prompting__.disabled = True
+
+###############################################################################
+def validate_thread_prompting(message):
+    if getattr(__thread_prompting__, "disabled", False):
+        raise PromptNotAllowedError("Prompting for '%s' is not allowed in "
+                                    "thread '%s'" %
+                                    (message.strip(),
+                                     threading.current_thread().name))
+
 ###############################################################################
 def read_input(message):
     # If we are running in a noninteractive mode then fail
@@ -57,6 +77,8 @@ def read_input(message):
                "--noninteractive" % message)
         raise MongoctlException(msg)
 
+    validate_thread_prompting(message)
+
     print >> sys.stderr, message,
     return raw_input()
 
@@ -77,6 +99,7 @@ def read_password(message=''):
                " password using the -p option or run without --noninteractive")
         raise MongoctlException(msg)
 
+    validate_thread_prompting(message)
     print >> sys.stderr, message
     return getpass.getpass()
 
@@ -102,6 +125,7 @@ def prompt_confirm(message):
     if is_say_yes_to_everything():
         return True
 
+    validate_thread_prompting(message)
     valid_choices = {"yes":True,
                      "y":True,
                      "ye":True,
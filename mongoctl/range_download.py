@@ -0,0 +1,407 @@
+__author__ = 'abdul'
+
+import os
+import re
+import json
+import time
+import hashlib
+import urllib2
+import threading
+
+from utils import parallel_map
+from mongoctl_logging import log_info, log_verbose
+from errors import MongoctlException, FileNotInRepoError
+
+###############################################################################
+# CONSTS
+###############################################################################
+DEFAULT_DOWNLOAD_SEGMENTS = 8
+
+# files are not split into segments smaller than this
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+READ_BLOCK_SIZE = 256 * 1024
+
+# streamed files are fetched in ranges of this size, up to
+# DEFAULT_DOWNLOAD_SEGMENTS at a time
+STREAM_PART_SIZE = 4 * 1024 * 1024
+
+HTTP_TIMEOUT = 60
+
+# checksum published next to an archive, e.g. <archive>.tgz.sha256
+SHA256_SUFFIX = ".sha256"
+
+# segment layout of an unfinished download, kept to resume it
+STATE_SUFFIX = ".download.json"
+
+SHA256_RE = re.compile("^[0-9a-fA-F]{64}$")
+
+###############################################################################
+def download_url_parallel(url, destination=None,
+                          segments=DEFAULT_DOWNLOAD_SEGMENTS,
+                          sha256=None):
+    """
+    Downloads url into destination with up to segments concurrent HTTP Range
+    requests and returns the file path. Segments are written to part files
+    next to the file so that a rerun after an interruption only fetches the
+    missing bytes. The assembled file is verified against sha256 or, if
+    none is given, the one published at <url>.sha256 (if any). Servers that
+    do not support ranges are downloaded with a single request.
+    """
+    destination = destination or os.getcwd()
+    path = os.path.join(destination, url.split("/")[-1])
+    log_info("Downloading %s..." % url)
+    start_time = time.time()
+
+    size, validator = get_url_info(url)
+    expected_sha256 = sha256 or get_published_sha256(url)
+
+    if size:
+        state = get_download_state(path, url, size, validator, segments)
+        ranges = state["segments"]
+    else:
+        log_verbose("'%s' does not support range requests. Downloading it "
+                    "with a single request" % url)
+        clear_download_state(path, 1)
+        ranges = [None]
+
+    def fetch(index):
+        return fetch_segment(url, get_part_path(path, index), ranges[index],
+                             validator)
+
+    results = parallel_map(fetch, range(len(ranges)),
+                           max_workers=len(ranges))
+    failed = [(index, ex) for index, result, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to download %s segment(s) of '%s'. "
+                                "Run again to resume. First error: %s" %
+                                (len(failed), url, failed[0][1]))
+    fetched = sum([result for index, result, ex in results])
+
+    actual_sha256 = assemble_parts(path, len(ranges))
+    if expected_sha256 and actual_sha256 != expected_sha256.lower():
+        os.remove(path)
+        raise MongoctlException("SHA-256 mismatch for '%s': expected %s but "
+                                "got %s" % (url, expected_sha256,
+                                            actual_sha256))
+    elif expected_sha256:
+        log_verbose("Verified SHA-256 of '%s'" % path)
+
+    duration = max(time.time() - start_time, 0.001)
+    log_info("Downloaded '%s' (%.1f MB fetched with %s segment(s), %.1f "
+             "MB/s)" % (path, fetched / 1048576.0, len(ranges),
+                        fetched / 1048576.0 / duration))
+    return path
+
+###############################################################################
+def open_url_stream(url, part_size=None, workers=DEFAULT_DOWNLOAD_SEGMENTS):
+    """
+    Returns a file-like object to read url from as it downloads: a
+    RangeStreamReader fetching part_size ranges with up to workers
+    concurrent requests if the server supports ranges, the plain response
+    otherwise
+    """
+    part_size = part_size or STREAM_PART_SIZE
+    size, validator = get_url_info(url)
+    if not size or size <= part_size or workers < 2:
+        log_verbose("Streaming '%s' with a single request" % url)
+        try:
+            return urllib2.urlopen(url, timeout=HTTP_TIMEOUT)
+        except urllib2.HTTPError, e:
+            if e.code == 404:
+                raise FileNotInRepoError("File not found '%s'" % url)
+            raise MongoctlException("Unable to download from url '%s' "
+                                    "(response code '%s')" % (url, e.code))
+
+    def fetch(start, end):
+        return fetch_range(url, start, end, validator)
+
+    log_verbose("Streaming '%s' in ranges of %s bytes, %s at a time" %
+                (url, part_size, workers))
+    return RangeStreamReader(fetch, size, part_size, workers)
+
+###############################################################################
+def fetch_range(url, start, end, validator=None):
+    """
+    Returns bytes start to end (inclusive) of url
+    """
+    request = urllib2.Request(url)
+    request.add_header("Range", "bytes=%s-%s" % (start, end))
+    if validator:
+        request.add_header("If-Range", validator)
+    response = urllib2.urlopen(request, timeout=HTTP_TIMEOUT)
+    try:
+        if response.getcode() != 206:
+            # the file changed (If-Range) or ranges are not honored
+            raise MongoctlException("Range request for '%s' returned %s "
+                                    "instead of 206" %
+                                    (url, response.getcode()))
+        return response.read()
+    finally:
+        response.close()
+
+###############################################################################
+# RangeStreamReader
+###############################################################################
+class RangeStreamReader(object):
+    """
+    Reads size bytes, in order, from ranges of part_size bytes that up to
+    workers threads fetch at the same time with fetch_range(start, end).
+    Fetching never gets more than window parts (2 * workers by default)
+    ahead of the reader, which bounds the memory used to reorder parts.
+    on_part(data) is called with each part, in order, as it is read.
+    """
+
+    ###########################################################################
+    def __init__(self, fetch_range, size, part_size, workers, window=None,
+                 on_part=None):
+        self._fetch_range = fetch_range
+        self._ranges = [(start, min(start + part_size, size) - 1)
+                        for start in range(0, size, part_size)]
+        self._workers = max(1, min(workers, len(self._ranges)))
+        self._slots = threading.Semaphore(max(window or 2 * workers,
+                                              self._workers))
+        self._on_part = on_part
+        self._lock = threading.Condition()
+        self._parts = {}
+        self._next_fetch = 0
+        self._next_read = 0
+        self._error = None
+        self._closed = False
+        self._buffer = ""
+        self._offset = 0
+
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._fetch_parts)
+            thread.daemon = True
+            thread.start()
+
+    ###########################################################################
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) - self._offset < size:
+            data = self._next_part()
+            if data is None:
+                break
+            self._buffer = self._buffer[self._offset:] + data
+            self._offset = 0
+
+        if size < 0:
+            size = len(self._buffer) - self._offset
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    ###########################################################################
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._parts.clear()
+            self._lock.notify_all()
+        # wake up workers waiting for a slot so that they exit
+        for i in range(self._workers):
+            self._slots.release()
+
+    ###########################################################################
+    def _next_part(self):
+        with self._lock:
+            if self._next_read >= len(self._ranges):
+                return None
+            while (self._next_read not in self._parts and
+                   self._error is None and not self._closed):
+                # a timeout keeps the wait interruptible
+                self._lock.wait(1)
+            if self._closed:
+                raise MongoctlException("Read from a closed stream")
+            if self._next_read not in self._parts:
+                raise MongoctlException("Failed to download bytes %s-%s: "
+                                        "%s" % self._error)
+            data = self._parts.pop(self._next_read)
+            self._next_read += 1
+        self._slots.release()
+        if self._on_part:
+            self._on_part(data)
+        return data
+
+    ###########################################################################
+    def _fetch_parts(self):
+        while True:
+            self._slots.acquire()
+            with self._lock:
+                if (self._closed or self._error is not None or
+                        self._next_fetch >= len(self._ranges)):
+                    self._slots.release()
+                    return
+                index = self._next_fetch
+                self._next_fetch += 1
+
+            start, end = self._ranges[index]
+            try:
+                data = self._fetch_range(start, end)
+                if len(data) != end - start + 1:
+                    raise MongoctlException("got %s bytes" % len(data))
+            except Exception, e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = (start, end, e)
+                    self._lock.notify_all()
+                return
+
+            with self._lock:
+                if not self._closed:
+                    self._parts[index] = data
+                self._lock.notify_all()
+
+###############################################################################
+def get_url_info(url):
+    """
+    Returns (size, validator) of url if its server supports byte range
+    requests, (None, None) otherwise. validator is the ETag (or
+    Last-Modified) to send as If-Range
+    """
+    request = urllib2.Request(url)
+    request.get_method = lambda: "HEAD"
+    try:
+        response = urllib2.urlopen(request, timeout=HTTP_TIMEOUT)
+    except urllib2.HTTPError, e:
+        if e.code == 404:
+            raise FileNotInRepoError("File not found '%s'" % url)
+        log_verbose("HEAD '%s' failed: %s" % (url, e))
+        return None, None
+
+    headers = response.info()
+    size = headers.getheader("Content-Length")
+    if headers.getheader("Accept-Ranges", "").lower() != "bytes" or not size:
+        return None, None
+    return (int(size),
+            headers.getheader("ETag") or headers.getheader("Last-Modified"))
+
+###############################################################################
+def get_published_sha256(url):
+    try:
+        response = urllib2.urlopen(url + SHA256_SUFFIX, timeout=HTTP_TIMEOUT)
+        parts = response.read(4096).split()
+    except Exception, e:
+        log_verbose("No SHA-256 published for '%s' (%s)" % (url, e))
+        return None
+
+    if parts and SHA256_RE.match(parts[0]):
+        return parts[0].lower()
+    log_verbose("Ignoring invalid SHA-256 file for '%s'" % url)
+
+###############################################################################
+def get_download_state(path, url, size, validator, num_segments):
+    """
+    Returns the segment layout of the download of url into path: the saved
+    one if it is for the same file, otherwise a new one (discarding old
+    parts)
+    """
+    state_path = path + STATE_SUFFIX
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if (state.get("url") == url and state.get("size") == size and
+                state.get("validator") == validator):
+            log_info("Resuming download of '%s'" % url)
+            return state
+        log_verbose("'%s' changed since the last download attempt. Starting "
+                    "over" % url)
+        clear_download_state(path, len(state.get("segments", [])))
+
+    num_segments = max(1, min(num_segments, size / MIN_SEGMENT_SIZE))
+    state = {
+        "url": url,
+        "size": size,
+        "validator": validator,
+        "segments": make_segments(size, num_segments)
+    }
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    return state
+
+###############################################################################
+def make_segments(size, num_segments):
+    """
+    Returns num_segments [start, end] (inclusive) byte ranges covering size
+    bytes
+    """
+    segment_size = -(-size // num_segments)
+    return [[start, min(start + segment_size, size) - 1]
+            for start in range(0, size, segment_size)]
+
+###############################################################################
+def fetch_segment(url, part_path, segment, validator=None):
+    """
+    Appends the missing bytes of segment (or the whole file if segment is
+    None) to part_path. Returns the number of bytes fetched
+    """
+    request = urllib2.Request(url)
+    if segment:
+        start, end = segment
+        length = end - start + 1
+        done = 0
+        if os.path.exists(part_path):
+            done = os.path.getsize(part_path)
+            if done > length:
+                os.remove(part_path)
+                done = 0
+        if done == length:
+            return 0
+        request.add_header("Range", "bytes=%s-%s" % (start + done, end))
+        if validator:
+            request.add_header("If-Range", validator)
+    else:
+        length = None
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    response = urllib2.urlopen(request, timeout=HTTP_TIMEOUT)
+    if segment and response.getcode() != 206:
+        # the file changed (If-Range) or ranges are not honored
+        raise MongoctlException("Range request for '%s' returned %s instead "
+                                "of 206" % (url, response.getcode()))
+
+    fetched = 0
+    with open(part_path, "ab") as part_file:
+        while True:
+            data = response.read(READ_BLOCK_SIZE)
+            if not data:
+                break
+            part_file.write(data)
+            fetched += len(data)
+
+    if length is not None and os.path.getsize(part_path) != length:
+        raise MongoctlException("Incomplete segment %s of '%s'" %
+                                (segment, url))
+    return fetched
+
+###############################################################################
+def assemble_parts(path, num_parts):
+    """
+    Concatenates the part files of path into path (atomically) and returns
+    the SHA-256 of the result
+    """
+    checksum = hashlib.sha256()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out_file:
+        for index in range(num_parts):
+            with open(get_part_path(path, index), "rb") as part_file:
+                while True:
+                    data = part_file.read(READ_BLOCK_SIZE)
+                    if not data:
+                        break
+                    checksum.update(data)
+                    out_file.write(data)
+    os.rename(tmp_path, path)
+    clear_download_state(path, num_parts)
+    return checksum.hexdigest()
+
+###############################################################################
+def clear_download_state(path, num_parts):
+    for part_path in ([get_part_path(path, i) for i in range(num_parts)] +
+                      [path + STATE_SUFFIX]):
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+###############################################################################
+def get_part_path(path, index):
+    return "%s.part%s" % (path, index)
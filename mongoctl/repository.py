@@ -138,6 +138,9 @@ def clear_repository_cache():
     __commandline_servers__ = None
     __configured_clusters__ = None
     __commandline_clusters__ = None
+    clear_configured_cluster_indexes()
+    __db_servers__.clear()
+    __db_clusters__.clear()
 
 ###############################################################################
 # Server lookup functions
@@ -174,13 +177,14 @@ def lookup_and_validate_server(server_id):
 
 ###############################################################################
 def db_lookup_server(server_id):
-    server_collection = get_mongoctl_server_db_collection()
-    server_doc = server_collection.find_one({"_id": server_id})
+    if server_id not in __db_servers__:
+        server_collection = get_mongoctl_server_db_collection()
+        server_doc = server_collection.find_one({"_id": server_id})
+        __db_servers__[server_id] = None
+        if server_doc:
+            db_materialize_servers([server_doc])
 
-    if server_doc:
-        return new_server(server_doc)
-    else:
-        return None
+    return __db_servers__[server_id]
 
 ###############################################################################
 ## Looks up the server from config file
@@ -207,7 +211,8 @@ def lookup_all_servers():
 # returns servers saved in the db collection of servers
 def db_lookup_all_servers():
     servers = get_mongoctl_server_db_collection()
-    return new_servers_dict(servers.find())
+    return dict((server.id, server)
+                for server in db_materialize_servers(servers.find()))
 
 ###############################################################################
 # Cluster lookup functions
@@ -246,13 +251,14 @@ def config_lookup_cluster(cluster_id):
 
 ###############################################################################
 def db_lookup_cluster(cluster_id):
-    cluster_collection = get_mongoctl_cluster_db_collection()
-    cluster_doc = cluster_collection.find_one({"_id": cluster_id})
+    if cluster_id not in __db_clusters__:
+        cluster_collection = get_mongoctl_cluster_db_collection()
+        cluster_doc = cluster_collection.find_one({"_id": cluster_id})
+        __db_clusters__[cluster_id] = None
+        if cluster_doc is not None:
+            db_prefetch_cluster_refs(db_materialize_clusters([cluster_doc]))
 
-    if cluster_doc is not None:
-        return new_cluster(cluster_doc)
-    else:
-        return None
+    return __db_clusters__[cluster_id]
 
 ###############################################################################
 # returns all clusters configured in both DB and config file
@@ -271,8 +277,10 @@ def lookup_all_clusters():
 ###############################################################################
 # returns a dictionary of (cluster_id, cluster) looked up from DB
 def db_lookup_all_clusters():
-    clusters = get_mongoctl_cluster_db_collection()
-    return new_replicaset_clusters_dict(clusters.find())
+    clusters = db_materialize_clusters(
+        get_mongoctl_cluster_db_collection().find())
+    db_prefetch_cluster_refs(clusters)
+    return dict((cluster.id, cluster) for cluster in clusters)
 
 ###############################################################################
 # Lookup by server id
@@ -291,7 +299,7 @@ def db_lookup_cluster_by_server(server, lookup_type=LOOKUP_TYPE_ANY):
     cluster_doc = cluster_collection.find_one(query)
 
     if cluster_doc is not None:
-        return new_cluster(cluster_doc)
+        return db_materialize_cluster_with_refs(cluster_doc)
     else:
         return None
 
@@ -308,7 +316,7 @@ def db_lookup_cluster_by_shard(shard):
     cluster_doc = cluster_collection.find_one(query)
 
     if cluster_doc is not None:
-        return new_cluster(cluster_doc)
+        return db_materialize_cluster_with_refs(cluster_doc)
     else:
         return None
 
@@ -324,42 +332,136 @@ def db_lookup_sharded_cluster_by_config_replica(cluster):
     cluster_doc = cluster_collection.find_one(query)
 
     if cluster_doc is not None:
-        return new_cluster(cluster_doc)
+        return db_materialize_cluster_with_refs(cluster_doc)
     else:
         return None
 
+###############################################################################
+# DB repository identity maps and batched DBRef resolution
+###############################################################################
+# Global variables: _id -> object for every server/cluster materialized from
+# the db repository in this process (None means "not in the db")
+__db_servers__ = {}
+
+__db_clusters__ = {}
+
+###############################################################################
+def db_materialize_servers(server_docs):
+    servers = []
+    for doc in server_docs:
+        server = __db_servers__.get(doc["_id"])
+        if server is None:
+            server = new_server(doc)
+            __db_servers__[server.id] = server
+        servers.append(server)
+    return servers
+
+###############################################################################
+def db_materialize_clusters(cluster_docs):
+    clusters = []
+    for doc in cluster_docs:
+        cluster = __db_clusters__.get(doc["_id"])
+        if cluster is None:
+            cluster = new_cluster(doc)
+            __db_clusters__[cluster.id] = cluster
+        clusters.append(cluster)
+    return clusters
+
+###############################################################################
+def db_materialize_cluster_with_refs(cluster_doc):
+    clusters = db_materialize_clusters([cluster_doc])
+    db_prefetch_cluster_refs(clusters)
+    return clusters[0]
+
+###############################################################################
+def db_prefetch_cluster_refs(clusters):
+    """
+    Resolves all servers/clusters referenced by the specified clusters with
+    one $in query per collection instead of a find_one per DBRef
+    """
+    server_ids, cluster_ids = get_clusters_refs(clusters)
+
+    # referenced clusters (config replicas/shards) first since they
+    # reference more servers
+    missing_cluster_ids = [i for i in cluster_ids if i not in __db_clusters__]
+    if missing_cluster_ids:
+        log_verbose("Prefetching %s clusters from db repository" %
+                    len(missing_cluster_ids))
+        for cluster_id in missing_cluster_ids:
+            __db_clusters__[cluster_id] = None
+        cluster_collection = get_mongoctl_cluster_db_collection()
+        ref_clusters = db_materialize_clusters(
+            cluster_collection.find({"_id": {"$in": missing_cluster_ids}}))
+        server_ids.extend(get_clusters_refs(ref_clusters)[0])
+
+    missing_server_ids = list(set([i for i in server_ids
+                                   if i not in __db_servers__]))
+    if missing_server_ids:
+        log_verbose("Prefetching %s servers from db repository" %
+                    len(missing_server_ids))
+        for server_id in missing_server_ids:
+            __db_servers__[server_id] = None
+        server_collection = get_mongoctl_server_db_collection()
+        db_materialize_servers(
+            server_collection.find({"_id": {"$in": missing_server_ids}}))
+
+###############################################################################
+def get_clusters_refs(clusters):
+    """
+    Returns ([server ids], [cluster ids]) referenced by DBRefs in the
+    specified clusters' documents
+    """
+    server_ids = []
+    cluster_ids = []
+
+    for cluster in clusters:
+        for prop in ["members", "shards"]:
+            for member_doc in cluster.get_property(prop) or []:
+                if isinstance(member_doc.get("server"), DBRef):
+                    server_ids.append(member_doc["server"].id)
+                if isinstance(member_doc.get("cluster"), DBRef):
+                    cluster_ids.append(member_doc["cluster"].id)
+
+        config_servers = cluster.get_property("configServers")
+        if isinstance(config_servers, DBRef):
+            cluster_ids.append(config_servers.id)
+        elif isinstance(config_servers, list):
+            for conf_doc in config_servers:
+                if isinstance(conf_doc, DBRef):
+                    cluster_ids.append(conf_doc.id)
+                elif isinstance(conf_doc.get("server"), DBRef):
+                    server_ids.append(conf_doc["server"].id)
+
+    return server_ids, list(set(cluster_ids))
+
 ###############################################################################
 def config_lookup_cluster_by_server(server, lookup_type=LOOKUP_TYPE_ANY):
-    clusters = get_configured_clusters()
+    clusters_by_server = get_configured_cluster_indexes()["server"]
     lookup_type = listify(lookup_type)
 
     for t in lookup_type:
-        result = None
-        if t == LOOKUP_TYPE_MEMBER:
-            result = filter(lambda c: c.has_member_server(server),
-                            clusters.values())
-        elif t == LOOKUP_TYPE_CONFIG_SVR:
-            result = filter(lambda c: cluster_has_config_server(c, server),
-                            clusters.values())
-        elif t == LOOKUP_TYPE_SHARDS:
-            result = filter(lambda c: cluster_has_shard(c, server),
-                            clusters.values())
+        result = clusters_by_server.get(t, {}).get(server.id)
+        if result and t == LOOKUP_TYPE_MEMBER:
+            # like has_member_server(), only members whose server resolves
+            # match
+            result = filter(lambda c: c.has_member_server(server), result)
         if result:
             return result[0]
 
 ###############################################################################
 def config_lookup_cluster_by_shard(shard):
-    clusters = get_configured_clusters()
-
-    result = filter(lambda c: cluster_has_shard(c, shard), clusters.values())
+    from objects.server import Server
+    indexes = get_configured_cluster_indexes()
+    if isinstance(shard, Server):
+        result = indexes["server"][LOOKUP_TYPE_SHARDS].get(shard.id)
+    else:
+        result = indexes["shard"].get(shard.id)
     if result:
         return result[0]
 
 ###############################################################################
 def config_lookup_sharded_cluster_by_config_replica(cluster):
-    clusters = get_configured_clusters()
-
-    result = filter(lambda c: cluster_has_config_replica(c, cluster), clusters.values())
+    result = get_configured_cluster_indexes()["configReplica"].get(cluster.id)
     if result:
         return result[0]
 
@@ -463,6 +565,82 @@ def get_configured_clusters():
 
     return __configured_clusters__
 
+###############################################################################
+# Global variable: lazy loaded reverse indexes of configured clusters
+#  "server": lookup type -> server id -> clusters
+#  "shard": shard cluster id -> sharded clusters
+#  "configReplica": config replica cluster id -> sharded clusters
+__configured_cluster_indexes__ = None
+
+###############################################################################
+def get_configured_cluster_indexes():
+
+    global __configured_cluster_indexes__
+
+    if __configured_cluster_indexes__ is None:
+        __configured_cluster_indexes__ = \
+            build_cluster_indexes(get_configured_clusters().values())
+
+    return __configured_cluster_indexes__
+
+###############################################################################
+def clear_configured_cluster_indexes():
+    global __configured_cluster_indexes__
+    __configured_cluster_indexes__ = None
+
+###############################################################################
+def build_cluster_indexes(clusters):
+    """
+    Builds the reverse indexes from the raw cluster documents (DBRefs) so
+    that no server/cluster has to be resolved to index it
+    """
+    by_server = dict((t, {}) for t in LOOKUP_TYPE_ANY)
+    by_shard = {}
+    by_config_replica = {}
+
+    def add(index, key, cluster):
+        clusters = index.setdefault(key, [])
+        if cluster not in clusters:
+            clusters.append(cluster)
+
+    for cluster in clusters:
+        for member_doc in cluster.get_property("members") or []:
+            server_ref = member_doc.get("server")
+            if server_ref is not None:
+                if isinstance(server_ref, DBRef):
+                    add(by_server[LOOKUP_TYPE_MEMBER], server_ref.id, cluster)
+            elif member_doc.get("host") is not None:
+                # host members are built with their address as _id
+                add(by_server[LOOKUP_TYPE_MEMBER], member_doc["host"],
+                    cluster)
+
+        config_servers = cluster.get_property("configServers")
+        if isinstance(config_servers, DBRef):
+            add(by_config_replica, config_servers.id, cluster)
+        elif isinstance(config_servers, list):
+            for conf_doc in config_servers:
+                if isinstance(conf_doc, DBRef):
+                    add(by_config_replica, conf_doc.id, cluster)
+                else:
+                    server_ref = conf_doc.get("server")
+                    if isinstance(server_ref, DBRef):
+                        add(by_server[LOOKUP_TYPE_CONFIG_SVR], server_ref.id,
+                            cluster)
+
+        for shard_doc in cluster.get_property("shards") or []:
+            server_ref = shard_doc.get("server")
+            if isinstance(server_ref, DBRef):
+                add(by_server[LOOKUP_TYPE_SHARDS], server_ref.id, cluster)
+            cluster_ref = shard_doc.get("cluster")
+            if isinstance(cluster_ref, DBRef):
+                add(by_shard, cluster_ref.id, cluster)
+
+    return {
+        "server": by_server,
+        "shard": by_shard,
+        "configReplica": by_config_replica
+    }
+
 ###############################################################################
 def validate_cluster(cluster):
     log_info("Validating cluster '%s'..." % cluster.id )
@@ -0,0 +1,143 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from mongoctl import binary_cache
+from mongoctl.binary_cache import BinaryCache
+
+###############################################################################
+class BinaryCacheTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._cache_dir = os.path.join(self._tmp_dir, "cache")
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def make_archive(self, name, size):
+        path = os.path.join(self._tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    ###########################################################################
+    def test_put(self):
+        cache = BinaryCache(self._cache_dir, 1024 * 1024)
+        archive_path = self.make_archive("a.tgz", 1000)
+        with open(archive_path, "rb") as f:
+            content = f.read()
+
+        self.assertEqual(cache.lookup("ref-a"), None)
+        sha256 = cache.put_file("ref-a", archive_path)
+        self.assertEqual(sha256, hashlib.sha256(content).hexdigest())
+
+        # same content under another ref is stored once
+        cache.put_file("ref-b", archive_path)
+        self.assertEqual(cache.get_size(), 1000)
+
+        path, name, cached_sha256 = cache.lookup("ref-a")
+        self.assertEqual((name, cached_sha256), ("a.tgz", sha256))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    ###########################################################################
+    def test_corrupt_index(self):
+        cache = BinaryCache(self._cache_dir, 1024 * 1024)
+        cache.put_file("ref-a", self.make_archive("a.tgz", 1000))
+        index_path = os.path.join(self._cache_dir, binary_cache.INDEX_FILE)
+        with open(index_path, "w") as f:
+            f.write('{"ref-a": {"sha2')
+
+        # a miss, not a failure
+        self.assertEqual(cache.lookup("ref-a"), None)
+        # the next add replaces the index
+        cache.put_file("ref-b", self.make_archive("b.tgz", 1000))
+        self.assertEqual(cache.lookup("ref-b")[1], "b.tgz")
+        self.assertEqual(cache.lookup("ref-a"), None)
+
+    ###########################################################################
+    def test_writer(self):
+        cache = BinaryCache(self._cache_dir, 1024 * 1024)
+        writer = cache.new_writer()
+        writer.write("abc")
+        writer.discard()
+        self.assertEqual(cache.lookup("ref"), None)
+
+        writer = cache.new_writer()
+        writer.write("abc")
+        writer.write("def")
+        sha256 = writer.commit("ref", "x.tgz")
+        path, name, cached_sha256 = cache.lookup("ref")
+        self.assertEqual((name, cached_sha256), ("x.tgz", sha256))
+        self.assertEqual(sha256, hashlib.sha256("abcdef").hexdigest())
+        self.assertEqual(os.listdir(os.path.join(self._cache_dir, "tmp")), [])
+
+    ###########################################################################
+    def test_lru_eviction(self):
+        cache = BinaryCache(self._cache_dir, 2500)
+        cache.put_file("ref-1", self.make_archive("1.tgz", 1000))
+        cache.put_file("ref-2", self.make_archive("2.tgz", 1000))
+        # make ref-1 the most recently used
+        path_2 = cache.lookup("ref-2")[0]
+        os.utime(path_2, (time.time() - 100, time.time() - 100))
+        cache.lookup("ref-1")
+
+        cache.put_file("ref-3", self.make_archive("3.tgz", 1000))
+        self.assertEqual(cache.lookup("ref-2"), None)
+        self.assertNotEqual(cache.lookup("ref-1"), None)
+        self.assertNotEqual(cache.lookup("ref-3"), None)
+        self.assertEqual(cache.get_size(), 2000)
+
+    ###########################################################################
+    def test_stale_tmp_sweep(self):
+        cache = BinaryCache(self._cache_dir, 1024 * 1024)
+        stale_writer = cache.new_writer()
+        stale_writer.write("left over by a dead install")
+        stale_writer._file.close()
+        stale_time = time.time() - 2 * binary_cache.STALE_TMP_SECS
+        os.utime(stale_writer._tmp_path, (stale_time, stale_time))
+        live_writer = cache.new_writer()
+        live_writer.write("still downloading")
+
+        cache.put_file("ref-1", self.make_archive("1.tgz", 1000))
+        self.assertFalse(os.path.exists(stale_writer._tmp_path))
+        self.assertTrue(os.path.exists(live_writer._tmp_path))
+        live_writer.commit("ref-2", "2.tgz")
+        self.assertEqual(os.listdir(os.path.join(self._cache_dir, "tmp")), [])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import socket
+import struct
+import threading
+import SocketServer
+
+import bson
+
+from mongoctl import mongo_utils
+from mongoctl.mongo_utils import (
+    get_shared_mongo_client, evict_mongo_client, clear_mongo_client_registry,
+    get_login_db, SHARED_CLIENT_POOL_SIZE
+)
+
+OP_REPLY = 1
+
+ISMASTER_REPLY = bson.BSON.encode({"ismaster": True, "maxWireVersion": 5,
+                                   "minWireVersion": 0, "ok": 1})
+
+###############################################################################
+class FakeMongodHandler(SocketServer.BaseRequestHandler):
+    """
+    Answers every OP_QUERY (i.e. ismaster/commands of wire version 5) with
+    an ismaster reply
+    """
+
+    def handle(self):
+        self.server.connections.append(self.request)
+        while True:
+            header = self.read(16)
+            if not header:
+                return
+            length, request_id = struct.unpack("<ii", header[:8])
+            if not self.read(length - 16):
+                return
+            reply = (struct.pack("<iqii", 0, 0, 0, 1) + ISMASTER_REPLY)
+            self.request.sendall(struct.pack("<iiii", 16 + len(reply), 0,
+                                             request_id, OP_REPLY) + reply)
+
+    def read(self, size):
+        data = ""
+        while len(data) < size:
+            try:
+                chunk = self.request.recv(size - len(data))
+            except socket.error:
+                return None
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+###############################################################################
+class FakeMongod(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        SocketServer.ThreadingTCPServer.__init__(self, ("127.0.0.1", port),
+                                                 FakeMongodHandler)
+        self.connections = []
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def address(self):
+        return "127.0.0.1:%s" % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+                connection.close()
+            except socket.error:
+                pass
+
+###############################################################################
+class ClientRegistryTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.mongods = [FakeMongod(), FakeMongod()]
+
+    ###########################################################################
+    def tearDown(self):
+        clear_mongo_client_registry()
+        for mongod in self.mongods:
+            mongod.stop()
+
+    ###########################################################################
+    def get(self, index=0, check_health=False, **kwargs):
+        kwargs.setdefault("serverSelectionTimeoutMS", 500)
+        return get_shared_mongo_client(self.mongods[index].address,
+                                       check_health=check_health, **kwargs)
+
+    ###########################################################################
+    def test_reuse(self):
+        client = self.get()
+        self.assertTrue(self.get() is client)
+        self.assertTrue(self.get(check_health=True) is client)
+        self.assertEqual(client.max_pool_size, SHARED_CLIENT_POOL_SIZE)
+
+    ###########################################################################
+    def test_key_separation(self):
+        client = self.get()
+        self.assertFalse(self.get(1) is client)
+        self.assertFalse(self.get(maxPoolSize=4) is client)
+        self.assertEqual(self.get(maxPoolSize=4).max_pool_size, 4)
+        self.assertFalse(self.get(socketTimeoutMS=None) is client)
+        self.assertTrue(self.get(socketTimeoutMS=None) is
+                        self.get(socketTimeoutMS=None))
+
+    ###########################################################################
+    def test_login_clients(self):
+        client = self.get(maxPoolSize=4)
+        admin_db = client.get_database("admin")
+        alice_db = get_login_db(admin_db, "alice")
+        self.assertFalse(alice_db.client is client)
+        self.assertEqual(alice_db.name, "admin")
+        self.assertEqual(alice_db.client.max_pool_size, 4)
+        self.assertTrue(get_login_db(admin_db, "alice").client is
+                        alice_db.client)
+        self.assertTrue(get_login_db(alice_db, "alice") is alice_db)
+        # other users and dbs never share the login's client
+        self.assertFalse(get_login_db(admin_db, "bob").client is
+                         alice_db.client)
+        self.assertFalse(get_login_db(client.get_database("test"),
+                                      "alice").client is alice_db.client)
+        self.assertTrue(self.get(maxPoolSize=4) is client)
+
+        evict_mongo_client(self.mongods[0].address)
+        self.assertEqual(mongo_utils.__mongo_client_registry__, {})
+
+    ###########################################################################
+    def test_eviction(self):
+        client = self.get()
+        other_client = self.get(1)
+        evict_mongo_client(self.mongods[0].address)
+        self.assertFalse(self.get() is client)
+        self.assertTrue(self.get(1) is other_client)
+
+        clear_mongo_client_registry()
+        self.assertEqual(mongo_utils.__mongo_client_registry__, {})
+
+    ###########################################################################
+    def test_health_check_recreates(self):
+        client = self.get()
+        port = self.mongods[0].server_address[1]
+        self.mongods[0].stop()
+
+        # the unhealthy client is evicted, and re-creating it fails fast
+        self.assertRaises(Exception, self.get, check_health=True)
+        self.assertEqual(mongo_utils.__mongo_client_registry__, {})
+
+        self.mongods[0] = FakeMongod(port)
+        recreated = self.get(check_health=True)
+        self.assertFalse(recreated is client)
+        self.assertTrue(self.get() is recreated)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from bson import json_util
+
+from mongoctl import config
+from mongoctl import repository
+from mongoctl.repository import (
+    LOOKUP_TYPE_MEMBER, LOOKUP_TYPE_CONFIG_SVR, LOOKUP_TYPE_SHARDS,
+    LOOKUP_TYPE_ANY, config_lookup_cluster_by_server,
+    config_lookup_cluster_by_shard,
+    config_lookup_sharded_cluster_by_config_replica, cluster_has_config_server,
+    cluster_has_shard, cluster_has_config_replica, get_configured_clusters,
+    new_server, new_cluster
+)
+
+SERVERS = [{"_id": _id} for _id in ["a1", "a2", "a3", "cfg1", "sh1",
+                                     "lonely"]]
+
+def ref(collection, _id):
+    return {"$ref": collection, "$id": _id}
+
+CLUSTERS = [
+    {"_id": "rs1",
+     "members": [{"server": ref("servers", "a1")},
+                 {"server": ref("servers", "a2")},
+                 # not in servers.config
+                 {"server": ref("servers", "ghost")},
+                 {"host": "localhost:28017"}]},
+    {"_id": "rs2",
+     "members": [{"server": ref("servers", "a3")},
+                 {"server": ref("servers", "a1")}]},
+    {"_id": "confrs",
+     "members": [{"server": ref("servers", "cfg1")}]},
+    {"_id": "sharded1", "_type": "ShardedCluster",
+     "configServers": ref("clusters", "confrs"),
+     "shards": [{"cluster": ref("clusters", "rs1")},
+                {"server": ref("servers", "sh1")}]},
+    {"_id": "sharded2", "_type": "ShardedCluster",
+     "configServers": [{"server": ref("servers", "cfg1")}],
+     "shards": [{"cluster": ref("clusters", "ghost-rs")},
+                {"server": ref("servers", "ghost")}]}
+]
+
+SERVER_IDS = ["a1", "a2", "a3", "cfg1", "sh1", "lonely", "ghost",
+              "localhost:28017", "nowhere"]
+
+CLUSTER_IDS = ["rs1", "rs2", "confrs", "sharded1", "ghost-rs", "nowhere"]
+
+###############################################################################
+# The linear scans the indexes replaced
+###############################################################################
+def scan_lookup_cluster_by_server(server, lookup_type=LOOKUP_TYPE_ANY):
+    clusters = get_configured_clusters().values()
+    for t in repository.listify(lookup_type):
+        result = None
+        if t == LOOKUP_TYPE_MEMBER:
+            result = filter(lambda c: c.has_member_server(server), clusters)
+        elif t == LOOKUP_TYPE_CONFIG_SVR:
+            result = filter(lambda c: cluster_has_config_server(c, server),
+                            clusters)
+        elif t == LOOKUP_TYPE_SHARDS:
+            result = filter(lambda c: cluster_has_shard(c, server), clusters)
+        if result:
+            return result[0]
+
+def scan_lookup_cluster_by_shard(shard):
+    result = filter(lambda c: cluster_has_shard(c, shard),
+                    get_configured_clusters().values())
+    if result:
+        return result[0]
+
+def scan_lookup_sharded_cluster_by_config_replica(cluster):
+    result = filter(lambda c: cluster_has_config_replica(c, cluster),
+                    get_configured_clusters().values())
+    if result:
+        return result[0]
+
+###############################################################################
+class ClusterIndexTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.config_root = tempfile.mkdtemp()
+        self._saved_root = config.__config_root__
+        self._saved_config = config.__mongo_config__
+        self.write("mongoctl.config", {
+            "fileRepository": {"servers": "servers.config",
+                               "clusters": "clusters.config"},
+            "configSnapshotsDirectory": None})
+        self.write("servers.config", SERVERS)
+        self.write("clusters.config", CLUSTERS)
+        config.__config_root__ = self.config_root
+        config.__mongo_config__ = None
+        repository.clear_repository_cache()
+
+    ###########################################################################
+    def tearDown(self):
+        config.__config_root__ = self._saved_root
+        config.__mongo_config__ = self._saved_config
+        repository.clear_repository_cache()
+        shutil.rmtree(self.config_root)
+
+    ###########################################################################
+    def write(self, name, value):
+        with open(os.path.join(self.config_root, name), "w") as f:
+            f.write(json_util.dumps(value))
+
+    ###########################################################################
+    def assertSameCluster(self, indexed, scanned, what):
+        self.assertEqual(indexed and indexed.id, scanned and scanned.id,
+                         "%s: index found %s, scan found %s" %
+                         (what, indexed and indexed.id,
+                          scanned and scanned.id))
+
+    ###########################################################################
+    def test_lookup_by_server(self):
+        lookup_types = [LOOKUP_TYPE_MEMBER, LOOKUP_TYPE_CONFIG_SVR,
+                        LOOKUP_TYPE_SHARDS, LOOKUP_TYPE_ANY]
+        found = 0
+        for server_id in SERVER_IDS:
+            server = new_server({"_id": server_id})
+            for lookup_type in lookup_types:
+                indexed = config_lookup_cluster_by_server(server, lookup_type)
+                scanned = scan_lookup_cluster_by_server(server, lookup_type)
+                self.assertSameCluster(indexed, scanned,
+                                       "%s/%s" % (server_id, lookup_type))
+                found += indexed is not None
+        # make sure the comparison is not vacuous
+        self.assertTrue(found >= 10)
+
+    ###########################################################################
+    def test_unresolved_member(self):
+        # a dangling member ref never matches, with or without the index
+        ghost = new_server({"_id": "ghost"})
+        self.assertEqual(config_lookup_cluster_by_server(
+            ghost, LOOKUP_TYPE_MEMBER), None)
+        self.assertEqual(config_lookup_cluster_by_server(
+            ghost, LOOKUP_TYPE_SHARDS).id, "sharded2")
+
+    ###########################################################################
+    def test_lookup_by_shard_and_config_replica(self):
+        for cluster_id in CLUSTER_IDS:
+            cluster = new_cluster({"_id": cluster_id})
+            self.assertSameCluster(config_lookup_cluster_by_shard(cluster),
+                                   scan_lookup_cluster_by_shard(cluster),
+                                   "shard %s" % cluster_id)
+            self.assertSameCluster(
+                config_lookup_sharded_cluster_by_config_replica(cluster),
+                scan_lookup_sharded_cluster_by_config_replica(cluster),
+                "config replica %s" % cluster_id)
+
+        for server_id in SERVER_IDS:
+            server = new_server({"_id": server_id})
+            self.assertSameCluster(config_lookup_cluster_by_shard(server),
+                                   scan_lookup_cluster_by_shard(server),
+                                   "shard server %s" % server_id)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import json
+import time
+import shutil
+import cPickle
+import tempfile
+
+from mongoctl import config
+from mongoctl.config import (
+    read_config_json, get_config_snapshot_path, get_config_file_signature
+)
+
+###############################################################################
+class ConfigSnapshotTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.config_root = tempfile.mkdtemp()
+        self.snapshots_dir = os.path.join(self.config_root, "snapshots")
+        self._saved_root = config.__config_root__
+        self._saved_config = config.__mongo_config__
+        config.__config_root__ = self.config_root
+        self.set_snapshots_dir(self.snapshots_dir)
+
+    ###########################################################################
+    def tearDown(self):
+        config.__config_root__ = self._saved_root
+        config.__mongo_config__ = self._saved_config
+        shutil.rmtree(self.config_root)
+
+    ###########################################################################
+    def set_snapshots_dir(self, snapshots_dir):
+        with open(os.path.join(self.config_root, "mongoctl.config"),
+                  "w") as f:
+            json.dump({"configSnapshotsDirectory": snapshots_dir}, f)
+        config.__mongo_config__ = None
+
+    ###########################################################################
+    def write_servers(self, servers):
+        path = os.path.join(self.config_root, "servers.config")
+        with open(path, "w") as f:
+            # comments are stripped by json_minify
+            f.write("// servers\n%s" % json.dumps(servers))
+        return path
+
+    ###########################################################################
+    def test_snapshot_written_and_loaded(self):
+        path = self.write_servers([{"_id": "a"}])
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "a"}])
+
+        snapshot_path = get_config_snapshot_path(path)
+        self.assertEqual(os.path.dirname(snapshot_path), self.snapshots_dir)
+        with open(snapshot_path, "rb") as f:
+            snapshot = cPickle.load(f)
+        self.assertEqual(snapshot["source"], path)
+        self.assertEqual(snapshot["value"], [{"_id": "a"}])
+
+        # an unchanged file is served from its snapshot
+        snapshot["value"] = [{"_id": "from-snapshot"}]
+        with open(snapshot_path, "wb") as f:
+            cPickle.dump(snapshot, f)
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "from-snapshot"}])
+
+        # mongoctl.config itself is never snapshotted
+        config.__mongo_config__ = None
+        config.get_mongoctl_config()
+        self.assertEqual(os.listdir(self.snapshots_dir),
+                         [os.path.basename(snapshot_path)])
+
+    ###########################################################################
+    def test_invalidation(self):
+        path = self.write_servers([{"_id": "a"}])
+        read_config_json("servers", "servers.config")
+        signature = get_config_file_signature("servers.config")
+
+        self.write_servers([{"_id": "b"}])
+        # same size: only the mtime tells the edit apart
+        os.utime(path, (time.time(), signature[0] + 10))
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "b"}])
+
+        self.write_servers([{"_id": "longer"}])
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "longer"}])
+
+        # corrupt snapshots are ignored
+        with open(get_config_snapshot_path(path), "wb") as f:
+            f.write("garbage")
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "longer"}])
+
+    ###########################################################################
+    def test_disabled(self):
+        self.set_snapshots_dir(None)
+        path = self.write_servers([{"_id": "a"}])
+        self.assertEqual(read_config_json("servers", "servers.config"),
+                         [{"_id": "a"}])
+        self.assertEqual(get_config_snapshot_path(path), None)
+        self.assertFalse(os.path.exists(self.snapshots_dir))
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
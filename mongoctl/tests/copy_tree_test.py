@@ -0,0 +1,107 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+from mongoctl.utils import (
+    copy_tree_parallel, delete_tree_parallel, delete_dir_in_background
+)
+
+class CopyTreeTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_copy_tree_parallel(self):
+        src = os.path.join(self._tmp_dir, "src")
+        dst = os.path.join(self._tmp_dir, "dst")
+        files = {
+            "collection-0.wt": "a" * 300000,
+            "WiredTiger": "WiredTiger\n",
+            "journal/WiredTigerLog.01": "j" * 1000,
+            "mongod.lock": "1234",
+            "diagnostic.data/metrics.1": "m"
+        }
+        for rel_path, content in files.items():
+            path = os.path.join(src, rel_path)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write(content)
+
+        count, total_bytes, reflinked = copy_tree_parallel(
+            src, dst, exclude=["mongod.lock", "diagnostic.data"],
+            max_workers=3)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(total_bytes, 301011)
+        self.assertTrue(reflinked <= count)
+        for rel_path in ["collection-0.wt", "WiredTiger",
+                         "journal/WiredTigerLog.01"]:
+            with open(os.path.join(dst, rel_path)) as f:
+                self.assertEqual(f.read(), files[rel_path])
+
+        self.assertFalse(os.path.exists(os.path.join(dst, "mongod.lock")))
+        self.assertFalse(os.path.exists(os.path.join(dst, "diagnostic.data")))
+
+    ###########################################################################
+    def test_delete_tree(self):
+        for i in range(2):
+            tree = self._make_tree("tree%s" % i)
+            if i == 0:
+                delete_tree_parallel(tree, max_workers=4)
+            else:
+                delete_dir_in_background(tree)
+                for j in range(100):
+                    if not os.path.exists(tree):
+                        break
+                    time.sleep(0.1)
+            self.assertFalse(os.path.exists(tree))
+
+    ###########################################################################
+    def _make_tree(self, name):
+        tree = os.path.join(self._tmp_dir, name)
+        for d in range(5):
+            dir_path = os.path.join(tree, "db%s" % d, "sub")
+            os.makedirs(dir_path)
+            for f in range(20):
+                with open(os.path.join(dir_path, "f%s.wt" % f), "w") as fh:
+                    fh.write("x")
+        return tree
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+
+from bson import DBRef
+
+from mongoctl import config
+from mongoctl import repository
+from mongoctl.repository import (
+    db_lookup_all_clusters, db_lookup_cluster, lookup_server, lookup_cluster
+)
+
+SERVERS = [{"_id": _id} for _id in ["a1", "a2", "cfg1", "cfg2", "b1"]]
+
+CLUSTERS = [
+    {"_id": "rs-a",
+     "members": [{"server": DBRef("servers", "a1")},
+                 {"server": DBRef("servers", "a2")}]},
+    {"_id": "rs-b",
+     "members": [{"server": DBRef("servers", "b1")},
+                 # not in the db
+                 {"server": DBRef("servers", "ghost")}]},
+    {"_id": "confrs",
+     "members": [{"server": DBRef("servers", "cfg1")},
+                 {"server": DBRef("servers", "cfg2")}]},
+    {"_id": "sharded", "_type": "ShardedCluster",
+     "configServers": DBRef("clusters", "confrs"),
+     "shards": [{"cluster": DBRef("clusters", "rs-a")},
+                {"cluster": DBRef("clusters", "rs-b")}]}
+]
+
+###############################################################################
+class RecordingCollection(object):
+    """
+    In-memory collection that records the queries it serves
+    """
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query=None):
+        self.queries.append(query)
+        ids = query and query["_id"]["$in"]
+        return [dict(d) for d in self.docs if ids is None or d["_id"] in ids]
+
+    def find_one(self, query):
+        self.queries.append(query)
+        for doc in self.docs:
+            if doc["_id"] == query["_id"]:
+                return dict(doc)
+
+###############################################################################
+class DbPrefetchTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._saved_config = config.__mongo_config__
+        self._saved_db = repository.__mongoctl_db__
+        config.__mongo_config__ = {
+            "databaseRepository": {"databaseURI": "mongodb://nowhere/mongoctl",
+                                   "servers": "servers",
+                                   "clusters": "clusters"}}
+        self.servers = RecordingCollection(SERVERS)
+        self.clusters = RecordingCollection(CLUSTERS)
+        repository.__mongoctl_db__ = {"servers": self.servers,
+                                      "clusters": self.clusters}
+        repository.clear_repository_cache()
+
+    ###########################################################################
+    def tearDown(self):
+        config.__mongo_config__ = self._saved_config
+        repository.__mongoctl_db__ = self._saved_db
+        repository.clear_repository_cache()
+
+    ###########################################################################
+    def test_one_query_per_collection(self):
+        clusters = db_lookup_all_clusters()
+        self.assertEqual(sorted(clusters.keys()),
+                         ["confrs", "rs-a", "rs-b", "sharded"])
+        # find() of all clusters; every server ref in a single $in
+        self.assertEqual(self.clusters.queries, [None])
+        self.assertEqual(len(self.servers.queries), 1)
+        self.assertEqual(sorted(self.servers.queries[0]["_id"]["$in"]),
+                         ["a1", "a2", "b1", "cfg1", "cfg2", "ghost"])
+
+        # resolving the refs is served from memory, misses included
+        for cluster in clusters.values():
+            for member in cluster.get_property("members") or []:
+                lookup_server(member["server"].id)
+        self.assertEqual(lookup_server("ghost"), None)
+        self.assertEqual(len(self.servers.queries), 1)
+        self.assertEqual(len(self.clusters.queries), 1)
+
+    ###########################################################################
+    def test_prefetch_referenced_clusters(self):
+        sharded = db_lookup_cluster("sharded")
+        # find_one, then the config replica and shards with one $in
+        self.assertEqual(len(self.clusters.queries), 2)
+        self.assertEqual(sorted(self.clusters.queries[1]["_id"]["$in"]),
+                         ["confrs", "rs-a", "rs-b"])
+        # servers of the referenced clusters are fetched at once too
+        self.assertEqual(len(self.servers.queries), 1)
+
+        self.assertTrue(lookup_cluster("rs-a") is lookup_cluster("rs-a"))
+        self.assertEqual(len(self.clusters.queries), 2)
+        self.assertTrue(db_lookup_cluster("sharded") is sharded)
+
+    ###########################################################################
+    def test_identity_reuse(self):
+        rs_a = db_lookup_cluster("rs-a")
+        member_servers = [m.get_server() for m in rs_a.get_members()]
+        self.assertTrue(member_servers[0] is lookup_server("a1"))
+
+        # a later bulk load reuses the objects materialized before
+        clusters = db_lookup_all_clusters()
+        self.assertTrue(clusters["rs-a"] is rs_a)
+        self.assertTrue(clusters["rs-a"].get_members()[1].get_server() is
+                        member_servers[1])
+
+        repository.clear_repository_cache()
+        self.assertFalse(db_lookup_cluster("rs-a") is rs_a)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import hashlib
+import zlib
+import time
+
+import mongoctl.commands.common.dump as dump
+from mongoctl.utils import ChunkedChecksumWriter, which
+from mongoctl.commands.common.dump import (
+    stream_dump_archive, gzip_stream_blocks
+)
+from mongoctl.errors import MongoctlException
+from mongoctl.mongodb_version import MongoDBVersionInfo
+
+class DumpStreamTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_chunked_checksum_writer(self):
+        path = os.path.join(self._tmp_dir, "stream")
+        writer = ChunkedChecksumWriter(path, 10)
+        for part in ["abc", "defghijklmnop", "", "qrstuvwxyz"]:
+            writer.write(part)
+        checksum = writer.close()
+
+        data = "abcdefghijklmnopqrstuvwxyz"
+        self.assertEqual(checksum, hashlib.sha256(data).hexdigest())
+        self.assertEqual(len(writer.chunk_checksums), 3)
+        self.assertEqual(self._read_chunks(path, writer), data)
+
+        with open(path + ".sha256") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "%s  stream.000" %
+                         hashlib.sha256("abcdefghij").hexdigest())
+
+    ###########################################################################
+    def test_stream_dump_archive(self):
+        data_cmd = [sys.executable, "-c",
+                    "import sys; sys.stdout.write('mongo' * 100000)"]
+        # gzip executable (if any) then in-process zlib
+        for in_process in [False, True]:
+            out_dir = os.path.join(self._tmp_dir, "dump%s" % in_process)
+            if in_process:
+                dump.which = lambda name: None
+            try:
+                stream_dump_archive(data_cmd, out_dir, compression="gzip",
+                                    chunk_size=4096)
+            finally:
+                dump.which = which
+
+            path = os.path.join(out_dir, "dump.archive.gz")
+            with open(path + ".sha256") as f:
+                chunk_count = len(f.read().splitlines())
+            compressed = "".join([open("%s.%03d" % (path, i), "rb").read()
+                                  for i in range(chunk_count)])
+            self.assertEqual(zlib.decompress(compressed, 16 + zlib.MAX_WBITS),
+                             "mongo" * 100000)
+
+    ###########################################################################
+    def test_compression_failure(self):
+        # mongodump would keep on writing; it is killed once the in-process
+        # compression fails
+        data_cmd = [sys.executable, "-c",
+                    "import sys, time; sys.stdout.write('mongo'); "
+                    "sys.stdout.flush(); time.sleep(30)"]
+
+        def failing_gzip_stream_blocks(in_stream, block_queue):
+            in_stream.read(5)
+            block_queue.put("partial")
+            block_queue.put(IOError("no space left on device"))
+
+        dump.which = lambda name: None
+        dump.gzip_stream_blocks = failing_gzip_stream_blocks
+        start_time = time.time()
+        try:
+            self.assertRaises(MongoctlException, stream_dump_archive,
+                              data_cmd, os.path.join(self._tmp_dir, "dump"),
+                              compression="gzip")
+        finally:
+            dump.which = which
+            dump.gzip_stream_blocks = gzip_stream_blocks
+        self.assertTrue(time.time() - start_time < 20)
+
+    ###########################################################################
+    def test_archive_dump_version(self):
+        class FakeExe(object):
+            path = "/usr/bin/mongodump"
+            def __init__(self, version):
+                self.version = version and MongoDBVersionInfo(version)
+
+        self.assertRaises(MongoctlException,
+                          dump.validate_archive_dump_executable,
+                          FakeExe("3.0.15"))
+        dump.validate_archive_dump_executable(FakeExe("3.2.0"))
+        dump.validate_archive_dump_executable(FakeExe("3.6.4"))
+        dump.validate_archive_dump_executable(FakeExe(None))
+
+    ###########################################################################
+    def _read_chunks(self, path, writer):
+        return "".join([open(os.path.join(os.path.dirname(path), name)).read()
+                        for name, checksum in writer.chunk_checksums])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+from mongoctl import config
+from mongoctl.commands import command_utils
+from mongoctl.mongodb_version import make_version_info, MongoDBEdition
+from test_base import get_testing_conf_root
+
+FAKE_MONGOD = """#!/bin/sh
+echo probe >> %(probe_log)s
+if [ "$1" = "--version" ]; then
+    echo "db version v%(version)s"
+else
+    echo "Options:"
+fi
+"""
+
+class ExeVersionCacheTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.probe_log = os.path.join(self.tmp_dir, "probes.log")
+        self.mongod = os.path.join(self.tmp_dir, "bin", "mongod")
+        os.makedirs(os.path.dirname(self.mongod))
+
+        config.set_config_root(get_testing_conf_root())
+        config.set_mongoctl_config_val(
+            "exeVersionCacheFile", os.path.join(self.tmp_dir, "versions.cache"))
+        command_utils.clear_exe_version_cache()
+
+    ###########################################################################
+    def tearDown(self):
+        command_utils.clear_exe_version_cache()
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def test_exe_version_cache(self):
+        self.write_fake_mongod("3.4.10")
+
+        expected = make_version_info("3.4.10", MongoDBEdition.COMMUNITY)
+        self.assertEqual(command_utils.mongo_exe_version(self.mongod), expected)
+        self.assertEqual(self.probe_count(), 2)
+
+        # second lookup, even from a fresh process, must not fork mongod
+        command_utils.clear_exe_version_cache()
+        self.assertEqual(command_utils.mongo_exe_version(self.mongod), expected)
+        self.assertEqual(self.probe_count(), 2)
+
+        # replacing the binary invalidates the entry
+        time.sleep(1)
+        self.write_fake_mongod("3.6.2")
+        self.assertEqual(command_utils.mongo_exe_version(self.mongod),
+                         make_version_info("3.6.2", MongoDBEdition.COMMUNITY))
+        self.assertEqual(self.probe_count(), 4)
+
+    ###########################################################################
+    def test_concurrent_saves(self):
+        self.write_fake_mongod("3.4.10")
+        version_info = make_version_info("3.4.10", MongoDBEdition.COMMUNITY)
+        errors = []
+
+        def cache_versions():
+            try:
+                for i in range(20):
+                    command_utils.cache_exe_version(self.mongod, version_info)
+                    # unlike cache_exe_version(), raises on failure
+                    command_utils.save_exe_version_cache()
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=cache_versions) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        # only the cache file is left, no temp files
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["bin", "versions.cache"])
+        command_utils.clear_exe_version_cache()
+        self.assertEqual(command_utils.lookup_cached_exe_version(self.mongod),
+                         version_info)
+
+    ###########################################################################
+    def write_fake_mongod(self, version):
+        with open(self.mongod, "w") as f:
+            f.write(FAKE_MONGOD % {"probe_log": self.probe_log,
+                                   "version": version})
+        os.chmod(self.mongod, stat.S_IRWXU)
+
+    ###########################################################################
+    def probe_count(self):
+        if not os.path.exists(self.probe_log):
+            return 0
+        with open(self.probe_log) as f:
+            return len(f.readlines())
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import hashlib
+import tarfile
+import tempfile
+from cStringIO import StringIO
+
+from mongoctl.errors import MongoctlException
+from mongoctl.utils import extract_archive_stream, ChecksumReader
+from mongoctl.binary_cache import BinaryCache
+import mongoctl.commands.misc.install as install
+from mongoctl.commands.misc.install import make_include_only_filter
+
+###############################################################################
+class UnseekableStream(object):
+    """
+    Like an HTTP response: read() only
+    """
+    def __init__(self, data):
+        self._stream = StringIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+###############################################################################
+def make_tgz(files):
+    out = StringIO()
+    tar = tarfile.open(fileobj=out, mode="w:gz")
+    for name, content, mode in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        info.mode = mode
+        tar.addfile(info, StringIO(content))
+    tar.close()
+    return out.getvalue()
+
+###############################################################################
+class FakeRepo(object):
+    name = "fake"
+
+###############################################################################
+def make_links_tgz(links):
+    out = StringIO()
+    tar = tarfile.open(fileobj=out, mode="w:gz")
+    for name, link_type, linkname in links:
+        info = tarfile.TarInfo(name)
+        info.type = link_type
+        info.linkname = linkname
+        tar.addfile(info)
+    tar.close()
+    return out.getvalue()
+
+###############################################################################
+class ExtractStreamTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_extract_with_include_only(self):
+        data = make_tgz([
+            ("mongodb-linux-x86_64-3.4.0/README", "readme", 0644),
+            ("mongodb-linux-x86_64-3.4.0/bin/mongod", "d", 0755),
+            ("mongodb-linux-x86_64-3.4.0/bin/mongo", "m", 0755),
+            ("mongodb-linux-x86_64-3.4.0/bin/mongodump", "x", 0755)
+        ])
+        reader = ChecksumReader(UnseekableStream(data))
+        dest_dir = os.path.join(self._tmp_dir, "staging")
+        count = extract_archive_stream(
+            reader, dest_dir, member_filter=make_include_only_filter(["mongo"]))
+        reader.drain()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(dest_dir, "bin"))),
+                         ["mongo", "mongod"])
+        with open(os.path.join(dest_dir, "README")) as f:
+            self.assertEqual(f.read(), "readme")
+        self.assertEqual(reader.byte_count, len(data))
+        self.assertEqual(reader.hexdigest(), hashlib.sha256(data).hexdigest())
+
+    ###########################################################################
+    def test_unsafe_paths(self):
+        data = make_tgz([("top/../../evil", "x", 0644)])
+        self.assertRaises(MongoctlException, extract_archive_stream,
+                          UnseekableStream(data), self._tmp_dir)
+        self.assertFalse(os.path.exists(os.path.join(
+            os.path.dirname(self._tmp_dir), "evil")))
+
+    ###########################################################################
+    def test_extract_through_binary_cache(self):
+        data = make_tgz([("mongodb-linux-x86_64-3.4.0/bin/mongod", "d",
+                          0755)])
+        cache = BinaryCache(os.path.join(self._tmp_dir, "cache"),
+                            1024 * 1024)
+        downloads = []
+
+        def download(mongodb_version, mongodb_edition, destination):
+            # a (resumable) download into the cache's download dir
+            downloads.append(destination)
+            path = os.path.join(destination, "mongodb-3.4.0.tgz")
+            with open(path, "wb") as f:
+                f.write(data)
+            return FakeRepo(), path
+
+        saved = (install.get_binary_cache, install.download_mongodb_binary,
+                 install.get_binary_cache_refs, install.get_binary_cache_ref)
+        install.get_binary_cache = lambda: cache
+        install.download_mongodb_binary = download
+        install.get_binary_cache_refs = lambda v, e: ["fake/3.4.0"]
+        install.get_binary_cache_ref = lambda v, e, repo_name: "%s/%s" % (
+            repo_name, v)
+        try:
+            for i in range(2):
+                dest_dir = os.path.join(self._tmp_dir, "install%s" % i)
+                install.stream_extract_mongodb_binary("3.4.0", "community",
+                                                      dest_dir)
+                with open(os.path.join(dest_dir, "bin", "mongod")) as f:
+                    self.assertEqual(f.read(), "d")
+        finally:
+            (install.get_binary_cache, install.download_mongodb_binary,
+             install.get_binary_cache_refs,
+             install.get_binary_cache_ref) = saved
+
+        # the second install comes from the cache
+        self.assertEqual(downloads, [cache.get_download_dir()])
+        self.assertEqual(cache.lookup("fake/3.4.0")[2],
+                         hashlib.sha256(data).hexdigest())
+        self.assertEqual(os.listdir(cache.get_download_dir()), [])
+
+    ###########################################################################
+    def test_links(self):
+        dest_dir = os.path.join(self._tmp_dir, "staging")
+        data = make_tgz([("top/bin/mongod", "d", 0755)])
+        extract_archive_stream(UnseekableStream(data), dest_dir)
+        data = make_links_tgz([
+            ("top/bin/mongod-latest", tarfile.SYMTYPE, "mongod"),
+            ("top/mongod", tarfile.SYMTYPE, "bin/mongod"),
+            ("top/bin/mongod-copy", tarfile.LNKTYPE, "top/bin/mongod")
+        ])
+        self.assertEqual(
+            extract_archive_stream(UnseekableStream(data), dest_dir), 3)
+        with open(os.path.join(dest_dir, "mongod")) as f:
+            self.assertEqual(f.read(), "d")
+
+    ###########################################################################
+    def test_unsafe_links(self):
+        dest_dir = os.path.join(self._tmp_dir, "staging")
+        for link in [("top/bin/etc", tarfile.SYMTYPE, "../../etc"),
+                     ("top/passwd", tarfile.SYMTYPE, "/etc/passwd"),
+                     ("top/passwd", tarfile.LNKTYPE, "/etc/passwd"),
+                     ("top/up", tarfile.LNKTYPE, "top/../../x")]:
+            data = make_links_tgz([link])
+            self.assertRaises(MongoctlException, extract_archive_stream,
+                              UnseekableStream(data), dest_dir)
+        self.assertEqual(os.listdir(dest_dir), [])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from mongoctl.commands.common.restore import (
+    get_restore_worker_counts, get_dump_db_dirs,
+    get_metadata_collection_name, read_index_specs, build_restored_indexes
+)
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self):
+        self.id = "fake"
+        self.pool_sizes = []
+        self.commands = []
+
+    def get_worker_db(self, dbname, pool_size, username=None, password=None):
+        self.pool_sizes.append(pool_size)
+        server = self
+
+        class FakeDB(object):
+            def command(self, cmd):
+                server.commands.append((dbname, cmd["createIndexes"],
+                                        [spec["name"]
+                                         for spec in cmd["indexes"]]))
+        return FakeDB()
+
+###############################################################################
+class FastRestoreTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_worker_counts(self):
+        self.assertEqual(get_restore_worker_counts(16, 1), (8, 4))
+        # replica sets get half the writers
+        self.assertEqual(get_restore_worker_counts(16, 3), (8, 2))
+        self.assertEqual(get_restore_worker_counts(1, 3), (1, 2))
+        self.assertEqual(get_restore_worker_counts(0, 1), (1, 2))
+
+    ###########################################################################
+    def test_read_index_specs(self):
+        db_dir = os.path.join(self._tmp_dir, "db1")
+        os.mkdir(db_dir)
+        os.mkdir(os.path.join(self._tmp_dir, "db2"))
+        metadata_path = os.path.join(db_dir, "c1.metadata.json")
+        with open(metadata_path, "w") as f:
+            f.write('{"options": {}, "indexes": ['
+                    '{"v": 2, "key": {"_id": 1}, "name": "_id_", '
+                    '"ns": "db1.c1"}, '
+                    '{"v": 2, "key": {"b": 1, "a": -1}, "name": "b_1_a_-1",'
+                    ' "ns": "db1.c1", "unique": true}]}')
+
+        self.assertEqual(get_dump_db_dirs(self._tmp_dir),
+                         [("db1", db_dir),
+                          ("db2", os.path.join(self._tmp_dir, "db2"))])
+        self.assertEqual(get_dump_db_dirs(db_dir, "other"),
+                         [("other", db_dir)])
+        self.assertEqual(get_metadata_collection_name("c1.metadata.json"),
+                         "c1")
+        self.assertEqual(get_metadata_collection_name("c1.bson"), None)
+
+        specs = read_index_specs(metadata_path)
+        self.assertEqual(len(specs), 1)
+        # key order matters
+        self.assertEqual(list(specs[0]["key"].keys()), ["b", "a"])
+        self.assertEqual(sorted(specs[0].keys()), ["key", "name", "unique"])
+        self.assertEqual(read_index_specs(metadata_path,
+                                          keep_index_version=True)[0]["v"], 2)
+
+    ###########################################################################
+    def test_build_indexes_on_worker_client(self):
+        for db_name in ["db1", "db2"]:
+            db_dir = os.path.join(self._tmp_dir, db_name)
+            os.mkdir(db_dir)
+            with open(os.path.join(db_dir, "c.metadata.json"), "w") as f:
+                f.write('{"options": {}, "indexes": ['
+                        '{"v": 2, "key": {"_id": 1}, "name": "_id_"}, '
+                        '{"v": 2, "key": {"a": 1}, "name": "a_1"}]}')
+
+        server = FakeServer()
+        build_restored_indexes(server, self._tmp_dir, max_workers=3)
+        self.assertEqual(server.pool_sizes, [3, 3])
+        self.assertEqual(sorted(server.commands),
+                         [("db1", "c", ["a_1"]), ("db2", "c", ["a_1"])])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
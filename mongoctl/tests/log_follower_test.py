@@ -0,0 +1,133 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import socket
+import shutil
+import tempfile
+
+from mongoctl.commands.server.tail_log import LogFollower, get_log_position
+from mongoctl.commands.server.start import wait_for_server_ready
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, port, online):
+        self.port = port
+        self.online = online
+        self.online_checks = 0
+
+    def get_port(self):
+        return self.port
+
+    def get_cmd_option(self, name):
+        return None
+
+    def is_online(self):
+        self.online_checks += 1
+        return self.online
+
+###############################################################################
+class LogFollowerTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.tmp_dir, "mongodb.log")
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def append(self, data, path=None):
+        with open(path or self.log_path, "a") as f:
+            f.write(data)
+
+    ###########################################################################
+    def test_follow_from_position(self):
+        self.append("old line\n")
+        follower = LogFollower(self.log_path,
+                               position=get_log_position(self.log_path))
+        self.assertEqual(follower.read_lines(), [])
+        self.append("new line\npartial")
+        self.assertEqual(follower.read_lines(), ["new line"])
+        self.append(" line\n")
+        self.assertEqual(follower.read_lines(), ["partial line"])
+        follower.close()
+
+    ###########################################################################
+    def test_missing_then_created(self):
+        self.assertEqual(get_log_position(self.log_path), None)
+        follower = LogFollower(self.log_path, position=None)
+        self.assertEqual(follower.read_lines(), [])
+        self.append("first\n")
+        self.assertEqual(follower.read_lines(), ["first"])
+        follower.close()
+
+    ###########################################################################
+    def test_rotated_and_truncated(self):
+        self.append("before start\n")
+        follower = LogFollower(self.log_path,
+                               position=get_log_position(self.log_path))
+        # mongod renames the old log and starts a new one
+        os.rename(self.log_path, self.log_path + ".old")
+        self.append("fresh\n")
+        self.assertEqual(follower.read_lines(), ["fresh"])
+
+        self.append("more\n")
+        self.assertEqual(follower.read_lines(), ["more"])
+        with open(self.log_path, "w") as f:
+            f.write("x\n")
+        self.assertEqual(follower.read_lines(), ["x"])
+        follower.close()
+
+    ###########################################################################
+    def test_ready_needs_online(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+        try:
+            self.append("[initandlisten] waiting for connections on port "
+                        "%s\n" % port)
+            # the port is open but the server does not answer commands yet
+            server = FakeServer(port, online=False)
+            follower = LogFollower(self.log_path)
+            self.assertFalse(wait_for_server_ready(server, os.getpid(),
+                                                   follower, timeout=1))
+            self.assertTrue(server.online_checks > 0)
+
+            server.online = True
+            follower = LogFollower(self.log_path)
+            self.assertTrue(wait_for_server_ready(server, os.getpid(),
+                                                  follower, timeout=5))
+        finally:
+            listener.close()
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
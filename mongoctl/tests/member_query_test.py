@@ -0,0 +1,131 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import threading
+import time
+
+from mongoctl.objects.replicaset_cluster import query_members
+from mongoctl.objects.base import DocumentWrapper
+from mongoctl import prompt
+
+###############################################################################
+class FakeLoginServer(object):
+    """
+    A server that asks for the password until logged in (logins are shared
+    by the members of a cluster)
+    """
+    def __init__(self, logins):
+        self.logins = logins
+
+    def get_db(self, dbname):
+        if not self.logins:
+            self.logins.append((prompt.read_password("password?"),
+                                threading.current_thread().name))
+        return dbname
+
+###############################################################################
+class FakeLoginMember(DocumentWrapper):
+    def __init__(self, host, server):
+        DocumentWrapper.__init__(self, {"host": host})
+        self.server = server
+
+    def get_host(self):
+        return self.get_property("host")
+
+    def get_server(self):
+        return self.server
+
+class MemberQueryTest(unittest.TestCase):
+
+    ###########################################################################
+    def test_query_members(self):
+        members = [DocumentWrapper({"host": "m%s:27017" % i, "delay": d})
+                   for i, d in enumerate([0.1, 5, 0, 0.2])]
+
+        def query(member):
+            time.sleep(member.get_property("delay"))
+            if member.get_property("host") == "m3:27017":
+                raise Exception("boom")
+            return member.get_property("host")
+
+        # partial results: slow member times out, failing member is dropped
+        start = time.time()
+        results = query_members(members, query, timeout=1)
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(sorted([r for m, r in results]),
+                         ["m0:27017", "m2:27017"])
+
+        # short circuit on first answer
+        start = time.time()
+        results = query_members(members, query,
+                                done=lambda m, r: r == "m2:27017")
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(results[-1][1], "m2:27017")
+
+        self.assertEqual(query_members([], query), [])
+
+    ###########################################################################
+    def test_raise_errors(self):
+        members = [DocumentWrapper({"host": "m%s:27017" % i, "delay": d})
+                   for i, d in enumerate([0, 0.2])]
+
+        def query(member):
+            time.sleep(member.get_property("delay"))
+            if member.get_property("host") == "m0:27017":
+                raise ValueError("boom")
+            return True
+
+        self.assertRaises(ValueError, query_members, members, query,
+                          raise_errors=True)
+        # a satisfied done() wins over failures of other members
+        results = query_members(members, query, done=lambda m, r: r,
+                                raise_errors=True)
+        self.assertEqual([m.get_property("host") for m, r in results],
+                         ["m1:27017"])
+
+    ###########################################################################
+    def test_login_resolved_on_calling_thread(self):
+        logins = []
+        server = FakeLoginServer(logins)
+        members = [FakeLoginMember("m%s:27017" % i, server) for i in range(3)]
+        saved = prompt.getpass.getpass
+        prompt.getpass.getpass = lambda: "secret"
+        try:
+            results = query_members(
+                members, lambda m: m.get_server().get_db("admin"))
+        finally:
+            prompt.getpass.getpass = saved
+
+        self.assertEqual(sorted([m.get_host() for m, r in results]),
+                         ["m0:27017", "m1:27017", "m2:27017"])
+        # prompted once, on this thread, not in the workers
+        self.assertEqual(logins,
+                         [("secret", threading.current_thread().name)])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
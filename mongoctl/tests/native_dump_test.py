@@ -0,0 +1,130 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from bson import BSON, ObjectId
+from mongoctl.native_dump import (
+    make_id_range_filters, merge_filters, dump_range, CollectionDumpWriter
+)
+
+###############################################################################
+class FakeRawDocument(object):
+    def __init__(self, doc):
+        self.raw = BSON.encode(doc)
+
+###############################################################################
+class FakeCollection(object):
+    def __init__(self, docs, fail=False):
+        self.docs = docs
+        self.fail = fail
+
+    def with_options(self, codec_options=None):
+        return self
+
+    def find(self, range_filter):
+        if self.fail:
+            raise Exception("cursor killed")
+        return [FakeRawDocument(doc) for doc in self.docs]
+
+class NativeDumpTest(unittest.TestCase):
+
+    ###########################################################################
+    def test_make_id_range_filters(self):
+        self.assertEqual(make_id_range_filters([]), [{}])
+        # mixed _id types cannot be partitioned
+        self.assertEqual(make_id_range_filters([1, "a"]), [{}])
+        self.assertEqual(make_id_range_filters([True, False]), [{}])
+
+        ids = [ObjectId() for i in range(3)]
+        filters = make_id_range_filters(ids + [ids[-1]])
+        self.assertEqual(filters, [
+            {"_id": {"$lt": ids[0]}},
+            {"_id": {"$gte": ids[0], "$lt": ids[1]}},
+            {"_id": {"$gte": ids[1], "$lt": ids[2]}},
+            {"_id": {"$gte": ids[2]}},
+            {"$nor": [{"_id": {"$type": 7}}]}
+        ])
+
+        filters = make_id_range_filters([10, 20.5])
+        self.assertEqual(len(filters), 4)
+        self.assertEqual(filters[-1]["$nor"],
+                         [{"_id": {"$type": t}} for t in [1, 16, 18, 19]])
+
+    ###########################################################################
+    def test_merge_filters(self):
+        self.assertEqual(merge_filters(None, {}), {})
+        self.assertEqual(merge_filters({"a": 1}, {}), {"a": 1})
+        self.assertEqual(merge_filters(None, {"_id": 1}), {"_id": 1})
+        self.assertEqual(merge_filters({"a": 1}, {"_id": 1}),
+                         {"$and": [{"a": 1}, {"_id": 1}]})
+
+    ###########################################################################
+    def test_writer_opens_file_lazily(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "c.bson")
+            writer = CollectionDumpWriter(path)
+            writer.add_task()
+            writer.add_task()
+            self.assertFalse(os.path.exists(path))
+
+            dump_range((FakeCollection([{"_id": 1}, {"_id": 2}]), {},
+                        writer))
+            self.assertTrue(os.path.exists(path))
+            self.assertFalse(writer._file.closed)
+
+            # the last task closes the file, even if it fails
+            self.assertRaises(Exception, dump_range,
+                              (FakeCollection([], fail=True), {}, writer))
+            self.assertTrue(writer._file.closed)
+            writer.close()
+
+            self.assertEqual(writer.document_count, 2)
+            with open(path, "rb") as f:
+                self.assertEqual(len(f.read()), writer.byte_count)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    ###########################################################################
+    def test_writer_empty_collection(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "empty.bson")
+            writer = CollectionDumpWriter(path)
+            writer.add_task()
+            dump_range((FakeCollection([]), {}, writer))
+            self.assertEqual(os.path.getsize(path), 0)
+            writer.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
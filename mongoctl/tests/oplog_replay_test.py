@@ -0,0 +1,218 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+
+import bson
+from bson.son import SON
+from bson.timestamp import Timestamp
+from pymongo import ReplaceOne, UpdateOne, DeleteOne
+
+from mongoctl.errors import MongoctlException
+from mongoctl.commands.common.oplog_slices import (
+    write_oplog_checkpoint, OPLOG_SLICES_DIR
+)
+from mongoctl.commands.common.oplog_replay import (
+    parse_timestamp, get_replay_sources, iter_oplog_entries,
+    oplog_entry_to_write, apply_crud_batch, MAX_TS_INC
+)
+
+###############################################################################
+class FakeCollection(object):
+    def __init__(self, writes):
+        self.writes = writes
+
+    def bulk_write(self, requests, ordered=True):
+        self.writes.extend(requests)
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self):
+        self.id = "fake"
+        self.pool_sizes = []
+        self.writes = {}
+
+    def get_worker_db(self, dbname, pool_size, username=None, password=None):
+        self.pool_sizes.append(pool_size)
+        server = self
+
+        class FakeDB(object):
+            def __getitem__(self, coll_name):
+                ns = "%s.%s" % (dbname, coll_name)
+                return FakeCollection(server.writes.setdefault(ns, []))
+        return FakeDB()
+
+###############################################################################
+class OplogReplayTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp("100:3"), Timestamp(100, 3))
+        self.assertEqual(parse_timestamp("100"), Timestamp(100, MAX_TS_INC))
+        self.assertRaises(MongoctlException, parse_timestamp, "abc")
+        self.assertRaises(MongoctlException, parse_timestamp, "1:2:3")
+
+    ###########################################################################
+    def test_oplog_entry_to_write(self):
+        insert = oplog_entry_to_write({"op": "i", "ns": "db.c",
+                                       "o": {"_id": 1, "a": 1}})
+        self.assertTrue(isinstance(insert, ReplaceOne))
+
+        update = oplog_entry_to_write({"op": "u", "ns": "db.c",
+                                       "o": {"$v": 1, "$set": {"a": 2}},
+                                       "o2": {"_id": 1}})
+        self.assertTrue(isinstance(update, UpdateOne))
+        self.assertEqual(update._doc, {"$set": {"a": 2}})
+
+        replace = oplog_entry_to_write({"op": "u", "ns": "db.c",
+                                        "o": {"_id": 1, "a": 3},
+                                        "o2": {"_id": 1}})
+        self.assertTrue(isinstance(replace, ReplaceOne))
+
+        delete = oplog_entry_to_write({"op": "d", "ns": "db.c",
+                                       "o": {"_id": 1}})
+        self.assertTrue(isinstance(delete, DeleteOne))
+
+        # applied with applyOps
+        self.assertEqual(oplog_entry_to_write(
+            {"op": "u", "ns": "db.c", "o": {"$v": 2, "diff": {}},
+             "o2": {"_id": 1}}), None)
+        self.assertEqual(oplog_entry_to_write(
+            {"op": "c", "ns": "db.$cmd", "o": {"drop": "c"}}), None)
+
+    ###########################################################################
+    def test_field_order_kept(self):
+        compound_id = SON([("b", 1), ("a", 2), ("zz", 3), ("c", 4)])
+        doc = SON([("_id", compound_id), ("y", 1), ("x", 2), ("w", 3)])
+        path = os.path.join(self._tmp_dir, "oplog.bson")
+        with open(path, "wb") as f:
+            for entry in [
+                {"ts": Timestamp(1, 1), "op": "d", "ns": "db.c",
+                 "o": SON([("_id", compound_id)])},
+                {"ts": Timestamp(2, 1), "op": "u", "ns": "db.c",
+                 "o": doc, "o2": SON([("_id", compound_id)])}]:
+                f.write(bson.BSON.encode(entry))
+
+        entries = list(iter_oplog_entries([path], Timestamp(3, 0)))
+        delete = oplog_entry_to_write(entries[0])
+        self.assertTrue(isinstance(delete, DeleteOne))
+        self.assertEqual(delete._filter["_id"].keys(), ["b", "a", "zz", "c"])
+
+        replace = oplog_entry_to_write(entries[1])
+        self.assertTrue(isinstance(replace, ReplaceOne))
+        self.assertEqual(replace._filter["_id"].keys(),
+                         ["b", "a", "zz", "c"])
+        self.assertEqual(replace._doc.keys(), ["_id", "y", "x", "w"])
+        self.assertEqual(replace._doc["_id"].keys(), ["b", "a", "zz", "c"])
+
+    ###########################################################################
+    def test_replay_sources(self):
+        def make_entries(start, end):
+            return [{"ts": Timestamp(t, 1), "op": "i", "ns": "db.c",
+                     "o": {"_id": t}} for t in range(start, end + 1)]
+
+        # the dump's oplog overlaps the first slice
+        with open(os.path.join(self._tmp_dir, "oplog.bson"), "wb") as f:
+            for entry in make_entries(101, 103):
+                f.write(bson.BSON.encode(entry))
+
+        os.mkdir(os.path.join(self._tmp_dir, OPLOG_SLICES_DIR))
+        slices = []
+        for start, end in [(100, 105), (105, 110)]:
+            file_name = os.path.join(OPLOG_SLICES_DIR, "%s.bson.gz" % start)
+            with gzip.open(os.path.join(self._tmp_dir, file_name), "wb") as f:
+                for entry in make_entries(start + 1, end):
+                    f.write(bson.BSON.encode(entry))
+            slices.append({"file": file_name,
+                           "startTs": Timestamp(start, 1),
+                           "endTs": Timestamp(end, 1)})
+
+        write_oplog_checkpoint(self._tmp_dir, {
+            "server": "fake",
+            "fullDumpTs": Timestamp(100, 1),
+            "ts": Timestamp(110, 1),
+            "slices": slices
+        })
+
+        until_ts = parse_timestamp("104")
+        sources = get_replay_sources(self._tmp_dir, until_ts)
+        # second slice is not needed
+        self.assertEqual(len(sources), 2)
+        self.assertEqual([e["o"]["_id"] for e in
+                          iter_oplog_entries(sources, until_ts)],
+                         [101, 102, 103, 104])
+
+        until_ts = Timestamp(107, 1)
+        sources = get_replay_sources(self._tmp_dir, until_ts)
+        self.assertEqual([e["o"]["_id"] for e in
+                          iter_oplog_entries(sources, until_ts)],
+                         range(101, 108))
+
+        # past the last slice or before the full dump
+        self.assertRaises(MongoctlException, get_replay_sources,
+                          self._tmp_dir, parse_timestamp("111"))
+        self.assertRaises(MongoctlException, get_replay_sources,
+                          self._tmp_dir, Timestamp(99, 1))
+
+        # broken chain
+        slices[1]["startTs"] = Timestamp(106, 1)
+        write_oplog_checkpoint(self._tmp_dir, {
+            "server": "fake",
+            "fullDumpTs": Timestamp(100, 1),
+            "ts": Timestamp(110, 1),
+            "slices": slices
+        })
+        self.assertRaises(MongoctlException, get_replay_sources,
+                          self._tmp_dir, Timestamp(108, 1))
+
+    ###########################################################################
+    def test_apply_crud_batch_on_worker_client(self):
+        server = FakeServer()
+        batch = [("db1.a", DeleteOne({"_id": 1})),
+                 ("db2.b", DeleteOne({"_id": 2})),
+                 ("db1.a", DeleteOne({"_id": 3}))]
+        apply_crud_batch(server, batch, workers=6)
+        self.assertEqual(server.pool_sizes, [6, 6])
+        self.assertEqual(server.writes, {
+            "db1.a": [DeleteOne({"_id": 1}), DeleteOne({"_id": 3})],
+            "db2.b": [DeleteOne({"_id": 2})]
+        })
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+
+import bson
+import pymongo
+from bson.timestamp import Timestamp
+from bson.raw_bson import RawBSONDocument
+
+from mongoctl.errors import MongoctlException
+import mongoctl.commands.common.dump as dump
+from mongoctl.commands.common.oplog_slices import (
+    record_full_dump_checkpoint, read_oplog_checkpoint, dump_oplog_slice
+)
+
+###############################################################################
+class FakeOplog(object):
+    def __init__(self, entries):
+        self.entries = entries
+
+    def with_options(self, codec_options):
+        return self
+
+    def find_one(self, query, projection=None, sort=None):
+        if self.entries:
+            if sort[0][1] == pymongo.ASCENDING:
+                return self.entries[0]
+            return self.entries[-1]
+
+    def find(self, query, oplog_replay=False):
+        ts_query = query["ts"]
+        return [RawBSONDocument(bson.BSON.encode(e)) for e in self.entries
+                if ts_query["$gt"] < e["ts"] <= ts_query["$lte"] and
+                e["op"] != "n"]
+
+###############################################################################
+class FakeServer(object):
+    id = "fake"
+
+    def __init__(self, oplog):
+        self.oplog = oplog
+
+    def get_db(self, dbname, username=None, password=None):
+        return {"oplog.rs": self.oplog}
+
+    def get_connection_host_address(self):
+        return "localhost"
+
+    def get_port(self):
+        return 27017
+
+    def get_mongo_version_info(self):
+        return None
+
+    def use_ssl_client(self):
+        return False
+
+###############################################################################
+class OplogSlicesTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def test_full_dump_checkpoint_is_opt_in(self):
+        saved = (dump.do_mongo_dump, dump.repository.validate_server)
+        dumps = []
+        dump.do_mongo_dump = lambda **kwargs: dumps.append(kwargs)
+        dump.repository.validate_server = lambda server: None
+        try:
+            server = FakeServer(FakeOplog([{"ts": Timestamp(100, 1),
+                                            "op": "n", "o": {}}]))
+            dump.mongo_dump_server(server,
+                                   dump_options={"out": self._tmp_dir})
+            self.assertEqual(len(dumps), 1)
+            self.assertEqual(read_oplog_checkpoint(self._tmp_dir), None)
+
+            dump.mongo_dump_server(server,
+                                   dump_options={"out": self._tmp_dir},
+                                   start_oplog_chain=True)
+            self.assertEqual(
+                read_oplog_checkpoint(self._tmp_dir)["fullDumpTs"],
+                Timestamp(100, 1))
+
+            # only full dumps of servers with an oplog can start a chain
+            self.assertRaises(MongoctlException, dump.mongo_dump_server,
+                              server, database="db",
+                              dump_options={"out": self._tmp_dir},
+                              start_oplog_chain=True)
+            self.assertRaises(MongoctlException, dump.mongo_dump_server,
+                              FakeServer(FakeOplog([])),
+                              dump_options={"out": self._tmp_dir},
+                              start_oplog_chain=True)
+            self.assertEqual(len(dumps), 2)
+        finally:
+            dump.do_mongo_dump, dump.repository.validate_server = saved
+
+    ###########################################################################
+    def test_dump_oplog_slice(self):
+        entries = [{"ts": Timestamp(100 + i, 1), "op": "i" if i % 3 else "n",
+                    "o": {"_id": i}} for i in range(10)]
+        server = FakeServer(FakeOplog(entries))
+
+        # no checkpoint yet
+        self.assertRaises(MongoctlException, dump_oplog_slice, server,
+                          self._tmp_dir)
+
+        record_full_dump_checkpoint(self._tmp_dir, server, Timestamp(102, 1))
+        dump_oplog_slice(server, self._tmp_dir)
+
+        checkpoint = read_oplog_checkpoint(self._tmp_dir)
+        self.assertEqual(checkpoint["ts"], Timestamp(109, 1))
+        self.assertEqual(len(checkpoint["slices"]), 1)
+        slice_info = checkpoint["slices"][0]
+        with gzip.open(os.path.join(self._tmp_dir, slice_info["file"])) as f:
+            dumped = bson.decode_all(f.read())
+        # entries after the checkpoint without no-ops
+        self.assertEqual([e["o"]["_id"] for e in dumped], [4, 5, 7, 8])
+        self.assertEqual(slice_info["count"], 4)
+
+        # nothing new
+        dump_oplog_slice(server, self._tmp_dir)
+        self.assertEqual(len(read_oplog_checkpoint(self._tmp_dir)["slices"]),
+                         1)
+
+        # oplog rolled over past the checkpoint
+        server.oplog.entries = [{"ts": Timestamp(150, 1), "op": "i",
+                                 "o": {"_id": 10}}]
+        self.assertRaises(MongoctlException, dump_oplog_slice, server,
+                          self._tmp_dir)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import mongoctl.commands.server.stop as stop
+from mongoctl.processes import ProcessExitWatcher
+from mongoctl.commands.server.stop import (
+    SHUTDOWN_PHASES, get_shutdown_phase_index, is_lock_file_released,
+    wait_for_server_exit
+)
+
+###############################################################################
+class PollingExitWatcher(ProcessExitWatcher):
+    """
+    A watcher that polls the pid like it does without a pidfd
+    """
+    def uses_pidfd(self):
+        return False
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, lock_file_path):
+        self.id = "fake"
+        self.lock_file_path = lock_file_path
+
+    def get_lock_file_path(self):
+        return self.lock_file_path
+
+###############################################################################
+class ProcessExitTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lock_file_path = os.path.join(self.tmp_dir, "mongod.lock")
+        self.server = FakeServer(self.lock_file_path)
+
+    ###########################################################################
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def write_lock_file(self, content):
+        with open(self.lock_file_path, "w") as f:
+            f.write(content)
+
+    ###########################################################################
+    def test_watcher_sees_exit(self):
+        process = subprocess.Popen(["sleep", "0.3"])
+        watcher = ProcessExitWatcher(process.pid)
+        try:
+            start_time = time.time()
+            self.assertTrue(watcher.wait(5))
+            self.assertTrue(time.time() - start_time < 3)
+        finally:
+            watcher.close()
+            process.wait()
+
+    ###########################################################################
+    def test_watcher_timeout(self):
+        process = subprocess.Popen(["sleep", "5"])
+        watcher = ProcessExitWatcher(process.pid)
+        try:
+            self.assertFalse(watcher.wait(0.2))
+            self.assertTrue(watcher.is_alive())
+        finally:
+            watcher.close()
+            process.kill()
+            process.wait()
+
+    ###########################################################################
+    def test_shutdown_phases(self):
+        lines = [
+            ("[conn1] replSetStepDown called", "stepping down"),
+            ("[signalProcessingThread] closing listening socket: 7",
+             "closing listening sockets"),
+            ("[signalProcessingThread] WiredTigerKVEngine shutting down",
+             "checkpointing data files"),
+            ("[signalProcessingThread] shutdown: final commit...",
+             "flushing journal"),
+            ("[signalProcessingThread] shutdown: removing fs lock...",
+             "removing lock file"),
+            ("[signalProcessingThread] dbexit:  rc: 0", "exiting")
+        ]
+        for line, phase in lines:
+            index = get_shutdown_phase_index(line)
+            self.assertEqual(SHUTDOWN_PHASES[index][1], phase)
+
+        self.assertEqual(get_shutdown_phase_index("[conn1] end connection"),
+                         -1)
+
+    ###########################################################################
+    def test_lock_file_released(self):
+        self.assertTrue(is_lock_file_released(self.server))
+        self.write_lock_file("1234\n")
+        self.assertFalse(is_lock_file_released(self.server))
+        self.write_lock_file("")
+        self.assertTrue(is_lock_file_released(self.server))
+
+    ###########################################################################
+    def test_wait_without_pid_uses_lock_file(self):
+        self.write_lock_file("1234\n")
+        self.assertFalse(wait_for_server_exit(self.server, None, timeout=0.6))
+        self.write_lock_file("")
+        self.assertTrue(wait_for_server_exit(self.server, None, timeout=2))
+
+    ###########################################################################
+    def test_wait_for_child_exit(self):
+        self.write_lock_file("1234\n")
+        process = subprocess.Popen(["sleep", "0.3"])
+        try:
+            self.assertTrue(wait_for_server_exit(self.server, process.pid,
+                                                 timeout=5))
+        finally:
+            process.wait()
+
+    ###########################################################################
+    def test_wait_after_lock_released(self):
+        # the lock is released but the process is still tearing down
+        self.write_lock_file("")
+        process = subprocess.Popen(["sleep", "0.8"])
+        saved = stop.ProcessExitWatcher
+        stop.ProcessExitWatcher = PollingExitWatcher
+        try:
+            self.assertTrue(wait_for_server_exit(self.server, process.pid,
+                                                 timeout=5))
+            process.poll()
+            self.assertNotEqual(process.returncode, None)
+        finally:
+            stop.ProcessExitWatcher = saved
+            if process.returncode is None:
+                process.kill()
+            process.wait()
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
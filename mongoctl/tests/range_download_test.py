@@ -0,0 +1,247 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import re
+import json
+import shutil
+import hashlib
+import time
+import tempfile
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from mongoctl.errors import MongoctlException
+from mongoctl import range_download
+from mongoctl.range_download import (
+    download_url_parallel, make_segments, get_part_path, STATE_SUFFIX,
+    open_url_stream, RangeStreamReader
+)
+
+###############################################################################
+class RangeHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the server's files (path -> content) with byte range support
+    """
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        range_header = self.headers.getheader("Range")
+        match = range_header and re.match("bytes=(\d+)-(\d+)", range_header)
+        if match and self.server.support_ranges:
+            start, end = int(match.group(1)), int(match.group(2))
+            body = content[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %s-%s/%s" %
+                             (start, end, len(content)))
+        else:
+            body = content
+            self.send_response(200)
+        if self.server.support_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.server.requests.append((self.path, range_header))
+            self.server.bytes_sent += len(body)
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+###############################################################################
+class RangeHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, files, support_ranges=True):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           RangeHTTPRequestHandler)
+        self.files = files
+        self.support_ranges = support_ranges
+        self.requests = []
+        self.bytes_sent = 0
+
+###############################################################################
+class RangeDownloadTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._content = os.urandom(1024 * 1024 + 123)
+        self._sha256 = hashlib.sha256(self._content).hexdigest()
+        self._min_segment_size = range_download.MIN_SEGMENT_SIZE
+        range_download.MIN_SEGMENT_SIZE = 64 * 1024
+        self._server = None
+
+    ###########################################################################
+    def tearDown(self):
+        range_download.MIN_SEGMENT_SIZE = self._min_segment_size
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        shutil.rmtree(self._tmp_dir)
+
+    ###########################################################################
+    def start_server(self, files, support_ranges=True):
+        self._server = RangeHTTPServer(files, support_ranges=support_ranges)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return "http://127.0.0.1:%s" % self._server.server_address[1]
+
+    ###########################################################################
+    def read_file(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    ###########################################################################
+    def test_make_segments(self):
+        self.assertEqual(make_segments(10, 3), [[0, 3], [4, 7], [8, 9]])
+        self.assertEqual(make_segments(10, 1), [[0, 9]])
+
+    ###########################################################################
+    def test_parallel_download(self):
+        base_url = self.start_server({
+            "/a.tgz": self._content,
+            "/a.tgz.sha256": "%s  a.tgz\n" % self._sha256
+        })
+        path = download_url_parallel(base_url + "/a.tgz", self._tmp_dir,
+                                     segments=4)
+        self.assertEqual(self.read_file(path), self._content)
+        self.assertEqual(len([r for r in self._server.requests
+                              if r[0] == "/a.tgz" and r[1]]), 4)
+        # parts and state are cleaned up
+        self.assertEqual(os.listdir(self._tmp_dir), ["a.tgz"])
+
+    ###########################################################################
+    def test_resume(self):
+        base_url = self.start_server({"/a.tgz": self._content})
+        url = base_url + "/a.tgz"
+        path = os.path.join(self._tmp_dir, "a.tgz")
+        segments = make_segments(len(self._content), 2)
+        # an interrupted attempt: first segment done, second one half done
+        with open(path + STATE_SUFFIX, "w") as f:
+            json.dump({"url": url, "size": len(self._content),
+                       "validator": '"v1"', "segments": segments}, f)
+        with open(get_part_path(path, 0), "wb") as f:
+            f.write(self._content[:segments[1][0]])
+        with open(get_part_path(path, 1), "wb") as f:
+            f.write(self._content[segments[1][0]:segments[1][0] + 1000])
+
+        download_url_parallel(url, self._tmp_dir, segments=2,
+                              sha256=self._sha256)
+        self.assertEqual(self.read_file(path), self._content)
+        self.assertEqual(self._server.bytes_sent,
+                         len(self._content) - segments[1][0] - 1000)
+
+    ###########################################################################
+    def test_sha256_mismatch(self):
+        base_url = self.start_server({"/a.tgz": self._content})
+        self.assertRaises(MongoctlException, download_url_parallel,
+                          base_url + "/a.tgz", self._tmp_dir,
+                          sha256="0" * 64)
+        self.assertEqual(os.listdir(self._tmp_dir), [])
+
+    ###########################################################################
+    def test_no_range_support(self):
+        base_url = self.start_server({"/a.tgz": self._content},
+                                     support_ranges=False)
+        path = download_url_parallel(base_url + "/a.tgz", self._tmp_dir,
+                                     sha256=self._sha256)
+        self.assertEqual(self.read_file(path), self._content)
+        self.assertEqual(len(self._server.requests), 1)
+
+    ###########################################################################
+    def test_stream(self):
+        base_url = self.start_server({"/a.tgz": self._content})
+        stream = open_url_stream(base_url + "/a.tgz", part_size=100 * 1024,
+                                 workers=4)
+        self.assertTrue(isinstance(stream, RangeStreamReader))
+        data = []
+        while True:
+            block = stream.read(16 * 1024)
+            if not block:
+                break
+            data.append(block)
+        stream.close()
+        self.assertEqual("".join(data), self._content)
+        self.assertEqual(len([r for r in self._server.requests if r[1]]), 11)
+
+    ###########################################################################
+    def test_stream_no_range_support(self):
+        base_url = self.start_server({"/a.tgz": self._content},
+                                     support_ranges=False)
+        stream = open_url_stream(base_url + "/a.tgz", part_size=100 * 1024)
+        self.assertFalse(isinstance(stream, RangeStreamReader))
+        self.assertEqual(stream.read(), self._content)
+        self.assertEqual(len(self._server.requests), 1)
+
+    ###########################################################################
+    def test_stream_window(self):
+        fetched = []
+
+        def fetch(start, end):
+            fetched.append(start)
+            return self._content[start:end + 1]
+
+        stream = RangeStreamReader(fetch, len(self._content), 1000, 4,
+                                   window=6)
+        time.sleep(0.2)
+        # the reader has not consumed anything yet
+        self.assertEqual(len(fetched), 6)
+        self.assertEqual(stream.read(10), self._content[:10])
+        self.assertEqual(stream.read(), self._content[10:])
+        self.assertEqual(stream.read(), "")
+
+    ###########################################################################
+    def test_stream_failed_part(self):
+        def fetch(start, end):
+            if start >= 3000:
+                raise Exception("connection reset")
+            return self._content[start:end + 1]
+
+        stream = RangeStreamReader(fetch, len(self._content), 1000, 2)
+        self.assertEqual(stream.read(3000), self._content[:3000])
+        self.assertRaises(MongoctlException, stream.read, 1)
+        stream.close()
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
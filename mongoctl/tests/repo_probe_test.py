@@ -0,0 +1,155 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import time
+
+from mongoctl.errors import MongoctlException, FileNotInRepoError
+from mongoctl import binary_repo
+from mongoctl.binary_repo import (
+    iter_binary_repositories, get_binary_cache_refs,
+    open_mongodb_binary_stream
+)
+
+###############################################################################
+class FakeRepo(object):
+    def __init__(self, name, has_file, delay, editions=None):
+        self.name = name
+        self.has_file = has_file
+        self.delay = delay
+        self.supported_editions = editions or ["community"]
+        self.probed = False
+        self.open_error = None
+
+    def file_exists(self, mongodb_version, mongodb_edition):
+        self.probed = True
+        time.sleep(self.delay)
+        if self.has_file is None:
+            raise FileNotInRepoError("nope")
+        return self.has_file
+
+    def open_file_stream(self, mongodb_version, mongodb_edition):
+        if self.open_error:
+            raise self.open_error
+        return "stream from %s" % self.name
+
+###############################################################################
+class RepoProbeTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self._registered_repos = binary_repo._registered_repos[:]
+
+    ###########################################################################
+    def tearDown(self):
+        binary_repo._registered_repos[:] = self._registered_repos
+
+    ###########################################################################
+    def find(self, repos, **kwargs):
+        for repo in iter_binary_repositories("3.4.0", "community",
+                                             repos=repos, **kwargs):
+            return repo
+
+    ###########################################################################
+    def test_preference_order(self):
+        repos = [FakeRepo("slow-miss", False, 0.3),
+                 FakeRepo("hit", True, 0.05),
+                 FakeRepo("hit-too", True, 0)]
+        start_time = time.time()
+        self.assertEqual(self.find(repos).name, "hit")
+        # probes ran concurrently
+        self.assertTrue(time.time() - start_time < 0.6)
+
+        repos[0].has_file = True
+        self.assertEqual(self.find(repos).name, "slow-miss")
+
+    ###########################################################################
+    def test_no_wait_for_later_repos(self):
+        repos = [FakeRepo("miss", None, 0),
+                 FakeRepo("hit", True, 0.05),
+                 FakeRepo("very-slow", True, 5)]
+        start_time = time.time()
+        self.assertEqual(self.find(repos).name, "hit")
+        self.assertTrue(time.time() - start_time < 2)
+
+    ###########################################################################
+    def test_unsupported_edition_and_miss(self):
+        repos = [FakeRepo("enterprise-only", True, 0,
+                          editions=["enterprise"]),
+                 FakeRepo("miss", False, 0)]
+        self.assertEqual(self.find(repos), None)
+        self.assertFalse(repos[0].probed)
+
+    ###########################################################################
+    def test_timeout(self):
+        repos = [FakeRepo("hung", True, 5),
+                 FakeRepo("hit", True, 0)]
+        # the preferred repo did not answer in time: it is still tried first
+        found = iter_binary_repositories("3.4.0", "community", repos=repos,
+                                         timeout=0.2)
+        self.assertEqual([repo.name for repo in found], ["hung", "hit"])
+
+    ###########################################################################
+    def test_timeout_keeps_answers(self):
+        repos = [FakeRepo("miss", False, 0),
+                 FakeRepo("hung", False, 5),
+                 FakeRepo("hit", True, 0)]
+        found = iter_binary_repositories("3.4.0", "community", repos=repos,
+                                         timeout=0.2)
+        self.assertEqual([repo.name for repo in found], ["hung", "hit"])
+
+    ###########################################################################
+    def test_open_stream_falls_back(self):
+        repos = [FakeRepo("gone", True, 0),
+                 FakeRepo("broken", True, 0),
+                 FakeRepo("miss", False, 0),
+                 FakeRepo("hit", True, 0.05)]
+        repos[0].open_error = FileNotInRepoError("deleted since")
+        repos[1].open_error = Exception("connection refused")
+        binary_repo._registered_repos[:] = repos
+        repo, stream = open_mongodb_binary_stream("3.4.0", "community")
+        self.assertEqual(repo.name, "hit")
+        self.assertEqual(stream, "stream from hit")
+
+        repos[3].open_error = FileNotInRepoError("deleted since")
+        self.assertRaises(MongoctlException, open_mongodb_binary_stream,
+                          "3.4.0", "community")
+
+    ###########################################################################
+    def test_binary_cache_refs(self):
+        binary_repo._registered_repos[:] = [
+            FakeRepo("default", True, 0),
+            FakeRepo("enterprise-only", True, 0, editions=["enterprise"]),
+            FakeRepo("custom", True, 0)]
+        refs = get_binary_cache_refs("3.4.0", "community")
+        # one ref per repository, in order
+        self.assertEqual([ref.split("/")[0] for ref in refs],
+                         ["default", "custom"])
+        self.assertEqual(refs[0].split("/")[1], refs[1].split("/")[1])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import datetime
+import subprocess
+import threading
+
+from mongoctl.objects.replicaset_cluster import get_max_secondary_repl_lag
+from mongoctl.commands.common.restore_throttle import ReplicationLagThrottle
+
+###############################################################################
+def make_rs_status(primary_secs, secondary_secs, states=None):
+    base = datetime.datetime(2020, 1, 1)
+    members = [{"name": "p:27017", "stateStr": "PRIMARY",
+                "optimeDate": base + datetime.timedelta(seconds=primary_secs)}]
+    for i, secs in enumerate(secondary_secs):
+        members.append({
+            "name": "s%s:27017" % i,
+            "stateStr": states[i] if states else "SECONDARY",
+            "optimeDate": base + datetime.timedelta(seconds=secs)
+        })
+    return {"members": members}
+
+###############################################################################
+class FakeCluster(object):
+    id = "fake"
+
+###############################################################################
+class FakePrimaryServer(object):
+    def __init__(self, lags):
+        self.lags = list(lags)
+        self.rs_config = {"members": [{"host": "s0:27017"},
+                                      {"host": "s1:27017",
+                                       "slaveDelay": 3600}]}
+
+    def get_rs_status(self):
+        lag = self.lags.pop(0) if len(self.lags) > 1 else self.lags[0]
+        return make_rs_status(100, [100 - lag, 0])
+
+    def get_rs_config(self):
+        return self.rs_config
+
+###############################################################################
+class RestoreThrottleTest(unittest.TestCase):
+
+    ###########################################################################
+    def test_max_secondary_repl_lag(self):
+        self.assertEqual(get_max_secondary_repl_lag(
+            make_rs_status(100, [98, 90, 95])["members"]), (10, "s1:27017"))
+        # down members and excluded members are ignored
+        self.assertEqual(get_max_secondary_repl_lag(
+            make_rs_status(100, [98, 0], states=["SECONDARY", "(not reachable"
+                                                 "/healthy)"])["members"]),
+            (2, "s0:27017"))
+        self.assertEqual(get_max_secondary_repl_lag(
+            make_rs_status(100, [98, 90])["members"],
+            excluded_addresses=["s1:27017"]), (2, "s0:27017"))
+        self.assertEqual(get_max_secondary_repl_lag(
+            make_rs_status(100, [])["members"]), (0, None))
+        self.assertEqual(get_max_secondary_repl_lag([]), (None, None))
+
+    ###########################################################################
+    def test_wait_for_lag(self):
+        # the delayed member (s1) is not watched
+        primary = FakePrimaryServer([5, 20, 12, 8, 4])
+        throttle = ReplicationLagThrottle(FakeCluster(), primary, 10,
+                                          poll_interval=0.01)
+        throttle.wait_for_lag()
+        self.assertEqual(throttle.pause_count, 0)
+        # paused at 20 and kept paused until under half the max lag
+        throttle.wait_for_lag()
+        self.assertEqual(throttle.pause_count, 1)
+        self.assertEqual(primary.lags, [4])
+
+    ###########################################################################
+    def test_watch_process(self):
+        primary = FakePrimaryServer([20, 20, 0])
+        throttle = ReplicationLagThrottle(FakeCluster(), primary, 10,
+                                          poll_interval=0.05)
+        process = subprocess.Popen(["sleep", "0.5"])
+        throttle.watch_process(process)
+        self.assertEqual(process.wait(), 0)
+        throttle.stop()
+        self.assertEqual(throttle.pause_count, 1)
+        self.assertTrue(throttle.paused_secs > 0)
+
+    ###########################################################################
+    def test_concurrent_wait_for_lag(self):
+        # one caller sees the lag and pauses, the others queue behind it
+        primary = FakePrimaryServer([20, 12, 8, 4, 0])
+        throttle = ReplicationLagThrottle(FakeCluster(), primary, 10,
+                                          poll_interval=0.05)
+        threads = [threading.Thread(target=throttle.wait_for_lag)
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(throttle.pause_count, 1)
+        self.assertEqual(primary.lags, [0])
+
+    ###########################################################################
+    def test_reused_after_stop(self):
+        primary = FakePrimaryServer([20, 0])
+        throttle = ReplicationLagThrottle(FakeCluster(), primary, 10,
+                                          poll_interval=0.05)
+        for i in range(2):
+            primary.lags = [20, 20, 0]
+            process = subprocess.Popen(["sleep", "0.5"])
+            throttle.watch_process(process)
+            self.assertEqual(process.wait(), 0)
+            throttle.stop()
+        self.assertEqual(throttle.pause_count, 2)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import mongoctl.commands.server.resync_secondary as resync_secondary
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, db_path):
+        self.id = "fake"
+        self.db_path = db_path
+
+    def get_db_path(self):
+        return self.db_path
+
+    def validate_local_op(self, op):
+        pass
+
+    def get_status(self, admin=False):
+        return {"connection": True,
+                "selfReplicaSetStatusSummary": {"stateStr": "SECONDARY"}}
+
+###############################################################################
+class MoveDbPathAsideTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "data")
+        os.makedirs(os.path.join(self.db_path, "journal"))
+        for name in ["collection-0.wt", "journal/WiredTigerLog.1"]:
+            with open(os.path.join(self.db_path, name), "w") as f:
+                f.write(name)
+        self.server = FakeServer(self.db_path + os.sep)
+        self.saved_ismount = os.path.ismount
+
+    ###########################################################################
+    def tearDown(self):
+        os.path.ismount = self.saved_ismount
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def assert_moved(self, trash_path):
+        self.assertTrue(os.path.isfile(os.path.join(trash_path,
+                                                    "collection-0.wt")))
+        self.assertTrue(os.path.isfile(os.path.join(
+            trash_path, "journal", "WiredTigerLog.1")))
+
+    ###########################################################################
+    def test_renamed(self):
+        trash_path = resync_secondary.move_db_path_aside(self.server)
+        self.assertEqual(os.path.dirname(trash_path), self.tmp_dir)
+        self.assert_moved(trash_path)
+        # a fresh dbpath is there for the server to start on
+        self.assertEqual(os.listdir(self.db_path), [])
+
+    ###########################################################################
+    def test_mount_point(self):
+        os.path.ismount = lambda path: path == self.db_path
+        trash_path = resync_secondary.move_db_path_aside(self.server)
+        # moved within the dbpath, i.e. on the same filesystem
+        self.assertEqual(os.path.dirname(trash_path), self.db_path)
+        self.assertEqual(os.listdir(self.db_path),
+                         [os.path.basename(trash_path)])
+        self.assert_moved(trash_path)
+
+    ###########################################################################
+    def test_delete_started_before_server(self):
+        calls = []
+        saved = (resync_secondary.repository.lookup_and_validate_server,
+                 resync_secondary.do_stop_server,
+                 resync_secondary.do_start_server,
+                 resync_secondary.delete_dir_in_background)
+        resync_secondary.repository.lookup_and_validate_server = \
+            lambda server_id: self.server
+        resync_secondary.do_stop_server = lambda server: calls.append("stop")
+        # a server that does not fork: start never returns
+        def start(server):
+            calls.append("start")
+            raise KeyboardInterrupt()
+        resync_secondary.do_start_server = start
+        def delete(path):
+            calls.append("delete")
+            return 1234
+        resync_secondary.delete_dir_in_background = delete
+        try:
+            self.assertRaises(KeyboardInterrupt,
+                              resync_secondary.resync_secondary, "fake")
+        finally:
+            (resync_secondary.repository.lookup_and_validate_server,
+             resync_secondary.do_stop_server,
+             resync_secondary.do_start_server,
+             resync_secondary.delete_dir_in_background) = saved
+
+        self.assertEqual(calls, ["stop", "delete", "start"])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
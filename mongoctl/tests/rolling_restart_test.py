@@ -0,0 +1,179 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import datetime
+
+import mongoctl.commands.server.start as start
+import mongoctl.commands.server.stop as stop
+from mongoctl.objects.base import DocumentWrapper
+from mongoctl.objects.replicaset_cluster import ReplicaSetCluster
+from mongoctl.errors import MongoctlException
+
+###############################################################################
+NOW = datetime.datetime(2016, 1, 1)
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, id, state, lag=0):
+        self.id = id
+        self.state = state
+        self.lag = lag
+        self.cmd_options = {"fork": False}
+        self.connection_timeout_ms = None
+
+    def apply_cmd_options_overrides(self, options_overrides):
+        self.cmd_options.update(options_overrides)
+
+    def validate_local_op(self, op):
+        pass
+
+    def has_joined_replica(self):
+        return True
+
+    def is_primary(self):
+        return self.state == "PRIMARY"
+
+    def is_secondary(self):
+        return self.state == "SECONDARY"
+
+    def get_member_rs_status(self):
+        return {"optimeDate": NOW - datetime.timedelta(seconds=self.lag)}
+
+###############################################################################
+class FakeMember(object):
+    def __init__(self, server, arbiter=False):
+        self.server = server
+        self.arbiter = arbiter
+
+    def get_server(self):
+        return self.server
+
+    def is_arbiter(self):
+        return self.arbiter
+
+###############################################################################
+class FakeReplicaSet(ReplicaSetCluster):
+    def __init__(self, members):
+        DocumentWrapper.__init__(self, {"_id": "rs"})
+        self.members = members
+        self.events = []
+
+    def get_members(self):
+        return self.members
+
+    def get_servers(self):
+        return [m.get_server() for m in self.members]
+
+    def get_primary_member(self):
+        for member in self.members:
+            if member.get_server().is_primary():
+                return member
+
+    def get_most_caught_up_secondary(self, exclude_servers=None):
+        return self.members[1]
+
+    def step_down_primary_to(self, primary_server, candidate_server):
+        self.events.append(("step_down", primary_server.id))
+        primary_server.state = "SECONDARY"
+        candidate_server.state = "PRIMARY"
+
+###############################################################################
+class RollingRestartTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.saved = (start.do_start_server, stop.do_stop_server)
+        self.restarted_states = {}
+
+        def fake_stop(server, **kwargs):
+            self.replica_set.events.append(("stop", server.id))
+            server.state = "DOWN"
+
+        def fake_start(server, **kwargs):
+            self.assertTrue(kwargs.get("skip_repl_config"))
+            self.assertTrue(server.cmd_options["fork"])
+            self.assertEqual(server.connection_timeout_ms,
+                             start.START_CONN_TIMEOUT_MS)
+            self.replica_set.events.append(("start", server.id))
+            server.state = self.restarted_states.get(server.id, "SECONDARY")
+
+        stop.do_stop_server = fake_stop
+        start.do_start_server = fake_start
+
+        self.primary = FakeServer("m0", "PRIMARY")
+        self.members = [FakeMember(self.primary),
+                        FakeMember(FakeServer("m1", "SECONDARY")),
+                        FakeMember(FakeServer("m2", "SECONDARY")),
+                        FakeMember(FakeServer("m3", "ARBITER"),
+                                   arbiter=True)]
+        self.replica_set = FakeReplicaSet(self.members)
+
+    ###########################################################################
+    def tearDown(self):
+        start.do_start_server, stop.do_stop_server = self.saved
+
+    ###########################################################################
+    def test_order(self):
+        self.replica_set.rolling_restart(member_timeout=5)
+        self.assertEqual(self.replica_set.events, [
+            ("stop", "m1"), ("start", "m1"),
+            ("stop", "m2"), ("start", "m2"),
+            ("stop", "m3"), ("start", "m3"),
+            ("step_down", "m0"),
+            ("stop", "m0"), ("start", "m0")
+        ])
+
+    ###########################################################################
+    def test_former_primary_takes_over_again(self):
+        # e.g. it has the highest priority
+        self.restarted_states["m0"] = "PRIMARY"
+        self.replica_set.rolling_restart(member_timeout=5)
+        self.assertEqual(self.replica_set.events[-1], ("start", "m0"))
+        self.assertTrue(self.primary.is_primary())
+
+    ###########################################################################
+    def test_member_not_caught_up(self):
+        self.members[2].get_server().lag = 60
+        self.assertRaises(MongoctlException,
+                          self.replica_set.rolling_restart,
+                          max_repl_lag=10, member_timeout=1)
+        # stopped at the lagging member
+        self.assertEqual(self.replica_set.events[-1], ("start", "m2"))
+        self.assertFalse(("step_down", "m0") in self.replica_set.events)
+
+    ###########################################################################
+    def test_wait_for_member_caught_up(self):
+        wait = self.replica_set.wait_for_member_caught_up
+        self.assertTrue(wait(self.members[0], 10, timeout=1))
+        self.assertTrue(wait(self.members[1], 10, timeout=1))
+        self.members[1].get_server().lag = 30
+        self.assertFalse(wait(self.members[1], 10, timeout=1))
+        self.assertTrue(wait(self.members[1], 60, timeout=1))
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,332 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from mongoctl.errors import MongoctlException
+from mongoctl.binary_repo import (
+    S3MongoDBBinaryRepository, get_multipart_etag, S3_PART_SIZE_META
+)
+
+BUCKET = "binaries"
+
+PART_SIZE = 64 * 1024
+
+###############################################################################
+class FakeS3RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    The subset of the s3 REST api (path style) that binary repos use
+    """
+
+    def parse(self):
+        url = urlparse.urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        query = urlparse.parse_qs(url.query, keep_blank_values=True)
+        return bucket, urllib.unquote(key), query
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.getheader("Content-Length",
+                                                          0)))
+
+    def reply(self, status, body="", headers=None, send_body=True):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.get_object(send_body=False)
+
+    def do_GET(self):
+        self.get_object(send_body=True)
+
+    def get_object(self, send_body):
+        bucket, key, query = self.parse()
+        if not key:
+            return self.reply(200, send_body=send_body)
+        obj = self.server.objects.get(key)
+        if obj is None:
+            return self.reply(404, send_body=send_body)
+
+        headers = dict(("x-amz-meta-%s" % name, value)
+                       for name, value in obj["metadata"].items())
+        headers["ETag"] = '"%s"' % obj["etag"]
+        range_header = self.headers.getheader("Range")
+        match = range_header and re.match("bytes=(\d+)-(\d+)", range_header)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            headers["Content-Range"] = "bytes %s-%s/%s" % (
+                start, end, len(obj["content"]))
+            if send_body:
+                self.server.range_requests.append((start, end))
+            self.reply(206, obj["content"][start:end + 1], headers,
+                       send_body)
+        else:
+            self.reply(200, obj["content"], headers, send_body)
+
+    def do_PUT(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        etag = hashlib.md5(body).hexdigest()
+        if "partNumber" in query:
+            number = int(query["partNumber"][0])
+            if number in self.server.failing_parts:
+                return self.reply(400, "<Error><Code>BadDigest</Code>"
+                                       "</Error>")
+            upload = self.server.uploads[query["uploadId"][0]]
+            upload["parts"][number] = body
+        else:
+            self.server.objects[key] = {"content": body, "etag": etag,
+                                        "metadata": self.get_metadata()}
+        self.reply(200, headers={"ETag": '"%s"' % etag})
+
+    def do_POST(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        if "uploads" in query:
+            upload_id = "upload%s" % len(self.server.uploads)
+            self.server.uploads[upload_id] = {
+                "key": key, "parts": {}, "metadata": self.get_metadata()}
+            self.reply(200, "<InitiateMultipartUploadResult><Bucket>%s"
+                            "</Bucket><Key>%s</Key><UploadId>%s</UploadId>"
+                            "</InitiateMultipartUploadResult>" %
+                            (bucket, key, upload_id))
+            return
+
+        if self.server.fail_complete:
+            return self.reply(400, "<Error><Code>InvalidPart</Code>"
+                                   "</Error>")
+        upload = self.server.uploads.pop(query["uploadId"][0])
+        numbers = [int(n) for n in re.findall("<PartNumber>(\d+)<", body)]
+        parts = [upload["parts"][n] for n in numbers]
+        etag = get_multipart_etag([hashlib.md5(p).digest() for p in parts])
+        self.server.objects[key] = {"content": "".join(parts),
+                                    "etag": etag,
+                                    "metadata": upload["metadata"]}
+        self.reply(200, "<CompleteMultipartUploadResult><Bucket>%s</Bucket>"
+                        "<Key>%s</Key><ETag>\"%s\"</ETag>"
+                        "</CompleteMultipartUploadResult>" %
+                        (bucket, key, etag))
+
+    def do_DELETE(self):
+        bucket, key, query = self.parse()
+        if "uploadId" in query:
+            self.server.uploads.pop(query["uploadId"][0], None)
+            self.server.aborted_uploads += 1
+        else:
+            self.server.objects.pop(key, None)
+        self.reply(204)
+
+    def get_metadata(self):
+        return dict((name[len("x-amz-meta-"):], value)
+                    for name, value in self.headers.items()
+                    if name.startswith("x-amz-meta-"))
+
+    def log_message(self, *args):
+        pass
+
+###############################################################################
+class FakeS3Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           FakeS3RequestHandler)
+        self.objects = {}
+        self.uploads = {}
+        self.aborted_uploads = 0
+        self.failing_parts = []
+        self.fail_complete = False
+        self.range_requests = []
+
+###############################################################################
+class S3TransferTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.server = FakeS3Server()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.repo = S3MongoDBBinaryRepository(name="s3-test")
+        self.repo.bucket_name = BUCKET
+        self.repo.access_key = "access"
+        self.repo.secret_key = "secret"
+        self.repo.host = "127.0.0.1"
+        self.repo.port = self.server.server_address[1]
+        self.repo.is_secure = False
+        self.repo.part_size = PART_SIZE
+        self.repo.transfer_workers = 4
+        self.repo.url_template = "linux/mongodb-{mongodb_version}.tgz"
+        self.repo.supported_editions = ["community"]
+
+    ###########################################################################
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def make_file(self, name, size):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    ###########################################################################
+    def download(self, key_name):
+        download_dir = os.path.join(self.tmp_dir, "download")
+        if not os.path.exists(download_dir):
+            os.mkdir(download_dir)
+        return self.repo._download_file_from_bucket(key_name, download_dir)
+
+    ###########################################################################
+    def read_stream(self):
+        stream = self.repo.open_file_stream("3.4.0", "community")
+        data = []
+        try:
+            while True:
+                block = stream.read(10000)
+                if not block:
+                    break
+                data.append(block)
+        finally:
+            stream.close()
+        return "".join(data)
+
+    ###########################################################################
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    ###########################################################################
+    def test_multipart_round_trip(self):
+        path = self.make_file("mongodb.tgz", 5 * PART_SIZE - 100)
+        self.repo._upload_file_to_bucket(path, "linux")
+
+        obj = self.server.objects["linux/mongodb.tgz"]
+        self.assertEqual(obj["content"], self.read(path))
+        self.assertTrue(obj["etag"].endswith("-5"))
+        self.assertEqual(obj["metadata"][S3_PART_SIZE_META], str(PART_SIZE))
+
+        # downloads use the part size of the upload to verify the ETag
+        self.repo.part_size = 1000
+        downloaded = self.download("linux/mongodb.tgz")
+        self.assertEqual(self.read(downloaded), self.read(path))
+        self.assertEqual(len(self.server.range_requests), 5)
+        self.assertFalse(os.path.exists(downloaded + ".tmp"))
+
+    ###########################################################################
+    def test_single_part_round_trip(self):
+        path = self.make_file("small.tgz", PART_SIZE / 2)
+        self.repo._upload_file_to_bucket(path, "linux")
+        obj = self.server.objects["linux/small.tgz"]
+        self.assertEqual(obj["etag"], hashlib.md5(obj["content"]).hexdigest())
+
+        # more than one range but a plain MD5 ETag
+        self.repo.part_size = PART_SIZE / 8
+        downloaded = self.download("linux/small.tgz")
+        self.assertEqual(self.read(downloaded), self.read(path))
+        self.assertEqual(len(self.server.range_requests), 4)
+
+    ###########################################################################
+    def test_etag_mismatch(self):
+        self.server.objects["linux/bad.tgz"] = {
+            "content": os.urandom(3 * PART_SIZE),
+            "etag": hashlib.md5("something else").hexdigest(),
+            "metadata": {}}
+        self.assertRaises(MongoctlException, self.download, "linux/bad.tgz")
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "download")),
+                         [])
+
+    ###########################################################################
+    def test_unknown_part_size(self):
+        # uploaded by another tool: no part size, so the ETag is unverifiable
+        content = os.urandom(2 * PART_SIZE)
+        self.server.objects["linux/other.tgz"] = {
+            "content": content,
+            "etag": get_multipart_etag([hashlib.md5("x").digest()] * 3),
+            "metadata": {}}
+        downloaded = self.download("linux/other.tgz")
+        self.assertEqual(self.read(downloaded), content)
+
+    ###########################################################################
+    def test_failed_part_aborts_upload(self):
+        self.server.failing_parts = [2]
+        path = self.make_file("mongodb.tgz", 3 * PART_SIZE)
+        self.assertRaises(MongoctlException,
+                          self.repo._upload_file_to_bucket, path, "linux")
+        self.assertEqual(self.server.aborted_uploads, 1)
+        self.assertEqual(self.server.objects, {})
+
+    ###########################################################################
+    def test_failed_complete_aborts_upload(self):
+        self.server.fail_complete = True
+        path = self.make_file("mongodb.tgz", 3 * PART_SIZE)
+        self.assertRaises(Exception,
+                          self.repo._upload_file_to_bucket, path, "linux")
+        self.assertEqual(self.server.aborted_uploads, 1)
+        self.assertEqual(self.server.uploads, {})
+
+    ###########################################################################
+    def test_stream(self):
+        path = self.make_file("mongodb-3.4.0.tgz", 5 * PART_SIZE - 100)
+        self.repo._upload_file_to_bucket(path, "linux")
+
+        # streams use the part size of the upload to verify the ETag
+        self.repo.part_size = 1000
+        self.assertEqual(self.read_stream(), self.read(path))
+        self.assertEqual(sorted(self.server.range_requests),
+                         [(start, min(start + PART_SIZE, 5 * PART_SIZE -
+                                      100) - 1)
+                          for start in range(0, 5 * PART_SIZE, PART_SIZE)])
+
+    ###########################################################################
+    def test_stream_etag_mismatch(self):
+        self.server.objects["linux/mongodb-3.4.0.tgz"] = {
+            "content": os.urandom(3 * PART_SIZE),
+            "etag": hashlib.md5("something else").hexdigest(),
+            "metadata": {}}
+        self.assertRaises(MongoctlException, self.read_stream)
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
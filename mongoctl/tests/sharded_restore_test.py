@@ -0,0 +1,246 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import mongoctl.commands.common.restore as restore
+import mongoctl.commands.common.dump as dump
+from mongoctl.commands.common.dump import SHARDED_DUMP_MANIFEST
+from mongoctl.objects.base import DocumentWrapper
+from mongoctl.objects.sharded_cluster import (
+    ShardedCluster, get_shard_host_addresses
+)
+from mongoctl.errors import MongoctlException
+
+###############################################################################
+class FakeShard(object):
+    def __init__(self, id, address):
+        self.id = id
+        self.address = address
+
+###############################################################################
+class FakeShardMember(object):
+    def __init__(self, shard):
+        self.shard = shard
+
+    def get_member_cluster_or_server(self):
+        return self.shard
+
+###############################################################################
+class FakeShardedCluster(ShardedCluster):
+    shards = None
+    config_servers = None
+
+    def __init__(self, shards, listed_shards):
+        DocumentWrapper.__init__(self, {"_id": "dest"})
+        self.shards = [FakeShardMember(shard) for shard in shards]
+        self.listed_shards = listed_shards
+        self.config_servers = []
+        self.events = []
+        self.balancer_enabled = True
+
+    def list_shards(self):
+        return {"shards": self.listed_shards}
+
+    def get_shard_member_address(self, shard_member):
+        return shard_member.shard.address
+
+    def get_shard_member_by_shard_id(self, shard_id):
+        for shard_member in self.shards:
+            if shard_member.shard.id == shard_id:
+                return shard_member
+
+    def is_balancer_enabled(self):
+        return self.balancer_enabled
+
+    def stop_balancer(self):
+        self.events.append("stop_balancer")
+
+    def start_balancer(self):
+        self.events.append("start_balancer")
+
+    def flush_router_configs(self):
+        self.events.append("flush_router_configs")
+
+###############################################################################
+class FakeUpdateResult(object):
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+###############################################################################
+class FakeShardsCollection(object):
+    def __init__(self, docs):
+        self.docs = dict((doc["_id"], doc) for doc in docs)
+
+    def update_one(self, spec, update):
+        doc = self.docs.get(spec["_id"])
+        if doc is None:
+            return FakeUpdateResult(0)
+        doc.update(update["$set"])
+        return FakeUpdateResult(1)
+
+###############################################################################
+class FakeConfigServer(object):
+    def __init__(self, shards_collection):
+        self.id = "config1"
+        self.shards_collection = shards_collection
+
+    def get_db(self, dbname):
+        return {"shards": self.shards_collection}
+
+###############################################################################
+class ShardedRestoreTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.restores = []
+        self.saved = restore.mongo_restore_server
+
+        def fake_restore_server(server, source, **kwargs):
+            self.restores.append((server.id, source, kwargs))
+
+        restore.mongo_restore_server = fake_restore_server
+
+    ###########################################################################
+    def tearDown(self):
+        restore.mongo_restore_server = self.saved
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def write_manifest(self, shards):
+        manifest = {
+            "cluster": "source",
+            "balancerEnabled": True,
+            "config": {"dir": "config", "oplog": False},
+            "shards": shards
+        }
+        with open(os.path.join(self.tmp_dir, SHARDED_DUMP_MANIFEST), "w") as f:
+            json.dump(manifest, f)
+
+    ###########################################################################
+    def test_shard_host_addresses(self):
+        self.assertEqual(get_shard_host_addresses("h1:27017"), ["h1:27017"])
+        self.assertEqual(get_shard_host_addresses("rs1/h1:1,h2:2"),
+                         ["h1:1", "h2:2"])
+
+    ###########################################################################
+    def test_shard_names(self):
+        cluster = FakeShardedCluster(
+            [FakeShard("rs1", "rs1/h1:1,h2:2"), FakeShard("s1", "h3:3"),
+             FakeShard("s2", "h4:4")],
+            [{"_id": "rs1", "host": "rs1/h2:2,h1:1"},
+             {"_id": "shard0000", "host": "h3:3"}])
+        self.assertEqual(cluster.get_shard_names(),
+                         {"rs1": "rs1", "s1": "shard0000"})
+
+    ###########################################################################
+    def make_cluster(self, config_shards):
+        cluster = FakeShardedCluster(
+            [FakeShard("s1", "dest1:1"), FakeShard("s2", "dest2:2")],
+            [{"_id": "shard0000", "host": "dest1:1"},
+             {"_id": "shard0001", "host": "dest2:2"}])
+        shards_collection = FakeShardsCollection(config_shards)
+        cluster.config_servers = [FakeConfigServer(shards_collection)]
+        return cluster, shards_collection
+
+    ###########################################################################
+    def test_restore_maps_by_shard_name(self):
+        self.write_manifest([
+            {"_id": "s1", "name": "shard0001", "dir": "shards/s1",
+             "oplog": True},
+            {"_id": "s2", "name": "shard0000", "dir": "shards/s2",
+             "oplog": False}])
+        cluster, shards_collection = self.make_cluster(
+            [{"_id": "shard0000", "host": "src2:2"},
+             {"_id": "shard0001", "host": "src1:1"}])
+
+        restore.mongo_restore_sharded_cluster(cluster, self.tmp_dir)
+
+        self.assertEqual(shards_collection.docs["shard0001"]["host"],
+                         "dest1:1")
+        self.assertEqual(shards_collection.docs["shard0000"]["host"],
+                         "dest2:2")
+        # the config database replaces the existing collections
+        config_restore = self.restores[0]
+        self.assertEqual(config_restore[2]["database"], "config")
+        self.assertEqual(config_restore[2]["extra_restore_options"],
+                         {"drop": True})
+        self.assertEqual(len(self.restores), 3)
+        self.assertEqual(cluster.events, ["stop_balancer",
+                                          "flush_router_configs",
+                                          "start_balancer"])
+
+    ###########################################################################
+    def test_restore_shard_not_in_config(self):
+        # dumps without shard names fall back to the shard ids
+        self.write_manifest([
+            {"_id": "s1", "dir": "shards/s1", "oplog": True}])
+        cluster, shards_collection = self.make_cluster(
+            [{"_id": "shard0000", "host": "src1:1"}])
+        self.assertRaises(MongoctlException,
+                          restore.mongo_restore_sharded_cluster,
+                          cluster, self.tmp_dir)
+        # no shard was restored
+        self.assertEqual(len(self.restores), 1)
+        # the balancer is back on
+        self.assertEqual(cluster.events, ["stop_balancer", "start_balancer"])
+
+    ###########################################################################
+    def test_restore_failure_keeps_balancer_off(self):
+        self.write_manifest([
+            {"_id": "s1", "dir": "shards/s1", "oplog": True}])
+        cluster, shards_collection = self.make_cluster(
+            [{"_id": "shard0000", "host": "src1:1"}])
+        cluster.balancer_enabled = False
+        self.assertRaises(MongoctlException,
+                          restore.mongo_restore_sharded_cluster,
+                          cluster, self.tmp_dir)
+        self.assertEqual(cluster.events, [])
+
+    ###########################################################################
+    def test_per_shard_dump_rejects_native_and_compress(self):
+        cluster, shards_collection = self.make_cluster([])
+        saved = dump.repository.validate_cluster
+        dump.repository.validate_cluster = lambda cluster: None
+        try:
+            self.assertRaises(MongoctlException, dump.mongo_dump_cluster,
+                              cluster, per_shard=True, native_workers=4)
+            self.assertRaises(MongoctlException, dump.mongo_dump_cluster,
+                              cluster, per_shard=True,
+                              stream_options={"compression": "gzip"})
+        finally:
+            dump.repository.validate_cluster = saved
+        # rejected before the balancer was touched
+        self.assertEqual(cluster.events, [])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import mongoctl.commands.cluster.start_cluster as start_cluster
+import mongoctl.commands.server.start as start
+from mongoctl.commands.server.tail_log import LogFollower
+from mongoctl.errors import MongoctlException
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, id, port=None):
+        self.id = id
+        self.port = port
+        self.cmd_options_overrides = {}
+
+    def is_use_local(self):
+        return True
+
+    def apply_cmd_options_overrides(self, overrides):
+        self.cmd_options_overrides.update(overrides)
+
+    def get_port(self):
+        return self.port
+
+    def get_cmd_option(self, name):
+        return None
+
+    def is_online(self):
+        return True
+
+###############################################################################
+class StartClusterTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.prompt_threads = []
+        self.started = {}
+        self.started_lock = threading.Lock()
+        self.saved = (start_cluster.start_server,
+                      start_cluster.prompt_execute_task,
+                      start_cluster.get_started_servers,
+                      start.stdout_log)
+
+        def fake_prompt_execute_task(message, task_function):
+            self.prompt_threads.append(threading.current_thread())
+            return (False, None)
+
+        start_cluster.prompt_execute_task = fake_prompt_execute_task
+        start_cluster.get_started_servers = lambda: dict(self.started)
+
+    ###########################################################################
+    def tearDown(self):
+        (start_cluster.start_server,
+         start_cluster.prompt_execute_task,
+         start_cluster.get_started_servers,
+         start.stdout_log) = self.saved
+        shutil.rmtree(self.tmp_dir)
+
+    ###########################################################################
+    def fake_start_server(self, failing_ids=()):
+        def start_it(server, skip_repl_config=False, parallel=False):
+            self.assertTrue(skip_repl_config)
+            self.assertTrue(parallel)
+            self.assertTrue(server.cmd_options_overrides["fork"])
+            pid = 1000 + int(server.id[1:])
+            with self.started_lock:
+                self.started[pid] = server
+            if server.id in failing_ids:
+                raise MongoctlException("cannot prepare %s" % server.id)
+            return pid
+        return start_it
+
+    ###########################################################################
+    def test_pids_in_results(self):
+        start_cluster.start_server = self.fake_start_server()
+        servers = [FakeServer("s%s" % i) for i in range(8)]
+        pids = start_cluster.start_servers(servers, max_parallel=3)
+        self.assertEqual(pids, dict(("s%s" % i, 1000 + i)
+                                    for i in range(8)))
+        self.assertEqual(self.prompt_threads, [])
+
+    ###########################################################################
+    def test_failures_prompt_on_main_thread(self):
+        start_cluster.start_server = self.fake_start_server(
+            failing_ids=("s2", "s5"))
+        servers = [FakeServer("s%s" % i) for i in range(8)]
+        self.assertRaises(MongoctlException, start_cluster.start_servers,
+                          servers, max_parallel=3)
+        # one prompt, for the failed servers only, on the main thread
+        self.assertEqual(self.prompt_threads, [threading.current_thread()])
+
+    ###########################################################################
+    def test_log_lines_prefixed(self):
+        echoed = []
+        start.stdout_log = echoed.append
+
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+        log_path = os.path.join(self.tmp_dir, "mongodb.log")
+        try:
+            with open(log_path, "w") as f:
+                f.write("[initandlisten] waiting for connections on port "
+                        "%s\n" % port)
+            follower = LogFollower(log_path)
+            self.assertTrue(start.wait_for_server_ready(
+                FakeServer("s1", port), os.getpid(), follower, timeout=5,
+                log_prefix="[s1] "))
+            follower.close()
+        finally:
+            listener.close()
+
+        self.assertEqual(echoed, ["[s1] [initandlisten] waiting for "
+                                  "connections on port %s" % port])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
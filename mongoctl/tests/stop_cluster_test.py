@@ -0,0 +1,190 @@
+# The MIT License
+
+# Copyright (c) 2012 ObjectLabs Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__author__ = 'abdul'
+
+import unittest
+import threading
+
+import mongoctl.commands.cluster.stop_cluster as stop_cluster
+from mongoctl.errors import MongoctlException, ServerStopPendingError
+
+###############################################################################
+class FakeServer(object):
+    def __init__(self, id, events, primary=False):
+        self.id = id
+        self.events = events
+        self.primary = primary
+
+    def is_use_local(self):
+        return True
+
+    def is_primary(self):
+        return self.primary
+
+###############################################################################
+class FakeMember(object):
+    def __init__(self, server):
+        self.server = server
+
+    def get_server(self):
+        return self.server
+
+###############################################################################
+class FakeReplicaSet(object):
+    def __init__(self, id, servers, primary, candidate, events, lock):
+        self.id = id
+        self.servers = servers
+        self.primary = primary
+        self.candidate = candidate
+        self.events = events
+        self.lock = lock
+
+    def get_servers(self):
+        return self.servers
+
+    def get_primary_server(self):
+        return self.primary
+
+    def get_most_caught_up_secondary(self):
+        return self.candidate and FakeMember(self.candidate)
+
+    def step_down_primary_to(self, primary_server, candidate_server):
+        with self.lock:
+            self.events.append(("step_down", primary_server.id,
+                                candidate_server.id))
+
+###############################################################################
+class StopClusterTest(unittest.TestCase):
+
+    ###########################################################################
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.saved = (stop_cluster.do_stop_server,
+                      stop_cluster.prompt_force_stop_server)
+        self.stuck_ids = []
+
+        def fake_stop(server, force=False, parallel=False):
+            with self.lock:
+                self.events.append(("stop", server.id))
+            if server.id in self.stuck_ids:
+                raise ServerStopPendingError("stuck", pid=1234)
+
+        stop_cluster.do_stop_server = fake_stop
+
+    ###########################################################################
+    def tearDown(self):
+        (stop_cluster.do_stop_server,
+         stop_cluster.prompt_force_stop_server) = self.saved
+
+    ###########################################################################
+    def make_replica_set(self, name, size, with_candidate=True):
+        servers = [FakeServer("%s_%s" % (name, i), self.events)
+                   for i in range(size)]
+        servers[0].primary = True
+        candidate = servers[1] if with_candidate else None
+        return FakeReplicaSet(name, servers, servers[0], candidate,
+                              self.events, self.lock)
+
+    ###########################################################################
+    def index_of(self, event):
+        return self.events.index(event)
+
+    ###########################################################################
+    def test_step_down_before_any_stop(self):
+        rs = self.make_replica_set("rs", 5)
+        stop_cluster.stop_replica_sets([rs], max_parallel=4)
+
+        step_down_index = self.index_of(("step_down", "rs_0", "rs_1"))
+        stops = [i for i, e in enumerate(self.events) if e[0] == "stop"]
+        self.assertEqual(len(stops), 5)
+        self.assertTrue(step_down_index < min(stops))
+
+        # the successor is stopped last, after the former primary
+        self.assertEqual(self.events[-1], ("stop", "rs_1"))
+        self.assertTrue(self.index_of(("stop", "rs_0")) <
+                        self.index_of(("stop", "rs_1")))
+
+    ###########################################################################
+    def test_no_candidate(self):
+        rs = self.make_replica_set("rs", 3, with_candidate=False)
+        stop_cluster.stop_replica_sets([rs], max_parallel=4)
+
+        self.assertFalse([e for e in self.events if e[0] != "stop"])
+        self.assertEqual(self.events[-1], ("stop", "rs_0"))
+
+    ###########################################################################
+    def test_several_sets_and_extra_servers(self):
+        rs1 = self.make_replica_set("rs1", 3)
+        rs2 = self.make_replica_set("rs2", 4)
+        extra = FakeServer("standalone", self.events)
+        handoffs, tiers = stop_cluster.get_replica_sets_stop_plan(
+            [rs1, rs2], extra_servers=[extra])
+
+        self.assertEqual([(h[1].id, h[2].id) for h in handoffs],
+                         [("rs1_0", "rs1_1"), ("rs2_0", "rs2_1")])
+        self.assertEqual(sorted([s.id for s in tiers[0]]),
+                         ["rs1_0", "rs1_2", "rs2_0", "rs2_2", "rs2_3"])
+        self.assertEqual(sorted([s.id for s in tiers[1]]),
+                         ["rs1_1", "rs2_1", "standalone"])
+
+        stop_cluster.stop_replica_sets([rs1, rs2], max_parallel=2,
+                                       extra_servers=[extra])
+        last_step_down = max(self.index_of(("step_down", "rs1_0", "rs1_1")),
+                             self.index_of(("step_down", "rs2_0", "rs2_1")))
+        first_stop = min([i for i, e in enumerate(self.events)
+                          if e[0] == "stop"])
+        self.assertTrue(last_step_down < first_stop)
+        self.assertEqual(sorted(self.events[-3:]),
+                         [("stop", "rs1_1"), ("stop", "rs2_1"),
+                          ("stop", "standalone")])
+
+    ###########################################################################
+    def test_force_stop_prompted_on_main_thread(self):
+        servers = [FakeServer("s%s" % i, self.events) for i in range(4)]
+        self.stuck_ids = ["s1", "s2"]
+        prompts = []
+
+        def prompt_force_stop(server, stop_pending_error):
+            prompts.append((server.id, stop_pending_error.pid,
+                            threading.current_thread().name))
+            if server.id == "s2":
+                raise MongoctlException("Unable to stop server 's2'.")
+
+        stop_cluster.prompt_force_stop_server = prompt_force_stop
+        try:
+            stop_cluster.stop_servers(servers, max_parallel=4)
+            self.fail("s2 should have failed to stop")
+        except MongoctlException, e:
+            self.assertTrue("s2" in str(e))
+            self.assertFalse("s1" in str(e))
+
+        main_thread = threading.current_thread().name
+        self.assertEqual(prompts, [("s1", 1234, main_thread),
+                                   ("s2", 1234, main_thread)])
+
+# booty
+if __name__ == '__main__':
+    unittest.main()
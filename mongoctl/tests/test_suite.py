@@ -25,6 +25,31 @@
 import unittest
 
 from version_functions_test import VersionFunctionsTest
+from exe_version_cache_test import ExeVersionCacheTest
+from member_query_test import MemberQueryTest
+from copy_tree_test import CopyTreeTest
+from native_dump_test import NativeDumpTest
+from dump_stream_test import DumpStreamTest
+from oplog_slices_test import OplogSlicesTest
+from oplog_replay_test import OplogReplayTest
+from fast_restore_test import FastRestoreTest
+from restore_throttle_test import RestoreThrottleTest
+from range_download_test import RangeDownloadTest
+from extract_stream_test import ExtractStreamTest
+from binary_cache_test import BinaryCacheTest
+from repo_probe_test import RepoProbeTest
+from s3_transfer_test import S3TransferTest
+from client_registry_test import ClientRegistryTest
+from config_snapshot_test import ConfigSnapshotTest
+from cluster_index_test import ClusterIndexTest
+from db_prefetch_test import DbPrefetchTest
+from log_follower_test import LogFollowerTest
+from process_exit_test import ProcessExitTest
+from start_cluster_test import StartClusterTest
+from stop_cluster_test import StopClusterTest
+from rolling_restart_test import RollingRestartTest
+from resync_dbpath_test import MoveDbPathAsideTest
+from sharded_restore_test import ShardedRestoreTest
 from basic_test import BasicMongoctlTest
 from master_slave_test import MasterSlaveTest
 from replicaset_test import ReplicasetTest
@@ -36,6 +61,31 @@ from sharded_test import ShardedTest
 ###############################################################################
 all_suites = [
     unittest.TestLoader().loadTestsFromTestCase(VersionFunctionsTest),
+    unittest.TestLoader().loadTestsFromTestCase(ExeVersionCacheTest),
+    unittest.TestLoader().loadTestsFromTestCase(MemberQueryTest),
+    unittest.TestLoader().loadTestsFromTestCase(CopyTreeTest),
+    unittest.TestLoader().loadTestsFromTestCase(NativeDumpTest),
+    unittest.TestLoader().loadTestsFromTestCase(DumpStreamTest),
+    unittest.TestLoader().loadTestsFromTestCase(OplogSlicesTest),
+    unittest.TestLoader().loadTestsFromTestCase(OplogReplayTest),
+    unittest.TestLoader().loadTestsFromTestCase(FastRestoreTest),
+    unittest.TestLoader().loadTestsFromTestCase(RestoreThrottleTest),
+    unittest.TestLoader().loadTestsFromTestCase(RangeDownloadTest),
+    unittest.TestLoader().loadTestsFromTestCase(ExtractStreamTest),
+    unittest.TestLoader().loadTestsFromTestCase(BinaryCacheTest),
+    unittest.TestLoader().loadTestsFromTestCase(RepoProbeTest),
+    unittest.TestLoader().loadTestsFromTestCase(S3TransferTest),
+    unittest.TestLoader().loadTestsFromTestCase(ClientRegistryTest),
+    unittest.TestLoader().loadTestsFromTestCase(ConfigSnapshotTest),
+    unittest.TestLoader().loadTestsFromTestCase(ClusterIndexTest),
+    unittest.TestLoader().loadTestsFromTestCase(DbPrefetchTest),
+    unittest.TestLoader().loadTestsFromTestCase(LogFollowerTest),
+    unittest.TestLoader().loadTestsFromTestCase(ProcessExitTest),
+    unittest.TestLoader().loadTestsFromTestCase(StartClusterTest),
+    unittest.TestLoader().loadTestsFromTestCase(StopClusterTest),
+    unittest.TestLoader().loadTestsFromTestCase(RollingRestartTest),
+    unittest.TestLoader().loadTestsFromTestCase(MoveDbPathAsideTest),
+    unittest.TestLoader().loadTestsFromTestCase(ShardedRestoreTest),
     unittest.TestLoader().loadTestsFromTestCase(BasicMongoctlTest),
     unittest.TestLoader().loadTestsFromTestCase(MasterSlaveTest),
     unittest.TestLoader().loadTestsFromTestCase(ReplicasetTest),
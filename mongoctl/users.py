@@ -1,6 +1,7 @@
 __author__ = 'abdul'
 
 import repository
+import mongo_utils
 
 from mongoctl_logging import log_info, log_verbose, log_warning, log_exception, log_error
 from pymongo.errors import OperationFailure, AutoReconnect
@@ -146,7 +147,8 @@ def _mongo_add_user(server, db, username, password, read_only=False,
             log_warning("_mongo_add_user: Caught a AutoReconnect error. %s " %
                         ar)
             # check if the user/pass was saved successfully
-            if db.authenticate(username, password):
+            if mongo_utils.get_login_db(db, username).authenticate(username,
+                                                                   password):
                 log_info("_mongo_add_user: user was added successfully. "
                          "no need to retry")
             else:
@@ -242,7 +244,8 @@ def setup_root_admin_user(server, admin_users):
 
     admin_user = server.get_login_user("admin") or admin_users[0]
 
-    admin_db = server.get_db("admin", no_auth=True)
+    admin_db = mongo_utils.get_login_db(server.get_db("admin", no_auth=True),
+                                        admin_user["username"])
     # try to authenticate with the admin user to see if it is already setup
     try:
         success = admin_db.authenticate(admin_user["username"], admin_user["password"])
@@ -1,6 +1,7 @@
 __author__ = 'abdul'
 
 import os
+import sys
 import subprocess
 import pwd
 import time
@@ -8,6 +9,12 @@ import socket
 import psutil
 import urlparse
 import json
+import threading
+import Queue
+import fcntl
+import shutil
+import hashlib
+import tarfile
 
 from bson import json_util
 from mongoctl_logging import *
@@ -15,6 +22,13 @@ from errors import MongoctlException
 
 
 import signal
+
+# ioctl request for reflinking a file (linux FICLONE)
+FICLONE = 0x40049409
+
+# read buffer size when files cannot be reflinked
+COPY_BUFFER_SIZE = 1024 * 1024
+
 ###############################################################################
 def namespace_get_property(namespace, name):
     if hasattr(namespace, name):
@@ -69,6 +83,43 @@ def wait_for(predicate, timeout=None, sleep_duration=2, grace=True):
 
     return not must_retry
 
+###############################################################################
+def parallel_map(func, items, max_workers=10):
+    """
+    Calls func(item) for all items using at most max_workers threads.
+    Returns a list of (item, result, exception) tuples in items order where
+    exception is whatever func(item) raised (or None)
+    """
+    items = list(items)
+    results = [None] * len(items)
+    work_queue = Queue.Queue()
+    for i, item in enumerate(items):
+        work_queue.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = work_queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[i] = (item, func(item), None)
+            except (Exception, SystemExit), ex:
+                log_exception(ex)
+                results[i] = (item, None, ex)
+
+    workers = [threading.Thread(target=worker)
+               for i in range(min(max_workers, len(items)))]
+    for t in workers:
+        t.daemon = True
+        t.start()
+    for t in workers:
+        # join with a timeout so that the main thread still gets signals
+        while t.is_alive():
+            t.join(1)
+
+    return results
+
 ###############################################################################
 def now():
     return time.time()
@@ -117,6 +168,267 @@ def list_dir_files(path):
     return [name for name in os.listdir(path) if
             os.path.isfile(os.path.join(path, name))]
 ###############################################################################
+def clone_file(src, dst):
+    """
+    Copies file src to dst. The copy is a reflink (copy-on-write clone,
+    no data is copied) when the filesystem supports it. Returns True if dst
+    was reflinked
+    """
+    with open(src, "rb") as src_file:
+        with open(dst, "wb") as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                reflinked = True
+            except IOError:
+                # not supported / cross-device: plain copy
+                shutil.copyfileobj(src_file, dst_file, COPY_BUFFER_SIZE)
+                reflinked = False
+    shutil.copymode(src, dst)
+    return reflinked
+
+###############################################################################
+def copy_tree_parallel(src_dir, dst_dir, exclude=None, max_workers=8):
+    """
+    Copies the contents of src_dir into dst_dir copying up to max_workers
+    files at a time (see clone_file()). exclude is a list of names relative
+    to src_dir to skip. Returns a (files, bytes, reflinked files) tuple
+    """
+    exclude = [os.path.normpath(e) for e in (exclude or [])]
+    files = []
+    for root, dirs, file_names in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        dirs[:] = [d for d in dirs
+                   if os.path.normpath(os.path.join(rel_root, d))
+                   not in exclude]
+        ensure_dir(os.path.join(dst_dir, rel_root))
+        for name in file_names:
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            if rel_path not in exclude:
+                files.append(rel_path)
+
+    # biggest first so that they do not end up last on a single worker
+    files.sort(key=lambda f: os.path.getsize(os.path.join(src_dir, f)),
+               reverse=True)
+
+    def copy_it(rel_path):
+        return clone_file(os.path.join(src_dir, rel_path),
+                          os.path.join(dst_dir, rel_path))
+
+    results = parallel_map(copy_it, files, max_workers=max_workers)
+    failed = [(f, ex) for f, reflinked, ex in results if ex is not None]
+    if failed:
+        raise MongoctlException("Failed to copy %s file(s) from '%s' to "
+                                "'%s'. First error: %s" %
+                                (len(failed), src_dir, dst_dir, failed[0][1]))
+
+    total_bytes = sum([os.path.getsize(os.path.join(dst_dir, f))
+                       for f in files])
+    reflinked = len([r for f, r, ex in results if r])
+    return len(files), total_bytes, reflinked
+
+###############################################################################
+def delete_tree_parallel(path, max_workers=8, progress_interval=10):
+    """
+    Deletes directory path like shutil.rmtree() but unlinks up to
+    max_workers files at a time, logging progress every progress_interval
+    seconds
+    """
+    files = []
+    dirs = []
+    for root, dir_names, file_names in os.walk(path, topdown=False):
+        files.extend([os.path.join(root, name) for name in file_names])
+        dirs.extend([os.path.join(root, name) for name in dir_names])
+
+    total = len(files)
+    log_info("Deleting %s file(s) under '%s'..." % (total, path))
+    progress = {"deleted": 0, "reported_at": time.time()}
+    progress_lock = threading.Lock()
+
+    def delete_it(file_path):
+        os.remove(file_path)
+        with progress_lock:
+            progress["deleted"] += 1
+            if time.time() - progress["reported_at"] >= progress_interval:
+                progress["reported_at"] = time.time()
+                log_info("Deleted %s/%s file(s) under '%s' (%d%%)" %
+                         (progress["deleted"], total, path,
+                          progress["deleted"] * 100 / total))
+
+    results = parallel_map(delete_it, files, max_workers=max_workers)
+    failed = [f for f, result, ex in results if ex is not None]
+
+    # dirs are listed deepest first (bottom-up walk)
+    for dir_path in dirs + [path]:
+        try:
+            os.rmdir(dir_path)
+        except OSError, e:
+            log_exception(e)
+            failed.append(dir_path)
+
+    if failed:
+        raise MongoctlException("Failed to delete %s path(s) under '%s'" %
+                                (len(failed), path))
+    log_info("Deleted '%s' (%s file(s))" % (path, total))
+
+###############################################################################
+def set_idle_io_priority():
+    """
+    Lowers the cpu and io priority of the current process so that it only
+    uses otherwise idle disk time
+    """
+    os.nice(19)
+    process = psutil.Process(os.getpid())
+    ioclass = getattr(psutil, "IOPRIO_CLASS_IDLE", None)
+    try:
+        if ioclass is None:
+            return
+        elif hasattr(process, "ionice"):
+            process.ionice(ioclass)
+        elif hasattr(process, "set_ionice"):
+            process.set_ionice(ioclass)
+    except Exception, e:
+        log_verbose("Unable to set io priority. Cause: %s" % e)
+
+###############################################################################
+def delete_dir_in_background(path):
+    """
+    Deletes path in a detached, io-niced process (see
+    run_background_delete()) that outlives this one. Progress is logged to
+    mongoctl's log file. Returns the pid of the deleter process
+    """
+    package_parent = os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package_parent, env.get("PYTHONPATH")]))
+
+    code = ("from mongoctl.utils import run_background_delete; "
+            "run_background_delete(%r)" % path)
+    dev_null = open(os.devnull, "r+")
+    process = subprocess.Popen([sys.executable, "-c", code], env=env,
+                               stdin=dev_null, stdout=dev_null,
+                               stderr=dev_null, close_fds=True,
+                               preexec_fn=os.setsid)
+    return process.pid
+
+###############################################################################
+def run_background_delete(path):
+    setup_logging(log_to_stdout=False)
+    set_idle_io_priority()
+    try:
+        delete_tree_parallel(path)
+    except Exception, e:
+        log_exception(e)
+        log_error("Background delete of '%s' failed: %s" % (path, e))
+
+###############################################################################
+# ChunkedChecksumWriter
+###############################################################################
+class ChunkedChecksumWriter(object):
+    """
+    Writes a stream into numbered chunk files (<path>.000, <path>.001, ...)
+    of at most chunk_size bytes each while computing the sha256 of every
+    chunk and of the whole stream. close() writes the checksums next to the
+    chunks: <path>.sha256 (one line per chunk, "sha256sum -c" format) and
+    <path>.stream.sha256 (whole stream)
+    """
+
+    ###########################################################################
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.byte_count = 0
+        self.chunk_checksums = []
+        self._stream_hash = hashlib.sha256()
+        self._chunk_hash = None
+        self._chunk_file = None
+        self._chunk_bytes = 0
+
+    ###########################################################################
+    def write(self, data):
+        self._stream_hash.update(data)
+        self.byte_count += len(data)
+        while data:
+            if self._chunk_file is None or self._chunk_bytes >= self.chunk_size:
+                self._next_chunk()
+            part = data[:self.chunk_size - self._chunk_bytes]
+            data = data[len(part):]
+            self._chunk_file.write(part)
+            self._chunk_hash.update(part)
+            self._chunk_bytes += len(part)
+
+    ###########################################################################
+    def _next_chunk(self):
+        self._close_chunk()
+        chunk_path = "%s.%03d" % (self.path, len(self.chunk_checksums))
+        self._chunk_file = open(chunk_path, "wb")
+        self._chunk_hash = hashlib.sha256()
+        self._chunk_bytes = 0
+        self.chunk_checksums.append((os.path.basename(chunk_path), None))
+
+    ###########################################################################
+    def _close_chunk(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+            name = self.chunk_checksums[-1][0]
+            self.chunk_checksums[-1] = (name, self._chunk_hash.hexdigest())
+            self._chunk_file = None
+
+    ###########################################################################
+    def close(self):
+        """
+        Closes the last chunk and writes the checksum files. Returns the
+        sha256 of the whole stream
+        """
+        if self._chunk_file is None and not self.chunk_checksums:
+            # empty stream: still make one (empty) chunk
+            self._next_chunk()
+        self._close_chunk()
+
+        with open("%s.sha256" % self.path, "w") as f:
+            for name, checksum in self.chunk_checksums:
+                f.write("%s  %s\n" % (checksum, name))
+
+        stream_checksum = self._stream_hash.hexdigest()
+        with open("%s.stream.sha256" % self.path, "w") as f:
+            f.write("%s  %s\n" % (stream_checksum,
+                                   os.path.basename(self.path)))
+        return stream_checksum
+
+###############################################################################
+# ChecksumReader
+###############################################################################
+class ChecksumReader(object):
+    """
+    Wraps a readable stream computing the sha256 of everything read from it
+    """
+
+    ###########################################################################
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+        self.byte_count = 0
+
+    ###########################################################################
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._hash.update(data)
+        self.byte_count += len(data)
+        return data
+
+    ###########################################################################
+    def drain(self):
+        """
+        Reads (and checksums) the rest of the stream
+        """
+        while self.read(COPY_BUFFER_SIZE):
+            pass
+
+    ###########################################################################
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+###############################################################################
 def resolve_path(path):
     # handle file uris
     path = path.replace("file://", "")
@@ -249,6 +561,18 @@ def is_host_local(host):
 
     return is_same_host(socket.gethostname(), host)
 
+###############################################################################
+def is_port_open(host, port, timeout=1):
+    """
+    Returns true if a tcp connection to host:port can be established
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout)
+        sock.close()
+        return True
+    except (socket.error, socket.timeout):
+        return False
+
 ###############################################################################
 def is_same_host(host1, host2):
 
@@ -362,6 +686,68 @@ def extract_archive(archive_name):
 
     return dir_name
 
+###############################################################################
+def extract_archive_stream(fileobj, dest_dir, strip_components=1,
+                           member_filter=None):
+    """
+    Extracts a (compressed) tar stream into dest_dir as it is read, without
+    seeking, like "tar x --strip-components". Members for which
+    member_filter(relative path, tarinfo) returns False are skipped. Fails
+    for members or links that would escape dest_dir. Returns the number of
+    extracted members.
+    """
+    ensure_dir(dest_dir)
+    count = 0
+    tar = tarfile.open(fileobj=fileobj, mode="r|*")
+    try:
+        for member in tar:
+            name = strip_archive_path(member.name, strip_components)
+            if not name:
+                continue
+            if member_filter and not member_filter(name, member):
+                log_verbose("Skipping %s" % member.name)
+                continue
+            member.name = name
+            if member.islnk():
+                member.linkname = strip_archive_path(member.linkname,
+                                                     strip_components)
+            if member.issym() or member.islnk():
+                validate_archive_link(member, dest_dir)
+            tar.extract(member, dest_dir)
+            count += 1
+    finally:
+        tar.close()
+    return count
+
+###############################################################################
+def validate_archive_link(member, dest_dir):
+    """
+    Fails if the target of link member, resolved (through links already
+    extracted) as if it was extracted into dest_dir, is outside dest_dir
+    """
+    root = os.path.realpath(dest_dir)
+    if member.issym():
+        link_dir = os.path.dirname(os.path.join(root, member.name))
+        target = os.path.join(link_dir, member.linkname)
+    else:
+        target = os.path.join(root, member.linkname or "")
+    target = os.path.realpath(target)
+    if target != root and not target.startswith(root + os.sep):
+        raise MongoctlException("Unsafe link '%s' -> '%s' in archive" %
+                                (member.name, member.linkname))
+
+###############################################################################
+def strip_archive_path(name, strip_components):
+    """
+    Returns name without its first strip_components dirs or None if nothing
+    is left. Fails for paths that would escape the extraction dir
+    """
+    parts = [p for p in name.split("/") if p and p != "."]
+    if name.startswith("/") or ".." in parts:
+        raise MongoctlException("Unsafe path '%s' in archive" % name)
+    parts = parts[strip_components:]
+    return "/".join(parts) if parts else None
+
 ###############################################################################
 def validate_openssl():
     """